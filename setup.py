@@ -53,5 +53,12 @@ setup(name='Products.%s' % NAME,
       zip_safe=False,
       install_requires=['setuptools'
                        ],
+      extras_require={'zstd': ['zstandard']},
       test_suite='Products.%s' % NAME,
+      entry_points="""
+      [console_scripts]
+      fsdump-dump = Products.%(name)s.scripts:dump_main
+      fsdump-load = Products.%(name)s.scripts:load_main
+      fsdump-benchmark = Products.%(name)s.benchmark:bench_main
+      """ % {'name': NAME},
       )
@@ -0,0 +1,96 @@
+""" Classes: Checkpoint
+
+$Id$
+"""
+
+import json
+import os
+import threading
+import time
+
+CHECKPOINT_FILENAME = '.fsdump_checkpoint'
+
+
+class Checkpoint:
+    """ Append-only record of the containers whose subtree a dump has
+        completed, keyed by physical path.
+
+    o Paths are appended as containers complete, and flushed to disk at
+      most every 'interval' seconds;  a run which is interrupted leaves
+      the file behind, and the next run skips the subtrees it names.
+
+    o 'settings' captures the dumper options which affect the output;
+      a checkpoint written with different settings is ignored.
+
+    o The file is removed once a dump finishes.
+    """
+    interval = 5.0
+
+    def __init__( self, fspath, settings=None ):
+        self.fspath = fspath
+        self.settings = settings or {}
+        self.completed = set()
+        self._file = None
+        self._flushed = 0.0
+        self._lock = threading.Lock()
+
+    def _getFilename( self ):
+        return os.path.join( self.fspath, CHECKPOINT_FILENAME )
+
+    def load( self ):
+        #   Read the paths completed by an interrupted run, if any.
+        self.completed = set()
+        try:
+            file = open( self._getFilename(), encoding='utf-8' )
+        except FileNotFoundError:
+            return
+
+        with file:
+            header = file.readline()
+            if not header or json.loads( header ) != self.settings:
+                return
+            for line in file:
+                #   A trailing partial line is left by a crash mid-write.
+                if line.endswith( '\n' ):
+                    self.completed.add( line[ :-1 ] )
+
+    def isComplete( self, path ):
+        return path in self.completed
+
+    def complete( self, path ):
+        #   Note that the subtree at 'path' has been dumped.
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write( '%s\n' % path )
+            now = time.time()
+            if now - self._flushed >= self.interval:
+                self._file.flush()
+                self._flushed = now
+
+    def _open( self ):
+        #   Append to the file of the run we resume, else start afresh.
+        if not os.path.exists( self.fspath ):
+            os.makedirs( self.fspath )
+        if self.completed:
+            self._file = open( self._getFilename(), 'a', encoding='utf-8' )
+        else:
+            self._file = open( self._getFilename(), 'w', encoding='utf-8' )
+            self._file.write( '%s\n' % json.dumps( self.settings
+                                                 , sort_keys=True ) )
+        self._flushed = time.time()
+
+    def close( self ):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def remove( self ):
+        #   Discard the checkpoint of a finished run.
+        self.close()
+        try:
+            os.unlink( self._getFilename() )
+        except FileNotFoundError:
+            pass
+        self.completed = set()
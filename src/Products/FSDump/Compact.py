@@ -0,0 +1,167 @@
+""" Classes: CompanionIndex
+
+$Id$
+"""
+
+import os
+import threading
+
+
+def _isHeader( line ):
+    return line.startswith( '[' ) and line.endswith( ']' )
+
+
+def _owns( id, name, others=() ):
+    #   Is the companion file 'name' that of the item 'id', rather than
+    #   of one of the items 'others' whose ids extend it, e.g. 'f.txt'?
+    if name != id and not name.startswith( id + '.' ):
+        return False
+    parts = name.split( '.' )
+    return not [ i for i in range( 1, len( parts ) + 1 )
+                 if '.'.join( parts[ :i ] ) in others ]
+
+
+def joinCompanions( companions ):
+    """ Return the text of a folder's companion index, holding the
+        companion files in 'companions', a mapping from the name of the
+        file each describes ('' for the folder itself) to its text.
+
+    o Files are written in order of name, separated by a blank line;
+      the section headers of each but the folder's own are prefixed with
+      its name, e.g. '[index_html.dtml:default]'.
+    """
+    blocks = []
+    for name in sorted( companions ):
+        lines = companions[ name ].rstrip( '\n' ).splitlines()
+        if name:
+            lines = [ _isHeader( line ) and '[%s:%s]' % ( name, line[ 1:-1 ] )
+                      or line for line in lines ]
+        blocks.append( ''.join( [ '%s\n' % line for line in lines ] ) )
+    return '\n'.join( blocks )
+
+
+def splitCompanions( text ):
+    """ Return the companion files held in the text of a companion index,
+        as a mapping from name to text;  see 'joinCompanions'.
+    """
+    companions = {}
+    lines = companions[ '' ] = []
+    for line in text.splitlines():
+        if _isHeader( line ):
+            name, sep, section = line[ 1:-1 ].rpartition( ':' )
+            lines = companions.setdefault( name, [] )
+            if sep:
+                line = '[%s]' % section
+        lines.append( '%s\n' % line )
+    return dict( [ ( name, '%s\n' % ''.join( lines ).rstrip( '\n' ) )
+                   for name, lines in companions.items() if lines ] )
+
+
+class CompanionFile:
+    """ Companion file held in memory, and handed to its index when closed.
+    """
+    def __init__( self, index, dirpath, name ):
+        self.index = index
+        self.dirpath = dirpath
+        self.name = name
+        self.text = None
+        self._chunks = []
+
+    def write( self, text ):
+        self._chunks.append( text )
+
+    def close( self ):
+        if self.text is None:
+            self.text = ''.join( self._chunks )
+            self._chunks = None
+            self.index.add( self.dirpath, self.name, self.text )
+
+
+class CompanionIndex:
+    """ Collect the companion files of a dump in the compact layout, to be
+        written as one index per directory, named 'filename' (the name of
+        a folder's own companion file, which it also holds).
+
+    o Companion files are held by directory until the index of the
+      directory is written (see 'flush'):  once its folder is dumped,
+      or when the run finishes.
+
+    o A partial run, which dumps some of the items of a directory only,
+      carries the other files from the index on disk;  so do the items
+      protected by a complete run, whose last good dump is kept.  Files
+      of items removed from a folder are discarded.
+
+    o The index may be shared by the workers of a run.
+    """
+    def __init__( self, filename ):
+        self.filename = filename
+        self._pending = {}
+        self._protected = {}
+        self._discarded = {}
+        self._lock = threading.Lock()
+
+    def open( self, dirpath, name ):
+        """ Return a file to write the companion file of 'name' in
+            'dirpath' into.
+        """
+        return CompanionFile( self, dirpath, name )
+
+    def add( self, dirpath, name, text ):
+        """ Add the companion file of 'name' in 'dirpath'.
+        """
+        with self._lock:
+            self._pending.setdefault( dirpath, {} )[ name ] = text
+
+    def protect( self, dirpath, id ):
+        """ Keep the companion files of the item 'id' in 'dirpath' as
+            found on disk, unless written again;  forget the files
+            collected below the item, which failed.
+        """
+        with self._lock:
+            self._protected.setdefault( dirpath, [] ).append( id )
+            self._pending.pop( os.path.join( dirpath, id ), None )
+
+    def discard( self, dirpath, id, others=() ):
+        """ Drop the companion files of the item 'id' in 'dirpath', but
+            not those of the items 'others'.
+        """
+        with self._lock:
+            self._discarded.setdefault( dirpath, [] ).append( ( id, others ) )
+
+    def getPending( self ):
+        #   Return the directories whose index is still to be written.
+        with self._lock:
+            return sorted( set( self._pending ).union( self._protected
+                                                     , self._discarded ) )
+
+    def flush( self, dirpath, carry=False ):
+        """ Return the text of the index of 'dirpath', or None if it holds
+            nothing, and forget its companion files;  if 'carry', keep
+            those on disk which weren't written again.
+        """
+        with self._lock:
+            companions = self._pending.pop( dirpath, {} )
+            protected = self._protected.pop( dirpath, () )
+            discarded = self._discarded.pop( dirpath, () )
+        if carry or protected:
+            for name, text in self._read( dirpath ).items():
+                if name in companions:
+                    continue
+                if [ id for id, others in discarded
+                     if _owns( id, name, others ) ]:
+                    continue
+                if carry or [ id for id in protected if _owns( id, name ) ]:
+                    companions[ name ] = text
+        if not companions:
+            return None
+        return joinCompanions( companions )
+
+    def _read( self, dirpath ):
+        #   Return the companion files in the index on disk.
+        try:
+            file = open( os.path.join( dirpath, self.filename )
+                       , encoding='utf-8' )
+        except FileNotFoundError:
+            return {}
+        with file:
+            return splitCompanions( file.read() )
@@ -3,14 +3,62 @@
 $Id$
 """
 
+import json
+import logging
 import os
-
+import shutil
+import sys
+import tempfile
+import time
+from itertools import islice
+from binascii import hexlify
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from urllib.parse import quote_plus
+
+from AccessControl import Unauthorized
+from Acquisition import aq_base
 from AccessControl.class_init import InitializeClass
 from AccessControl.SecurityInfo import ClassSecurityInfo
 from App.Common import package_home
 from OFS.SimpleItem import SimpleItem
 from Products.PageTemplates.PageTemplateFile import PageTemplateFile
+from ZODB.interfaces import BlobError
+from ZODB.interfaces import IBlob
 from ZODB.POSException import ConflictError
+from ZODB.utils import p64
+from ZODB.utils import u64
+from zExceptions import NotFound
+
+from Products.FSDump.Checkpoint import CHECKPOINT_FILENAME
+from Products.FSDump.Checkpoint import Checkpoint
+from Products.FSDump.Compact import CompanionIndex
+from Products.FSDump.Index import INDEX_FILENAME
+from Products.FSDump.Index import DumpIndex
+from Products.FSDump.Job import getJob
+from Products.FSDump.Job import startJob
+from Products.FSDump.Manifest import MANIFEST_FILENAME
+from Products.FSDump.Manifest import Manifest
+from Products.FSDump.Output import ARCHIVE_FORMATS
+from Products.FSDump.Output import ArchiveFileIterator
+from Products.FSDump.Output import ArchiveOutput
+from Products.FSDump.Output import DiffOutput
+from Products.FSDump.Output import FilesystemOutput
+from Products.FSDump.Output import GitOutput
+from Products.FSDump.Registry import HandlerMapping
+from Products.FSDump.Registry import getHandledMetaTypes
+from Products.FSDump.Registry import lookupHandler
+from Products.FSDump.Registry import registerHandler
+from Products.FSDump.Scope import DumpScope
+from Products.FSDump.Security import SecurityExporter
+from Products.FSDump.Stats import DumpStats
+from Products.FSDump.Stats import getStatistics
+from Products.FSDump.Stats import keepStatistics
+from Products.FSDump.Store import STORE_DIRNAME
+from Products.FSDump.Store import ContentStore
+from Products.FSDump.Watcher import getWatcher
+from Products.FSDump.Watcher import startWatcher
+from Products.FSDump.Watcher import stopWatcher
 
 _wwwdir = os.path.join( package_home( globals() ), 'www' )
 
@@ -18,13 +66,41 @@ manage_addFSDumpForm = PageTemplateFile('www/addDumper', globals() )
 
 USE_DUMPER_PERMISSION = 'Use Dumper'
 
-
-def manage_addFSDump(self, id, fspath=None, use_metadata_file=0, REQUEST=None):
+LOG = logging.getLogger('Products.FSDump')
+
+if hasattr( os, 'sysconf' ):
+    _PAGE_SIZE = os.sysconf( 'SC_PAGE_SIZE' )
+else:
+    _PAGE_SIZE = None
+
+
+def _currentRSS():
+    #   Return the resident set size of this process in MB, or None if
+    #   it can't be read (no /proc).
+    if _PAGE_SIZE is None:
+        return None
+    try:
+        with open( '/proc/self/statm' ) as file:
+            pages = int( file.read().split()[ 1 ] )
+    except ( OSError, ValueError, IndexError ):
+        return None
+    return pages * _PAGE_SIZE / 1048576.0
+
+
+def manage_addFSDump(self, id, fspath=None, use_metadata_file=0,
+                     incremental=0, parallelism=1, prune=0, stats_log='',
+                     catalog_records=1, include_paths=(), exclude_paths=(),
+                     include_meta_types=(), exclude_meta_types=(),
+                     gc_interval=1000, rss_limit=0, write_index=0,
+                     content_store=0, compact_layout=0, REQUEST=None):
     """Add a Dumper object to the system
     """
     dumper = Dumper()
     dumper.id = id
-    dumper.edit(fspath, use_metadata_file)
+    dumper.edit(fspath, use_metadata_file, incremental, parallelism, prune,
+                stats_log, catalog_records, include_paths, exclude_paths,
+                include_meta_types, exclude_meta_types, gc_interval,
+                rss_limit, write_index, content_store, compact_layout)
     self._setObject(id, dumper)
 
     if REQUEST is not None:
@@ -40,6 +116,9 @@ class Dumper(SimpleItem):
                        , 'action'   : 'editForm'
                        , 'help'     : ('FSDump' ,'Dumper_editForm.stx')
                        }
+                     , { 'label'    : 'Statistics'
+                       , 'action'   : 'statsForm'
+                       }
                      , { 'label'    : 'Security'
                        , 'action'   : 'manage_access'
                        , 'help'     : ('OFSP','Security_Define-Permissions.stx')
@@ -50,6 +129,75 @@ class Dumper(SimpleItem):
     
     fspath = None
     use_metadata_file = 0
+    incremental = 0
+    parallelism = 1
+    prune = 0
+    stats_log = ''
+    catalog_records = 1
+    include_paths = ()
+    exclude_paths = ()
+    include_meta_types = ()
+    exclude_meta_types = ()
+    gc_interval = 1000
+    rss_limit = 0
+    write_index = 0
+    content_store = 0
+    compact_layout = 0
+
+    #   Attributes copied onto the transient dumpers used by workers.
+    _config_attrs = ( 'fspath'
+                    , 'use_metadata_file'
+                    , 'incremental'
+                    , 'parallelism'
+                    , 'prune'
+                    , 'stats_log'
+                    , 'catalog_records'
+                    , 'include_paths'
+                    , 'exclude_paths'
+                    , 'include_meta_types'
+                    , 'exclude_meta_types'
+                    , 'gc_interval'
+                    , 'rss_limit'
+                    , 'write_index'
+                    , 'content_store'
+                    , 'compact_layout'
+                    )
+
+    #   Deprecated:  handlers by meta_type, forwarding to the registry.
+    _handlers = HandlerMapping()
+
+    #   Number of items loaded from the ZODB at a time.
+    _batch_size = 100
+
+    #   Number of catalog paths written at a time.
+    _catalog_batch_size = 10000
+
+    #   Number of objects dumped between checks of the process' RSS,
+    #   when 'rss_limit' is set.
+    _rss_check_interval = 100
+
+    #   Number of threads writing files, and of closed files queued for
+    #   them, during a full dump.
+    _writer_threads = 4
+    _write_queue_size = 64
+
+    _v_manifest = None
+    _v_files = None
+    _v_protected = None
+    _v_stats = None
+    _v_frames = None
+    _v_output = None
+    _v_progress = None
+    _v_checkpoint = None
+    _v_oids = None
+    _v_shallow = None
+    _v_scope = None
+    _v_visited = 0
+    _v_index = None
+    _v_store = None
+    _v_security = None
+    _v_companions = None
+    _v_workers = 1
 
     #
     #   Management interface methods.
@@ -59,14 +207,38 @@ class Dumper(SimpleItem):
     security.declareProtected(USE_DUMPER_PERMISSION, 'editForm')
     editForm = PageTemplateFile('www/editDumper', globals())
 
+    security.declareProtected(USE_DUMPER_PERMISSION, 'statsForm')
+    statsForm = PageTemplateFile('www/dumpStats', globals())
+
 
     @security.protected(USE_DUMPER_PERMISSION)
-    def edit(self, fspath, use_metadata_file, REQUEST=None):
+    def edit(self, fspath, use_metadata_file, incremental=0, parallelism=1,
+             prune=0, stats_log='', catalog_records=1, include_paths=(),
+             exclude_paths=(), include_meta_types=(), exclude_meta_types=(),
+             gc_interval=1000, rss_limit=0, write_index=0, content_store=0,
+             compact_layout=0, REQUEST=None):
         """
             Update the path to which we will dump our peers.
         """
         self._setFSPath(fspath)
         self.use_metadata_file = use_metadata_file
+        self.incremental = incremental
+        self.parallelism = max(int(parallelism or 1), 1)
+        self.prune = prune
+        stats_log = (stats_log or '').strip()
+        if stats_log and not os.path.isabs(stats_log):
+            raise ValueError('Dumper Error: log path must be absolute.')
+        self.stats_log = stats_log
+        self.catalog_records = catalog_records
+        self.include_paths = self._cleanLines(include_paths)
+        self.exclude_paths = self._cleanLines(exclude_paths)
+        self.include_meta_types = self._cleanLines(include_meta_types)
+        self.exclude_meta_types = self._cleanLines(exclude_meta_types)
+        self.gc_interval = max(int(gc_interval or 1000), 1)
+        self.rss_limit = max(int(rss_limit or 0), 0)
+        self.write_index = write_index
+        self.content_store = content_store
+        self.compact_layout = compact_layout
 
         if REQUEST is not None:
             REQUEST['RESPONSE'].redirect(
@@ -85,35 +257,539 @@ class Dumper(SimpleItem):
         if REQUEST and 'fspath' in REQUEST.form:
             self._setFSPath(REQUEST.form['fspath'])
 
-        parent = self.aq_parent.aq_base
-        if getattr(parent, 'isTopLevelPrincipiaApplicationObject', 0):
-            self._dumpRoot(self.aq_parent)
-        else:
-            self._dumpFolder(self.aq_parent)
+        message = self._runClone()
 
         if REQUEST is not None:
             REQUEST['RESPONSE'].redirect(
                   self.absolute_url()
                 + '/editForm'
-                + '?manage_tabs_message=Peers+dumped.'
+                + '?manage_tabs_message=%s' % quote_plus(message)
                                         )
+        return message
  
+    @security.protected(USE_DUMPER_PERMISSION)
+    def dumpToArchive(self, format='tar.gz', archive_path=None, REQUEST=None):
+        """
+            Dump our peers into a tar or zip archive, written to
+            'archive_path' or, if not given, returned as the response:
+            the archive is spooled to a temporary file, then sent in
+            chunks, as the publisher would buffer anything written to
+            the response.
+        """
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError('Dumper Error: unknown archive format.')
+        if archive_path:
+            with open(archive_path, 'wb') as stream:
+                return self._dumpToStream(stream, format)
+        if REQUEST is None:
+            raise ValueError('Dumper Error: archive path not set.')
+
+        fd, tempname = tempfile.mkstemp(prefix='.fsdump-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                self._dumpToStream(stream, format)
+            archive = ArchiveFileIterator(tempname)
+        except:
+            os.unlink(tempname)
+            raise
+
+        response = REQUEST['RESPONSE']
+        response.setHeader('Content-Type', ARCHIVE_FORMATS[format][1])
+        response.setHeader('Content-Disposition',
+                           'attachment; filename="%s.%s"'
+                           % (self.aq_parent.getId() or 'root', format))
+        response.setHeader('Content-Length', str(len(archive)))
+        return archive
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def dumpToGit(self, repository=None, branch='fsdump', message=None,
+                  REQUEST=None):
+        """
+            Dump our peers as a commit on 'branch' of the git
+            repository at 'repository', without writing a tree on disk.
+        """
+        if not repository:
+            raise ValueError('Dumper Error: git repository not set.')
+
+        message = self._dumpToGit(repository, branch or 'fsdump', message)
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect(
+                  self.absolute_url()
+                + '/editForm'
+                + '?manage_tabs_message=%s' % quote_plus(message)
+                                        )
+        return message
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def diffFS(self, REQUEST=None):
+        """
+            Compare our peers with the tree in 'fspath', without
+            writing anything;  return the added, changed and removed
+            paths, as JSON if called through the web.
+        """
+        output = DiffOutput(self._buildPathString())
+        self._runClone(output=output, keep_stats=False)
+        report = output.report()
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].setHeader('Content-Type', 'application/json')
+            REQUEST['RESPONSE'].setHeader('Cache-Control', 'no-cache')
+            return json.dumps(report, sort_keys=True)
+        return report
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def startDumpJob(self, REQUEST=None):
+        """
+            Start dumping our peers in a background thread, resuming
+            from the checkpoint of an interrupted job, if any.
+        """
+        if REQUEST and 'fspath' in REQUEST.form:
+            self._setFSPath(REQUEST.form['fspath'])
+        if self._p_jar is None:
+            raise ValueError('Dumper Error: dumper is not stored.')
+
+        job = getJob(self._getJobKey())
+        if job is not None and job.is_alive():
+            message = 'Dump job already running.'
+        else:
+            #   Start once this transaction commits, so that the job's
+            #   connection sees our settings.
+            self._p_jar.transaction_manager.get().addAfterCommitHook(
+                self._startJob)
+            message = 'Dump job started.'
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect(
+                  self.absolute_url()
+                + '/editForm'
+                + '?manage_tabs_message=%s' % quote_plus(message)
+                                        )
+        return message
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def getDumpJobStatus(self, REQUEST=None):
+        """
+            Return the state and progress of the last background job,
+            as JSON if called through the web.
+        """
+        job = getJob(self._getJobKey())
+        if job is None:
+            status = {'state': 'none'}
+        else:
+            status = job.status()
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].setHeader('Content-Type', 'application/json')
+            REQUEST['RESPONSE'].setHeader('Cache-Control', 'no-cache')
+            return json.dumps(status, sort_keys=True)
+        return status
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def startWatching(self, REQUEST=None):
+        """
+            Start keeping the dump of our peers up to date, dumping
+            again the objects changed by each committed transaction.
+        """
+        if REQUEST and 'fspath' in REQUEST.form:
+            self._setFSPath(REQUEST.form['fspath'])
+        if self._p_jar is None:
+            raise ValueError('Dumper Error: dumper is not stored.')
+
+        watcher = getWatcher(self._getJobKey())
+        if watcher is not None and watcher.is_alive():
+            message = 'Already watching.'
+        else:
+            #   Start once this transaction commits, so that the
+            #   watcher's connection sees our settings.
+            self._p_jar.transaction_manager.get().addAfterCommitHook(
+                self._startWatcher)
+            message = 'Watching started.'
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect(
+                  self.absolute_url()
+                + '/editForm'
+                + '?manage_tabs_message=%s' % quote_plus(message)
+                                        )
+        return message
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def stopWatching(self, REQUEST=None):
+        """
+            Stop keeping the dump of our peers up to date.
+        """
+        if self._p_jar is None or stopWatcher(self._getJobKey()) is None:
+            message = 'Not watching.'
+        else:
+            message = 'Watching stopped.'
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].redirect(
+                  self.absolute_url()
+                + '/editForm'
+                + '?manage_tabs_message=%s' % quote_plus(message)
+                                        )
+        return message
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def getWatchStatus(self, REQUEST=None):
+        """
+            Return the state of the watcher keeping our dump up to
+            date, as JSON if called through the web.
+        """
+        watcher = None
+        if self._p_jar is not None:
+            watcher = getWatcher(self._getJobKey())
+        if watcher is None:
+            status = {'state': 'none'}
+        else:
+            status = watcher.status()
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].setHeader('Content-Type', 'application/json')
+            REQUEST['RESPONSE'].setHeader('Cache-Control', 'no-cache')
+            return json.dumps(status, sort_keys=True)
+        return status
+
+    @security.protected(USE_DUMPER_PERMISSION)
+    def getDumpStatistics(self):
+        """
+            Return the measurements of the last dump made by this
+            process, or None.
+        """
+        return getStatistics(self._getStatsKey())
+
     #
     #   Utility methods
     #
+    @security.private
+    def _runClone( self, progress=None, checkpoint=None, output=None
+                 , keep_stats=True, oids=None, paths=None, items=None ):
+        #   Dump our peers (or, if given, only the objects at paths, or
+        #   the items in items) on a transient copy, whose per-run state
+        #   must survive the cache garbage collection done during
+        #   traversal;  keep its statistics, unless told not to, and
+        #   return a summary.
+        dumper = self._clone().__of__( self.aq_parent )
+        dumper._v_progress = progress
+        dumper._v_checkpoint = checkpoint
+        dumper._v_oids = oids
+        if isinstance( output, ArchiveOutput ):
+            #   Archives are written whole:  nothing to skip or prune.
+            dumper.fspath = output.root
+            dumper.incremental = dumper.prune = 0
+        elif isinstance( output, DiffOutput ):
+            #   The pruning pass finds the removed files;  a diff writes
+            #   nothing, not even statistics.
+            dumper.prune = 1
+            dumper.stats_log = ''
+        elif isinstance( output, GitOutput ):
+            #   The commit drops the files of the head this run doesn't
+            #   produce:  nothing to prune on disk.
+            dumper.fspath = output.root
+            dumper.prune = 0
+        try:
+            if paths is not None:
+                return 'Changes dumped: %s.' % dumper._dumpChanges( paths )
+            if items is not None:
+                return 'Items dumped: %s.' % dumper._dumpItems( items )
+            return 'Peers dumped: %s.' % dumper._dumpPeers( output )
+        finally:
+            if dumper._v_output is not None:
+                #   The dump failed:  stop the writers, which have
+                #   logged their own errors.
+                dumper._v_output.flush( raise_errors=False )
+            if checkpoint is not None:
+                checkpoint.close()
+            if dumper._v_index is not None:
+                dumper._v_index.close()
+            if dumper._v_stats is not None:
+                dumper._v_stats.close()
+                if keep_stats:
+                    keepStatistics( self._getStatsKey()
+                                  , dumper._v_stats.snapshot() )
+
+    @security.private
+    def _dumpToStream( self, stream, format ):
+        #   Dump our peers into an archive written sequentially to
+        #   stream;  return a summary.
+        output = ArchiveOutput( stream, format, self.fspath or os.sep )
+        try:
+            return self._runClone( output=output )
+        finally:
+            output.close()
+
+    @security.private
+    def _dumpToGit( self, repository, branch, message=None ):
+        #   Dump our peers as a commit on branch of the git repository;
+        #   return a summary.
+        output = GitOutput( repository, branch, self.fspath or os.sep )
+        try:
+            summary = self._runClone( output=output )
+            if message is None:
+                message = 'Dump of %s\n\n%s' % (
+                    '/'.join( self.aq_parent.getPhysicalPath() ) or '/'
+                  , summary )
+            commit_id = output.commit( message, keep_state=self.incremental )
+        finally:
+            output.close()
+        return '%s  Commit %s on %s.' % ( summary, commit_id[ :12 ]
+                                        , output.ref )
+
+    @security.private
+    def _getJobKey( self ):
+        #   Background jobs are registered per database and dumper path.
+        return ( self._p_jar.db().database_name, self.getPhysicalPath() )
+
+    @security.private
+    def _getStatsKey( self ):
+        #   Statistics are kept like jobs;  those of a dumper which isn't
+        #   stored (e.g. the console script's) by path only.
+        if self._p_jar is None:
+            return ( None, self.getPhysicalPath() )
+        return self._getJobKey()
+
+    @security.private
+    def _startJob( self, status ):
+        #   After-commit hook of 'startDumpJob'.
+        if status:
+            startJob( self._getJobKey()
+                    , self._p_jar.db()
+                    , aq_base( self.getPhysicalRoot() )._p_oid
+                    , self.getPhysicalPath()
+                    )
+
+    @security.private
+    def _runJob( self, progress ):
+        #   Dump our peers on behalf of a background job, skipping the
+        #   subtrees completed by an interrupted job;  return a summary.
+        checkpoint = Checkpoint( self._buildPathString()
+                               , self._getSettings() )
+        checkpoint.load()
+        progress.resumed = len( checkpoint.completed )
+        return self._runClone( progress, checkpoint )
+
+    @security.private
+    def _startWatcher( self, status ):
+        #   After-commit hook of 'startWatching'.
+        if status:
+            startWatcher( self._getJobKey()
+                        , self._p_jar.db()
+                        , aq_base( self.getPhysicalRoot() )._p_oid
+                        , self.getPhysicalPath()
+                        )
+
+    @security.private
+    def _runWatch( self, oids, paths=None ):
+        #   Dump our peers, or only the objects at the physical paths in
+        #   paths, on behalf of a watcher;  oids maps the oid of each
+        #   object dumped to its path, and is kept up to date.  Return
+        #   a summary.
+        return self._runClone( keep_stats=False, oids=oids, paths=paths )
+
+    @security.private
+    def _getSettings( self ):
+        #   Return the options which affect the output, as recorded in
+        #   manifests and checkpoints.
+        settings = { 'format' : 2
+                   , 'use_metadata_file' : bool( self.use_metadata_file )
+                   }
+        if self.compact_layout:
+            settings[ 'compact_layout' ] = True
+        return settings
+
+    @security.private
+    def _dumpPeers( self, output=None ):
+        #   Dump our parent and its items;  return a summary.
+        self._beginDump( output )
+        self._noteOid( self.aq_parent )
+        parent = aq_base( self.aq_parent )
+        if getattr( parent, 'isTopLevelPrincipiaApplicationObject', 0 ):
+            self._dumpRoot( self.aq_parent )
+            root = None
+        else:
+            self._dumpParentFolder( self.aq_parent )
+            root = self.aq_parent.getId()
+        self._writeCompanionIndexes()
+        if self.prune:
+            self._v_output.flush()
+            self._pruneFiles( root )
+            if self._v_store is not None:
+                self._v_store.collect()
+        elif isinstance( self._v_output, GitOutput ):
+            self._v_output.removeStale( self._v_protected )
+        return self._finishDump()
+
+    @security.private
+    def _dumpParentFolder( self, obj ):
+        #   Dump our parent, obj, as a folder, measuring it (and indexing
+        #   its files) like its items.
+        frame = self._pushFrame()
+        self._dumpFolder( obj )
+        self._popFrame( frame, obj )
+
+    @security.private
+    def _dumpChanges( self, paths ):
+        #   Dump the objects at the physical paths in paths, which are
+        #   among our peers;  containers only get their own files and
+        #   listing rewritten, dumping the items added to them and
+        #   removing the files of those removed.  Return a summary.
+        self._beginDump()
+        self._v_workers = 1
+        if self._v_manifest is not None:
+            self._v_manifest.update()
+        root = self.getPhysicalRoot()
+        base = self.aq_parent.getPhysicalPath()
+        todo = sorted( paths, reverse=True )
+        seen = set()
+        while todo:
+            path = todo.pop()
+            if ( path in seen or path[ :len( base ) ] != base
+              or not self._isInScope( path ) ):
+                continue
+            seen.add( path )
+            obj = root.unrestrictedTraverse( path, None )
+            if obj is None or obj.getPhysicalPath() != path:
+                #   Gone:  its container's listing tells what to remove.
+                if len( path ) > len( base ):
+                    todo.append( path[ :-1 ] )
+                continue
+            self._v_shallow = path
+            try:
+                if path != base:
+                    self._dumpObject( obj, self._getPeerPath( path ) )
+                elif getattr( aq_base( obj )
+                            , 'isTopLevelPrincipiaApplicationObject', 0 ):
+                    self._dumpChildren( obj )
+                else:
+                    self._dumpParentFolder( obj )
+            finally:
+                self._v_shallow = None
+        return self._finishDump( complete=False )
+
+    @security.private
+    def _dumpItems( self, items ):
+        #   Dump the items whose physical paths are the keys of items,
+        #   traversing to them with the current user's permissions;  set
+        #   the value of each key to the item's status.  Items are sorted
+        #   so that each container is traversed once, and items below
+        #   one dumped already are only looked up.  Return a summary.
+        self._beginDump()
+        self._v_workers = 1
+        if self._v_manifest is not None:
+            self._v_manifest.update()
+        base = self.aq_parent.getPhysicalPath()
+        containers = { base : self.aq_parent }
+        dumped = None
+        for path in sorted( items ):
+            if path[ :len( base ) ] != base or len( path ) == len( base ):
+                items[ path ] = 'not a peer'
+                continue
+            if not self._isInScope( path ):
+                items[ path ] = 'out of scope'
+                continue
+            try:
+                container = self._traverseContainer( containers, path[ :-1 ] )
+                obj = container.restrictedTraverse( path[ -1 ] )
+            except Unauthorized:
+                items[ path ] = 'unauthorized'
+                continue
+            except ( AttributeError, KeyError, NotFound ):
+                items[ path ] = 'not found'
+                continue
+            #   Don't dump an item acquired from elsewhere under path.
+            getPhysicalPath = getattr( obj, 'getPhysicalPath', None )
+            if getPhysicalPath is None or tuple( getPhysicalPath() ) != path:
+                items[ path ] = 'not found'
+                continue
+            if dumped is not None and path[ :len( dumped ) ] == dumped:
+                if self._getHandler( obj ) is None:
+                    items[ path ] = 'skipped'
+                else:
+                    items[ path ] = 'dumped'
+                continue
+            errors = self._v_stats.getErrorCount()
+            if not self._dumpObject( obj, self._getPeerPath( path ) ):
+                items[ path ] = 'skipped'
+            elif self._v_stats.getErrorCount() > errors:
+                items[ path ] = 'error'
+            else:
+                items[ path ] = 'dumped'
+                dumped = path
+        return self._finishDump( complete=False )
+
+    @security.private
+    def _traverseContainer( self, containers, path ):
+        #   Return the container at physical path, traversing from the
+        #   nearest one in containers, and caching it there.
+        container = containers.get( path )
+        if container is None:
+            start = len( path ) - 1
+            while path[ :start ] not in containers:
+                start -= 1
+            container = containers[ path[ :start ] ]
+            for name in path[ start: ]:
+                container = container.restrictedTraverse( name )
+            containers[ path ] = container
+        return container
+
+    @security.private
+    def _isInScope( self, physical_path ):
+        #   Is the object at physical_path, and each of its containers
+        #   below our parent, in the scope of our dumps?
+        scope = self._v_scope
+        if scope is None:
+            return True
+        start = len( self.aq_parent.getPhysicalPath() ) + 1
+        for end in range( start, len( physical_path ) + 1 ):
+            if not scope.allowsPath( physical_path[ :end ] ):
+                return False
+        return True
+
+    @security.private
+    def _getPeerPath( self, physical_path ):
+        #   Return the path, relative to fspath, of the directory in
+        #   which the object at physical_path is dumped.
+        parent = self.aq_parent
+        names = list( physical_path[ len( parent.getPhysicalPath() ):-1 ] )
+        if not getattr( aq_base( parent )
+                      , 'isTopLevelPrincipiaApplicationObject', 0 ):
+            names.insert( 0, parent.getId() )
+        return names and os.path.join( *names ) or None
+
     @security.private
     def _setFSPath( self, fspath ):
         #   Canonicalize fspath.
         fspath = os.path.normpath( fspath )
         if not os.path.isabs( fspath ):
-            raise RunTimeError('Dumper Error: path must be absolute.')
+            raise RuntimeError('Dumper Error: path must be absolute.')
         self.fspath = fspath
 
+    @security.private
+    def _cleanLines( self, lines ):
+        #   Return a tuple of the non-blank, stripped lines.
+        if isinstance( lines, str ):
+            lines = lines.splitlines()
+        return tuple( [ line.strip() for line in lines if line.strip() ] )
+
+    @security.private
+    def _getScope( self ):
+        #   Return the scope of our dumps, or None if everything is dumped.
+        if not ( self.include_paths or self.exclude_paths
+              or self.include_meta_types or self.exclude_meta_types ):
+            return None
+        return DumpScope( self.include_paths
+                        , self.exclude_paths
+                        , self.include_meta_types
+                        , self.exclude_meta_types
+                        )
+
     @security.private
     def _buildPathString( self, path=None ):
         #   Construct a path string, relative to self.fspath.
         if self.fspath is None:
-            raise RunTimeError('Dumper Error: Path not set.')
+            raise RuntimeError('Dumper Error: Path not set.')
 
         if path is None:
             path = self.fspath
@@ -126,58 +802,856 @@ class Dumper(SimpleItem):
     def _checkFSPath( self, path=None ):
         #   Ensure that fspath/path exists.
         path = self._buildPathString( path )
-
-        if not os.path.exists( path ):
-            os.makedirs( path )
-        
+        self._getOutput().ensureDirectory( path )
         return path
 
+    @security.private
+    def _beginDump( self, output=None ):
+        #   Set up the per-run state;  in incremental mode, load the
+        #   manifest written by the previous run.
+        if output is None:
+            output = FilesystemOutput( self._writer_threads
+                                     , self._write_queue_size )
+        self._v_output = output
+        self._v_files = []
+        self._v_protected = []
+        self._v_frames = []
+        log = None
+        if self.stats_log:
+            log = open( self.stats_log, 'a', encoding='utf-8' )
+        self._v_stats = DumpStats( log )
+        self._v_scope = self._getScope()
+        self._v_security = SecurityExporter()
+        self._v_companions = None
+        if self.compact_layout:
+            extension = self.use_metadata_file and 'metadata' or 'properties'
+            self._v_companions = CompanionIndex( '.%s' % extension )
+        self._v_manifest = None
+        if self.incremental:
+            if isinstance( output, GitOutput ):
+                #   Kept with the repository, and only trusted while the
+                #   branch's head is the commit it describes.
+                manifest = Manifest( output.state_path, self._getSettings() )
+                manifest.load()
+                if not output.isCurrent():
+                    manifest.previous = {}
+            else:
+                manifest = Manifest( self._buildPathString()
+                                   , self._getSettings() )
+                manifest.load()
+            self._v_manifest = manifest
+        self._v_index = None
+        if self.write_index and isinstance( output, FilesystemOutput ):
+            index = DumpIndex( self._buildPathString(), self._getSettings() )
+            index.open()
+            if index.fresh:
+                #   Objects skipped as unchanged would be left out of the
+                #   index:  dump everything.
+                if self._v_manifest is not None:
+                    self._v_manifest.previous = {}
+                if self._v_checkpoint is not None:
+                    self._v_checkpoint.completed = set()
+            self._v_index = index
+        self._v_store = None
+        if self.content_store and isinstance( output, FilesystemOutput ):
+            store = ContentStore( os.path.join( self._buildPathString()
+                                              , STORE_DIRNAME ) )
+            if store.canLink():
+                store.load()
+                self._v_store = store
+            else:
+                #   Copies of the payloads would only double the disk
+                #   used, and look unreferenced to 'collect'.
+                LOG.warning( 'Dumper %s:  no hard links under %s;  the'
+                             ' content store is not used'
+                           , '/'.join( self.getPhysicalPath() )
+                           , store.fspath )
+        self._v_workers = self.parallelism
+
+    @security.private
+    def _finishDump( self, complete=True ):
+        #   Persist the manifest for the next incremental run and the
+        #   index, and drop any checkpoint, which a complete dump
+        #   supersedes;  return a summary of the files written.  A diff
+        #   leaves them all alone.
+        if self._v_companions is not None:
+            self._writeCompanionIndexes( carry=not complete )
+            self._v_companions = None
+        self._v_output.flush()
+        if self._v_index is not None:
+            self._v_index.finish( complete )
+            self._v_index = None
+        if self._v_store is not None:
+            self._v_store.save()
+            self._v_store = None
+        manifest = self._v_manifest
+        if manifest is not None:
+            if not isinstance( self._v_output, DiffOutput ):
+                manifest.save()
+            self._v_manifest = None
+        checkpoint = self._v_checkpoint
+        if checkpoint is None and complete and isinstance( self._v_output
+                                                         , FilesystemOutput ):
+            checkpoint = Checkpoint( self._buildPathString() )
+        if checkpoint is not None:
+            checkpoint.remove()
+        self._v_checkpoint = None
+        self._v_workers = 1
+        self._v_files = self._v_protected = self._v_frames = None
+        output, self._v_output = self._v_output, None
+        self._v_stats.close()
+        return '%s, %d errors' % ( output.summarize()
+                                 , self._v_stats.getErrorCount() )
+
+    @security.private
+    def _clone( self ):
+        #   Return a transient dumper with the same settings.
+        clone = self.__class__()
+        for name in self._config_attrs:
+            setattr( clone, name, getattr( self, name ) )
+        return clone
+
+    @security.private
+    def _makeWorker( self ):
+        #   Return a transient dumper sharing the state of this run.
+        worker = self._clone()
+        worker._v_manifest = self._v_manifest
+        worker._v_output = self._getOutput()
+        worker._v_files = []
+        worker._v_protected = self._v_protected
+        worker._v_stats = self._v_stats
+        worker._v_frames = []
+        worker._v_progress = self._v_progress
+        worker._v_checkpoint = self._v_checkpoint
+        worker._v_oids = self._v_oids
+        worker._v_scope = self._v_scope
+        worker._v_index = self._v_index
+        worker._v_store = self._v_store
+        worker._v_security = self._v_security
+        worker._v_companions = self._v_companions
+        return worker
+
+    @security.private
+    def _getSerial( self, obj ):
+        #   Return the hex-encoded persistent serial of obj, or None if
+        #   it is not stored in the ZODB.
+        base = aq_base( obj )
+        if getattr( base, '_p_jar', None ) is None:
+            return None
+        if base._p_changed is None:
+            base._p_activate()
+        return hexlify( base._p_serial ).decode( 'ascii' )
+
+    @security.private
+    def _isContainer( self, obj ):
+        #   Containers are always revisited in incremental mode:  their
+        #   own serial doesn't change when their children are edited.
+        return getattr( aq_base( obj ), 'isPrincipiaFolderish', 0 )
+
+    @security.private
+    def _getOutput( self ):
+        #   Return the output used to write files;  outside of a full
+        #   dump, e.g. for 'testDump', a fresh one, as its directory cache
+        #   would outlive directories removed since.
+        output = self._v_output
+        if output is None:
+            output = FilesystemOutput()
+        return output
+
+    @security.private
+    def _addFile( self, fullpath, file=None, size=0, source=None
+                , sha1=None ):
+        #   Note a file written for the object being dumped;  'file' is
+        #   the output file, whose size is only known once it's closed,
+        #   else 'source' the file copied (whose digest, 'sha1', may be
+        #   known).
+        if self._v_files is not None:
+            self._v_files.append( os.path.relpath( fullpath, self.fspath ) )
+        if self._v_frames:
+            frame = self._v_frames[ -1 ]
+            frame[ 'files' ].append( file )
+            frame[ 'bytes' ] += size
+            frame[ 'names' ].append( ( fullpath, size, sha1, source ) )
+        return file
+
+    @security.private
+    def _isUnchanged( self, key, state ):
+        #   Return true if the manifest shows the object at 'key' already
+        #   dumped in 'state';  its files are then kept by the pruner.
+        entry = self._v_manifest.unchanged( key, state )
+        if entry is None:
+            return False
+        output = self._getOutput()
+        for filename in entry.get( 'files', () ):
+            output.keep( os.path.join( self.fspath, filename ) )
+        if self._v_companions is not None:
+            for dirname, name, text in entry.get( 'companions', () ):
+                self._v_companions.add( os.path.join( self.fspath, dirname )
+                                      , name, text )
+        if self._v_index is not None:
+            self._v_index.keep( key )
+        return True
+
+    @security.private
+    def _recordState( self, key, state, mark ):
+        #   Record the state of the object at 'key', and the files written
+        #   for it since 'mark', in the manifest;  in the compact layout,
+        #   its companion files too.
+        state[ 'files' ] = self._v_files[ mark: ]
+        if self._v_companions is not None and self._v_frames:
+            companions = [ [ os.path.relpath( file.dirpath, self.fspath )
+                           , file.name, file.text ]
+                           for file in self._v_frames[ -1 ][ 'companions' ]
+                           if file.text is not None ]
+            if companions:
+                state[ 'companions' ] = companions
+        self._v_manifest.record( key, state )
+
     @security.private
     def _createFile( self, path, filename, mode='w' ):
-        #   Create/replace file;  return the file object.
+        #   Create/replace file;  return the file object.  The file is
+        #   only rewritten on close if its content changed.
         fullpath = "%s/%s" % ( self._checkFSPath( path ), filename )
-        return open( fullpath, mode )
+        return self._addFile( fullpath, self._getOutput().openFile( fullpath ) )
 
     @security.private
     def _createMetadataFile( self, path, filename, mode='w' ):
-        #   Create/replace file;  return the file object.
-        extension = self.use_metadata_file and 'metadata' or 'properties'
-        fullpath = "%s/%s.%s" % ( self._checkFSPath( path )
-                                , filename, extension )
-        file = open( fullpath, mode )
+        #   Create/replace file;  return the file object.  In the compact
+        #   layout, the file is collected for the index of its directory
+        #   instead (see '_writeCompanionIndex').
+        companions = self._v_companions
+        if companions is not None:
+            file = companions.open( self._checkFSPath( path ), filename )
+            if self._v_frames:
+                self._v_frames[ -1 ][ 'companions' ].append( file )
+        else:
+            extension = self.use_metadata_file and 'metadata' or 'properties'
+            fullpath = "%s/%s.%s" % ( self._checkFSPath( path )
+                                    , filename, extension )
+            file = self._addFile( fullpath
+                                , self._getOutput().openFile( fullpath ) )
         if self.use_metadata_file:
             file.write("[default]\n")
         else:
             file.write("[Default]\n")
         return file
     
+    @security.private
+    def _writeData( self, data, path, filename, owner=None ):
+        #   Stream file data (a string, a Pdata chain or a blob) to
+        #   fspath/path/filename without holding all of it in memory.
+        #   With a content store, the file is linked to the stored
+        #   payload instead (see '_storeData').
+        if self._v_store is not None:
+            fullpath = "%s/%s" % ( self._checkFSPath( path ), filename )
+            source, size = self._storeData( data, owner )
+            #   Stored payloads are named by their SHA-1.
+            self._addFile( fullpath, size=size, source=source
+                         , sha1=os.path.basename( source ) )
+            self._getOutput().linkFile( source, fullpath )
+            return
+
+        if IBlob.providedBy( data ):
+            data._p_activate()
+            try:
+                blobname = data.committed()
+            except BlobError:   # uncommitted changes
+                blobname = None
+            if blobname is not None:
+                fullpath = "%s/%s" % ( self._checkFSPath( path ), filename )
+                self._addFile( fullpath, size=os.path.getsize( blobname )
+                             , source=blobname )
+                self._getOutput().copyFile( blobname, fullpath )
+                return
+            file = self._createFile( path, filename, 'wb' )
+            with data.open( 'r' ) as blobfile:
+                shutil.copyfileobj( blobfile, file )
+            file.close()
+            return
+
+        file = self._createFile( path, filename, 'wb' )
+        for chunk in self._iterChunks( data ):
+            file.write( chunk )
+        file.close()
+
+    @security.private
+    def _iterChunks( self, data ):
+        #   Yield file data (a string or a Pdata chain) in chunks;  each
+        #   Pdata chunk is ghostified once consumed, so that the chain
+        #   doesn't pile up in the connection cache.
+        if isinstance( data, bytes ):
+            yield data
+            return
+        while data is not None:
+            yield data.data
+            chunk, data = data, data.next
+            chunk._p_deactivate()
+
+    @security.private
+    def _storeData( self, data, owner=None ):
+        #   Add file data to the content store, unless the store knows
+        #   the digest of its revision:  that of data itself, if it is
+        #   persistent (a blob or Pdata chain), else that of owner.
+        #   Return ( filename, size ) of the stored payload.
+        store = self._v_store
+        holder = aq_base( data )
+        if getattr( holder, '_p_jar', None ) is None and owner is not None:
+            holder = aq_base( owner )
+        oid = serial = None
+        if getattr( holder, '_p_jar', None ) is not None:
+            serial = self._getSerial( holder )
+            if not holder._p_changed:   # else, the serial is stale
+                oid = hexlify( holder._p_oid ).decode( 'ascii' )
+                found = store.lookup( oid, serial )
+                if found is not None:
+                    return found
+
+        if IBlob.providedBy( data ):
+            try:
+                blobname = data.committed()
+            except BlobError:   # uncommitted changes
+                blobname = None
+            if blobname is not None:
+                return store.addFile( blobname, oid, serial )
+            with data.open( 'r' ) as blobfile:
+                return store.add( iter( lambda: blobfile.read( 1 << 16 ), b'' )
+                                , oid, serial )
+        return store.add( self._iterChunks( data ), oid, serial )
+
     @security.private
     def _dumpObject( self, object, path=None ):
         #   Dump one item, using path as prefix.
+        frame = None
+        progress = self._v_progress
+        if progress is not None:
+            progress.begin( '/'.join( object.getPhysicalPath() ) )
         try:
-            handler = self._handlers.get( object.meta_type, None )
-            if handler is not None:
-                handler( self, object, path )
-                return 1
+            scope = self._v_scope
+            if scope is not None and not scope.allowsMetaType(
+                                            getattr( object, 'meta_type', '' ) ):
+                return 0
+            handler = self._getHandler( object )
+            if handler is None:
+                if self._v_stats is not None:
+                    self._v_stats.skip( object.meta_type )
+                return 0
+            self._noteOid( object )
+            frame = self._pushFrame()
+            ran = self._callHandler( handler, object, path )
+            self._popFrame( frame, object, unchanged=not ran )
+            return 1
         except ConflictError:
             raise
         except:
+            #   Don't let an error delete the object's last good dump.
+            self._protectFiles( object, path )
+            exc_info = sys.exc_info()
+            LOG.error( 'Error dumping %s'
+                     , '/'.join( object.getPhysicalPath() )
+                     , exc_info=exc_info )
+            if frame is not None:
+                self._popFrame( frame, object, exc_info=exc_info )
             return -1
-        return 0
-            
+        finally:
+            if progress is not None:
+                progress.finish()
+            self._releaseObject( object )
+
+    @security.private
+    def _releaseObject( self, object ):
+        #   Ghostify object, whose handler is done with it, and trim the
+        #   connection's cache every 'gc_interval' objects;  empty it
+        #   while the process' RSS exceeds 'rss_limit' MB.  Objects
+        #   modified in the current transaction are left alone.
+        base = aq_base( object )
+        jar = getattr( base, '_p_jar', None )
+        if jar is None:
+            return
+        if base._p_changed is False:
+            base._p_deactivate()
+        self._v_visited = visited = self._v_visited + 1
+        if ( self.rss_limit and visited % self._rss_check_interval == 0 ):
+            rss = _currentRSS()
+            if rss is not None and rss > self.rss_limit:
+                jar.cacheMinimize()
+                return
+        if visited % self.gc_interval == 0:
+            jar.cacheGC()
+
+    @security.private
+    def _getHandler( self, object ):
+        #   Return the handler registered for object, or None.
+        return lookupHandler( object )
+
+    @security.private
+    def _callHandler( self, handler, object, path=None ):
+        #   Run handler for object, unless the manifest shows it hasn't
+        #   changed since the last incremental run;  return true if run.
+        if ( self._isContainer( object )
+         and not getattr( handler, 'leaf_only', False ) ):
+            return self._callContainerHandler( handler, object, path )
+        manifest = self._v_manifest
+        if manifest is None:
+            handler( self, object, path )
+            return True
+        serial = self._getSerial( object )
+        if serial is None:
+            handler( self, object, path )
+            return True
+        key = '/'.join( object.getPhysicalPath() )
+        state = { 'serial' : serial }
+        if self._isUnchanged( key, state ):
+            return False
+        mark = len( self._v_files )
+        handler( self, object, path )
+        self._recordState( key, state, mark )
+        return True
+
+    @security.private
+    def _callContainerHandler( self, handler, object, path=None ):
+        #   Run handler for container object, unless the checkpoint of
+        #   an interrupted job shows its subtree was completed;  then,
+        #   keep the files and manifest entries of the subtree.
+        checkpoint = self._v_checkpoint
+        if checkpoint is None:
+            handler( self, object, path )
+            return True
+        key = '/'.join( object.getPhysicalPath() )
+        if checkpoint.isComplete( key ):
+            self._protectFiles( object, path )
+            if self._v_manifest is not None:
+                self._v_manifest.carry( key )
+            return False
+        handler( self, object, path )
+        checkpoint.complete( key )
+        return True
+
+    @security.private
+    def _noteOid( self, object ):
+        #   Map the oid of object to its path, for a watcher.
+        if self._v_oids is not None:
+            oid = getattr( aq_base( object ), '_p_oid', None )
+            if oid is not None:
+                self._v_oids[ oid ] = object.getPhysicalPath()
+                if self._isContainer( object ):
+                    self._noteParts( object )
+
+    @security.private
+    def _noteParts( self, object ):
+        #   Map the oids of the persistent parts of container object to
+        #   its path, for a watcher:  adding or removing an item may only
+        #   write them, e.g. the '_tree' and '_count' of a BTreeFolder2,
+        #   or the '_catalog' of a ZCatalog and its BTrees.  Parts are
+        #   followed two levels down, without loading BTree buckets;  the
+        #   items themselves, and objects mapped to their own path, are
+        #   left alone.
+        base = aq_base( object )
+        if base._p_changed is None:
+            base._p_activate()
+        items = set( [ info[ 'id' ]
+                       for info in getattr( base, '_objects', () ) ] )
+        path = object.getPhysicalPath()
+        for name, value in list( base.__dict__.items() ):
+            if name not in items:
+                self._notePart( value, path, 2 )
+
+    @security.private
+    def _notePart( self, value, path, depth ):
+        #   Map value, if persistent, and its own persistent parts down to
+        #   depth, to path;  see '_noteParts'.
+        oid = getattr( value, '_p_oid', None )
+        if oid is None or getattr( value, '_p_jar', None ) is None:
+            return
+        self._v_oids.setdefault( oid, path )
+        state = getattr( value, '__dict__', None )  # not BTrees
+        if depth > 1 and state is not None:
+            if value._p_changed is None:
+                value._p_activate()
+            for part in list( value.__dict__.values() ):
+                self._notePart( part, path, depth - 1 )
+
+    @security.private
+    def _pushFrame( self ):
+        #   Start measuring a handler call.
+        if self._v_frames is None:
+            return None
+        frame = { 'started' : time.perf_counter()
+                , 'nested' : 0.0
+                , 'files' : []
+                , 'names' : []
+                , 'companions' : []
+                , 'bytes' : 0
+                }
+        self._v_frames.append( frame )
+        return frame
+
+    @security.private
+    def _popFrame( self, frame, object, unchanged=False, exc_info=None ):
+        #   Record the measurements of a handler call;  time spent in
+        #   nested calls is not charged to it.
+        if frame is None:
+            return
+        frames = self._v_frames
+        while frames and frames.pop() is not frame:
+            pass
+        elapsed = time.perf_counter() - frame[ 'started' ]
+        if frames:
+            frames[ -1 ][ 'nested' ] += elapsed
+        files = [ file for file in frame[ 'files' ] if file is not None ]
+        self._v_stats.record( '/'.join( object.getPhysicalPath() )
+                            , object.meta_type
+                            , elapsed - frame[ 'nested' ]
+                            , len( frame[ 'files' ] )
+                            , frame[ 'bytes' ]
+                              + sum( [ file.size for file in files ] )
+                            , unchanged
+                            , exc_info
+                            )
+        index = self._v_index
+        if index is not None and exc_info is None and not unchanged:
+            records = []
+            names = frame[ 'names' ]
+            for ( fullpath, size, sha1, source ), file in zip(
+                                                    names, frame[ 'files' ] ):
+                filename = os.path.relpath( fullpath, self.fspath )
+                if file is not None:
+                    records.append( ( filename, file.size, file.hexdigest()
+                                    , None ) )
+                else:
+                    records.append( ( filename, size, sha1, source ) )
+            index.record( '/'.join( object.getPhysicalPath() )
+                        , object.meta_type
+                        , self._getSerial( object )
+                        , getattr( aq_base( object ), '_p_mtime', None )
+                        , records
+                        )
 
     @security.private
     def _dumpObjects( self, objects, path=None ):
-        #   Dump each item, using path as prefix.
+        #   Dump each item, using path as prefix;  read its id first, as
+        #   it is ghostified once dumped.
         dumped = []
         for object in objects:
+            id = object.id
+            if callable( id ):
+                id = id()
+            meta_type = object.meta_type
             if self._dumpObject( object, path ) > 0:
-                id = object.id
-                if callable( id ):
-                    id = id()
-                dumped.append( ( id, object.meta_type ) )
+                dumped.append( ( id, meta_type ) )
+        return dumped
+
+
+    @security.private
+    def _protectFiles( self, object, path=None ):
+        #   Protect the files of object (and of its items) from the
+        #   pruner, when they were not written by this run.
+        self._protectPath( object.getId(), object.getPhysicalPath(), path )
+
+    @security.private
+    def _protectPath( self, id, physical_path, path=None ):
+        #   Protect the files of the item id at physical_path, see
+        #   '_protectFiles'.
+        if self._v_protected is not None:
+            self._v_protected.append(
+                os.path.join( self._buildPathString( path ), id ) )
+        if self._v_companions is not None:
+            self._v_companions.protect( self._buildPathString( path ), id )
+        if self._v_index is not None:
+            self._v_index.keep( '/'.join( physical_path ), subtree=True )
+
+    @security.private
+    def _pruneFiles( self, path=None ):
+        #   Remove files under fspath/path which were not produced by
+        #   this run, then any directories left empty.  The previous
+        #   manifest, if any, names the candidates;  otherwise the tree
+        #   is walked.
+        output = self._getOutput()
+        root = self._buildPathString( path )
+        protected = tuple( self._v_protected or () )
+
+        def isStale( fullpath ):
+            if output.isKept( fullpath ):
+                return False
+            for prefix in protected:
+                if ( fullpath == prefix
+                  or fullpath.startswith( prefix + '.' )
+                  or fullpath.startswith( prefix + os.sep ) ):
+                    return False
+            return True
+
+        manifest = self._v_manifest
+        if manifest is not None and manifest.previous:
+            for entry in manifest.previous.values():
+                for filename in entry.get( 'files', () ):
+                    fullpath = os.path.join( self.fspath, filename )
+                    if ( fullpath.startswith( root + os.sep )
+                     and isStale( fullpath )
+                     and os.path.isfile( fullpath ) ):
+                        output.removeFile( fullpath )
+                        dirname = os.path.dirname( fullpath )
+                        while dirname != root and not os.listdir( dirname ):
+                            output.removeDirectory( dirname )
+                            dirname = os.path.dirname( dirname )
+            return
+
+        store = os.path.join( self.fspath, STORE_DIRNAME )
+        for dirname, subdirs, filenames in os.walk( root, topdown=False ):
+            if dirname == store or dirname.startswith( store + os.sep ):
+                continue
+            for filename in filenames:
+                if dirname == self.fspath and filename.startswith(
+                                ( MANIFEST_FILENAME, CHECKPOINT_FILENAME
+                                , INDEX_FILENAME ) ):
+                    continue
+                fullpath = os.path.join( dirname, filename )
+                if isStale( fullpath ):
+                    output.removeFile( fullpath )
+            if dirname != root and not os.listdir( dirname ):
+                output.removeDirectory( dirname )
+
+    @security.private
+    def _dumpChildren( self, obj, path=None ):
+        #   Dump the items in container obj, using path as prefix;  in
+        #   parallel mode, the first container visited (the Dumper's
+        #   parent) is split across the worker pool.
+        if ( self._v_shallow is not None
+         and obj.getPhysicalPath() == self._v_shallow ):
+            return self._listChildren( obj, path )
+        workers = self._v_workers
+        if workers > 1 and getattr( aq_base( obj ), '_p_jar', None ):
+            self._v_workers = 1
+            return self._dumpParallel( obj, path, workers )
+        return self._dumpObjects( self._iterChildren( obj ), path )
+
+    @security.private
+    def _listChildren( self, obj, path=None ):
+        #   List the items in container obj without dumping them again,
+        #   except for those new to the watcher's oid map;  remove the
+        #   files of the items the map shows were removed.
+        oids = self._v_oids or {}
+        parent = obj.getPhysicalPath()
+        previous = set( [ child_path for child_path in oids.values()
+                          if child_path[ :-1 ] == parent ] )
+        listed = []
+        for child in self._iterChildren( obj ):
+            if self._getHandler( child ) is None:
+                continue
+            id, meta_type = child.getId(), child.meta_type
+            oid = getattr( aq_base( child ), '_p_oid', None )
+            if ( oid is None or oids.get( oid ) != child.getPhysicalPath() ):
+                if self._dumpObject( child, path ) <= 0:
+                    continue
+            listed.append( ( id, meta_type ) )
+        ids = set( [ id for id, meta_type in listed ] )
+        for child_path in previous:
+            if child_path[ -1 ] not in ids:
+                self._removeItemFiles( child_path, path, ids )
+        return listed
+
+    @security.private
+    def _removeItemFiles( self, child_path, path, ids ):
+        #   Remove the files of the item at child_path, which is gone from
+        #   the container dumped under path, and forget it;  files named
+        #   after the remaining items, 'ids', are left alone.
+        output = self._getOutput()
+        id = child_path[ -1 ]
+        dirname = self._buildPathString( path )
+        try:
+            names = os.listdir( dirname )
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if name != id and not name.startswith( id + '.' ):
+                continue
+            parts = name.split( '.' )
+            if [ i for i in range( 1, len( parts ) + 1 )
+                 if '.'.join( parts[ :i ] ) in ids ]:
+                continue
+            fullpath = os.path.join( dirname, name )
+            if not os.path.isdir( fullpath ):
+                output.removeFile( fullpath )
+                continue
+            for subdir, subdirs, filenames in os.walk( fullpath
+                                                     , topdown=False ):
+                for filename in filenames:
+                    output.removeFile( os.path.join( subdir, filename ) )
+                output.removeDirectory( subdir )
+        if self._v_companions is not None:
+            self._v_companions.discard( dirname, id, ids )
+        oids = self._v_oids
+        for oid, oid_path in list( oids.items() ):
+            if oid_path[ :len( child_path ) ] == child_path:
+                del oids[ oid ]
+        if self._v_manifest is not None:
+            self._v_manifest.discard( '/'.join( child_path ) )
+        if self._v_index is not None:
+            self._v_index.discard( '/'.join( child_path ) )
+
+    @security.private
+    def _iterChildren( self, obj ):
+        #   Yield the items of container obj in batches:  each batch is
+        #   prefetched from the storage in one go, so huge folders don't
+        #   cost one round-trip per item, and only one batch is held at
+        #   a time;  '_dumpObject' releases each item once dumped.
+        jar = getattr( aq_base( obj ), '_p_jar', None )
+        if jar is None or getattr( aq_base( obj ), '_getOb', None ) is None:
+            scope = self._v_scope
+            children = [ child for child in obj.objectValues()
+                         if scope is None or scope.allows( child ) ]
+            if self._v_progress is not None:
+                self._v_progress.discover( len( children ) )
+            for child in children:
+                yield child
+            return
+
+        ids = iter( self._getDumpableIds( obj ) )
+        while True:
+            batch = [ obj._getOb( id )
+                      for id in islice( ids, self._batch_size ) ]
+            if not batch:
+                break
+            if self._v_progress is not None:
+                self._v_progress.discover( len( batch ) )
+            jar.prefetch( [ aq_base( child ) for child in batch ] )
+            for child in batch:
+                yield child
+            del batch
+
+    @security.private
+    def _getDumpableIds( self, obj ):
+        #   Return the ids of the items of obj which are in scope and
+        #   whose meta_type has a handler, without loading them, and
+        #   count those without handler as skipped;  return all ids in
+        #   scope if obj's meta_types aren't indexed, or handlers
+        #   registered by interface only may apply.
+        scope = self._v_scope
+        handled = getHandledMetaTypes()
+        counts = self._countMetaTypes( obj )
+        if counts is None:
+            ids = obj.objectIds()
+        else:
+            if handled is not None and self._v_stats is not None:
+                for meta_type in counts:
+                    if meta_type not in handled:
+                        self._v_stats.skip( meta_type, counts[ meta_type ] )
+            spec = [ meta_type for meta_type in counts
+                     if ( handled is None or meta_type in handled )
+                    and ( scope is None or scope.allowsMetaType( meta_type ) ) ]
+            if not spec:
+                return ()
+            if len( spec ) == len( counts ):
+                ids = obj.objectIds()
+            else:
+                ids = obj.objectIds( spec )
+        if scope is None or not scope.filtersPaths():
+            return ids
+        parent = obj.getPhysicalPath()
+        return [ id for id in ids if scope.allowsPath( parent + ( id, ) ) ]
+
+    @security.private
+    def _countMetaTypes( self, obj ):
+        #   Return the number of items of obj by meta_type, from the
+        #   container's own index, or None.
+        base = aq_base( obj )
+        index = getattr( base, '_mt_index', None )  # BTreeFolder2
+        if index is not None:
+            return dict( [ ( meta_type, len( ids ) )
+                           for meta_type, ids in index.items() ] )
+        objects = getattr( base, '_objects', None )  # ObjectManager
+        if objects is None:
+            return None
+        counts = {}
+        for info in objects:
+            meta_type = info[ 'meta_type' ]
+            counts[ meta_type ] = counts.get( meta_type, 0 ) + 1
+        return counts
+
+    @security.private
+    def _dumpParallel( self, obj, path, workers ):
+        #   Dump each item of obj in a thread with its own ZODB
+        #   connection, pinned to the snapshot of obj's connection;
+        #   results are returned in 'objectValues' order, so the
+        #   listing matches a serial run.
+        jar = aq_base( obj )._p_jar
+        db = jar.db()
+        before = self._getSnapshot( jar )
+        app_oid = aq_base( obj.getPhysicalRoot() )._p_oid
+        parent_path = obj.getPhysicalPath()
+        child_paths = [ parent_path + ( id, )
+                        for id in self._getDumpableIds( obj ) ]
+        if self._v_progress is not None:
+            self._v_progress.discover( len( child_paths ) )
+
+        def dumpChild( child_path ):
+            conn = db.open( before=before )
+            try:
+                worker = self._makeWorker()
+                try:
+                    child = conn.get( app_oid ).unrestrictedTraverse(
+                                                                child_path )
+                except ConflictError:
+                    raise
+                except:
+                    worker._failChild( obj, child_path, path
+                                     , sys.exc_info() )
+                    return []
+                return worker._dumpObjects( [ child ], path )
+            finally:
+                conn.transaction_manager.abort()
+                conn.close()
+
+        dumped = []
+        with ThreadPoolExecutor( max_workers=workers ) as executor:
+            for result in executor.map( dumpChild, child_paths ):
+                dumped.extend( result )
         return dumped
 
+    @security.private
+    def _getSnapshot( self, jar ):
+        #   Return the 'before' time of the view of the database that
+        #   connection jar reads from.
+        before = jar.before
+        if before is None:
+            before = getattr( jar._storage, '_start', None )  # MVCC
+        if before is None:
+            before = p64( u64( jar.db().lastTransaction() ) + 1 )
+        return before
+
+    @security.private
+    def _failChild( self, obj, child_path, path, exc_info ):
+        #   Record an item of obj which could not be looked up for
+        #   dumping as an error, as '_dumpObject' does for one which
+        #   could not be dumped.
+        id = child_path[ -1 ]
+        progress = self._v_progress
+        if progress is not None:
+            progress.begin( '/'.join( child_path ) )
+        LOG.error( 'Error dumping %s', '/'.join( child_path )
+                 , exc_info=exc_info )
+        self._protectPath( id, child_path, path )
+        if self._v_stats is not None:
+            self._v_stats.record( '/'.join( child_path )
+                                , self._getChildMetaType( obj, id )
+                                , 0.0
+                                , exc_info=exc_info
+                                )
+        if progress is not None:
+            progress.finish()
+
+    @security.private
+    def _getChildMetaType( self, obj, id ):
+        #   Return the meta_type of item id of obj from the container's
+        #   own index, without loading the item.
+        base = aq_base( obj )
+        for info in getattr( base, '_objects', () ):
+            if info[ 'id' ] == id:
+                return info[ 'meta_type' ]
+        index = getattr( base, '_mt_index', None )  # BTreeFolder2
+        if index is not None:
+            for meta_type, ids in index.items():
+                if id in ids:
+                    return meta_type
+        return 'Unknown'
 
     @security.private
     def _writeProperties( self, obj, file ):
@@ -196,7 +1670,7 @@ class Dumper(SimpleItem):
     #
     @security.private
     def _dumpRoot( self, obj ):
-        self._dumpObjects( obj.objectValues() )
+        self._dumpChildren( obj )
 
     @security.private
     def _dumpFolder( self, obj, path=None ):
@@ -204,10 +1678,21 @@ class Dumper(SimpleItem):
         if path is None:
             path = ''
         path = os.path.join( path, obj.id )
+        #   A shallow dump leaves the other items' companion files alone.
+        carry = ( self._v_shallow is not None
+              and obj.getPhysicalPath() == self._v_shallow )
+        dumped = self._dumpChildren( obj, path )
+        dumped.sort() # help diff out :)
+
+        listing = self._getListingState( obj, dumped )
+        if listing is not None:
+            if self._isUnchanged( *listing ):
+                self._writeCompanionIndex( path, carry )
+                return
+            mark = len( self._v_files )
+
         file = self._createMetadataFile( path, '' )
         self._writeProperties( obj, file )
-        dumped = self._dumpObjects( obj.objectValues(), path )
-        dumped.sort() # help diff out :)
 
         if self.use_metadata_file:
             file.write("\n[Objects]\n")
@@ -218,6 +1703,52 @@ class Dumper(SimpleItem):
         for id, meta in dumped:
             file.write( '%s:%s\n' % ( id, meta ) )
         file.close()
+        self._writeCompanionIndex( path, carry )
+
+        if listing is not None:
+            self._recordState( *listing, mark )
+
+    @security.private
+    def _writeCompanionIndex( self, path=None, carry=False ):
+        #   In the compact layout, write the companion files collected for
+        #   fspath/path as the index of that directory;  if carry, keep
+        #   those found on disk for the items not dumped again.
+        companions = self._v_companions
+        if companions is None:
+            return
+        dirpath = self._buildPathString( path )
+        text = companions.flush( dirpath, carry )
+        if text is None:
+            return
+        fullpath = os.path.join( dirpath, companions.filename )
+        file = self._addFile( fullpath
+                            , self._getOutput().openFile( fullpath ) )
+        file.write( text )
+        file.close()
+
+    @security.private
+    def _writeCompanionIndexes( self, carry=False ):
+        #   Write the indexes still pending:  those of directories whose
+        #   folder wasn't dumped by this run, e.g. that of the root.
+        if self._v_companions is not None:
+            for dirpath in self._v_companions.getPending():
+                self._writeCompanionIndex( dirpath, carry )
+
+    @security.private
+    def _getListingState( self, obj, dumped ):
+        #   In incremental mode, return the manifest key and state of a
+        #   folder:  its serial and a digest of its '.objects' listing.
+        if self._v_manifest is None:
+            return None
+        serial = self._getSerial( obj )
+        if serial is None:
+            return None
+        listing = ''.join( [ '%s:%s\n' % item for item in dumped ] )
+        key = '/'.join( obj.getPhysicalPath() )
+        state = { 'serial' : serial
+                , 'listing' : md5( listing.encode( 'utf-8' ) ).hexdigest()
+                }
+        return key, state
 
     @security.private
     def _dumpDTML( self, obj, path=None, suffix='dtml' ):
@@ -235,20 +1766,10 @@ class Dumper(SimpleItem):
     def _dumpSecurityInfo(self, obj, file):
         if getattr(obj.aq_base, '_proxy_roles', None):
             file.write('proxy=%s\n' % ','.join(obj._proxy_roles))
-        security_header_written = 0
-        valid_roles = obj.valid_roles()
-        for perm_dict in obj.permission_settings():
-            perm_name = perm_dict['name']
-            acquire = (perm_dict['acquire'] and 1) or 0
-            roles = []
-            for role_idx in range(len(valid_roles)):
-                if perm_dict['roles'][role_idx]['checked']:
-                    roles.append(valid_roles[role_idx])
-            if roles or (acquire==0):
-                if not security_header_written:
-                    security_header_written = 1
-                    file.write('\n[security]\n')
-                file.write('%s=%d:%s\n' % (perm_name, acquire, ','.join(roles)))
+        exporter = self._v_security
+        if exporter is None:
+            exporter = SecurityExporter()
+        exporter.write(obj, file)
 
     @security.private
     def _dumpDTMLMethod( self, obj, path=None ):
@@ -308,7 +1829,7 @@ class Dumper(SimpleItem):
     def _dumpFileOrImage( self, obj, path=None ):
         #   Dump properties of obj (assumed to be an Externa Method) to the
         #   filesystem as a file, with the accompanyting properties file.
-        file = self._createMetadataFile( path, '%s' % obj.id() )
+        file = self._createMetadataFile( path, obj.getId() )
         if self.use_metadata_file:
             file.write( 'title=%s\n' % obj.title )
             file.write( 'content_type=%s\n' % obj.content_type )
@@ -318,15 +1839,7 @@ class Dumper(SimpleItem):
             file.write( 'content_type:string=%s\n' % obj.content_type )
             file.write( 'precondition:string=%s\n' % obj.precondition )
         file.close()
-        file = self._createFile( path, obj.id(), 'wb' )
-        data = obj.data
-        if type( data ) == type( '' ):
-            file.write( data )
-        else:
-            while data is not None:
-                file.write( data.data )
-                data = data.next
-        file.close()
+        self._writeData( obj.data, path, obj.getId(), owner=obj )
 
     @security.private
     def _dumpPythonMethod( self, obj, path=None ):
@@ -437,10 +1950,10 @@ class Dumper(SimpleItem):
     def _dumpZCatalog( self, obj, path=None ):
         #   Dump properties of obj (assumed to be a ZCatalog) to the
         #   filesystem as a file, with the accompanyting properties file.
-        file = self._createFile( path, '%s.catalog' % obj.id )
-        for brain in obj.searchResults():
-            file.write( '%s\n' % obj.getpath( brain.data_record_id_ ) )
-        file.close()
+        if self.catalog_records:
+            file = self._createFile( path, '%s.catalog' % obj.id )
+            self._writeCatalogPaths( obj, file )
+            file.close()
         file = self._createMetadataFile( path, '%s' % obj.id )
         file.write( 'title:string=%s\n' % obj.title )
         file.write( 'vocab_id:string=%s\n' % obj.vocab_id )
@@ -455,6 +1968,31 @@ class Dumper(SimpleItem):
             file.write( '%s\n' % column )
         file.close()
     
+    @security.private
+    def _writeCatalogPaths( self, obj, file ):
+        #   Write the paths of the objects catalogued by obj, in record
+        #   id order, reading the catalog's rid -> path BTree directly
+        #   rather than building a brain per record.
+        paths = getattr( aq_base( obj._catalog ), 'paths', None )
+        if paths is None:
+            for brain in obj.searchResults():
+                file.write( '%s\n' % obj.getpath( brain.data_record_id_ ) )
+            return
+
+        jar = getattr( aq_base( obj ), '_p_jar', None )
+        batch = []
+        for uid in paths.values():
+            batch.append( uid )
+            if len( batch ) == self._catalog_batch_size:
+                batch.append( '' )
+                file.write( '\n'.join( batch ) )
+                batch = []
+                if jar is not None:
+                    jar.cacheGC()
+        if batch:
+            batch.append( '' )
+            file.write( '\n'.join( batch ) )
+
     @security.private
     def _dumpZClass( self, obj, path=None ):
         #   Dump properties of obj (assumed to be a ZClass) to the
@@ -473,16 +2011,7 @@ class Dumper(SimpleItem):
         file.close()
 
         #   Dump icon
-        file = self._createFile( path, '.icon', 'wb' )
-        img = obj._zclass_.ziconImage
-        data = img.data
-        if type( data ) == type( '' ):
-            file.write( data )
-        else:
-            while data is not None:
-                file.write( data.data )
-                data = data.next
-        file.close()
+        self._writeData( obj._zclass_.ziconImage.data, path, '.icon' )
 
         #   Dump views
         file = self._createFile( path, '.views' )
@@ -560,7 +2089,7 @@ class Dumper(SimpleItem):
         file.write( 'wizard_stepcount:int=%s\n' % obj.wizard_stepcount )
         file.close()
 
-        pages = self._dumpObjects( obj.objectValues(), path )
+        pages = self._dumpObjects( self._iterChildren( obj ), path )
 
         pages.sort() # help diff out :)
         file = self._createFile( path, '.objects' )
@@ -585,33 +2114,6 @@ class Dumper(SimpleItem):
         file.write(obj.get_xml())
         file.close()
 
-    _handlers = { 'DTML Method'     : _dumpDTMLMethod
-                , 'DTML Document'   : _dumpDTMLDocument
-                , 'Folder'          : _dumpFolder
-                , 'BTreeFolder2'    : _dumpFolder
-                , 'External Method' : _dumpExternalMethod
-                , 'File'            : _dumpFileOrImage
-                , 'Image'           : _dumpFileOrImage
-                , 'Python Method'   : _dumpPythonMethod
-                , 'Script (Python)' : _dumpPythonScript
-                , 'Controller Python Script' : _dumpControllerPythonScript
-                , 'Controller Validator' : _dumpValidatorScript
-                , 'Controller Page Template' : _dumpControllerPageTemplate
-                , 'Page Template'   : _dumpPageTemplate
-                , 'Z SQL Method'    : _dumpSQLMethod
-                , 'ZCatalog'        : _dumpZCatalog
-                , 'Z Class'         : _dumpZClass
-                , 'Common Instance Property Sheet'
-                                    : _dumpZClassPropertySheet
-                , 'Zope Permission' : _dumpPermission
-                , 'Zope Factory'    : _dumpFactory
-                , 'Wizard'          : _dumpWizard
-                , 'Wizard Page'     : _dumpWizardPage
-                , 'Formulator Form' : _dumpFormulatorForm
-               #, 'SQL DB Conn'     : _dumpDBConn
-                , 'ZWiki Page'      : _dumpZWikiPage
-                }
-
     @security.protected(USE_DUMPER_PERMISSION)
     def testDump( self, peer_path, path=None, REQUEST=None ):
         """
@@ -626,5 +2128,95 @@ class Dumper(SimpleItem):
                                         % peer_path
                                         )
 
+    @security.protected(USE_DUMPER_PERMISSION)
+    def dumpItems(self, paths=(), path_file=None, catalog_path=None,
+                  query=None, REQUEST=None):
+        """
+            Dump the items at 'paths', those listed one per line in
+            'path_file', and those found by 'query' in the catalog at
+            'catalog_path', in one run;  return the status of each,
+            by physical path, as JSON if called through the web.
+        """
+        if isinstance(paths, str):
+            paths = paths.splitlines()
+        paths = list(paths)
+        if path_file is not None and hasattr(path_file, 'read'):
+            text = path_file.read()
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            paths.extend(text.splitlines())
+        if catalog_path:
+            catalog = self.aq_parent.restrictedTraverse(catalog_path)
+            paths.extend(brain.getPath()
+                         for brain in catalog.searchResults(dict(query or {})))
+
+        base = self.aq_parent.getPhysicalPath()
+        items = {}
+        for path in paths:
+            path = path.strip().rstrip('/')
+            if not path:
+                continue
+            if path.startswith('/'):
+                physical = ('',) + tuple(path[1:].split('/'))
+            else:
+                physical = base + tuple(path.split('/'))
+            items[physical] = None
+        if items:
+            self._runClone(items=items)
+        status = dict(('/'.join(path), value)
+                      for path, value in items.items())
+
+        if REQUEST is not None:
+            REQUEST['RESPONSE'].setHeader('Content-Type', 'application/json')
+            REQUEST['RESPONSE'].setHeader('Cache-Control', 'no-cache')
+            return json.dumps(status, sort_keys=True)
+        return status
+
 InitializeClass(Dumper)
 
+#   Built-in handlers;  other products register theirs the same way.
+_HANDLERS = ( ( 'DTML Method', Dumper._dumpDTMLMethod )
+            , ( 'DTML Document', Dumper._dumpDTMLDocument )
+            , ( 'Folder', Dumper._dumpFolder )
+            , ( 'BTreeFolder2', Dumper._dumpFolder )
+            , ( 'External Method', Dumper._dumpExternalMethod )
+            , ( 'File', Dumper._dumpFileOrImage )
+            , ( 'Image', Dumper._dumpFileOrImage )
+            , ( 'Python Method', Dumper._dumpPythonMethod )
+            , ( 'Script (Python)', Dumper._dumpPythonScript )
+            , ( 'Controller Python Script'
+              , Dumper._dumpControllerPythonScript )
+            , ( 'Controller Validator'
+              , Dumper._dumpValidatorScript )
+            , ( 'Controller Page Template'
+              , Dumper._dumpControllerPageTemplate )
+            , ( 'Page Template', Dumper._dumpPageTemplate )
+            , ( 'Z SQL Method', Dumper._dumpSQLMethod )
+            , ( 'ZCatalog', Dumper._dumpZCatalog )
+            , ( 'Z Class', Dumper._dumpZClass )
+            , ( 'Common Instance Property Sheet'
+              , Dumper._dumpZClassPropertySheet )
+            , ( 'Zope Permission', Dumper._dumpPermission )
+            , ( 'Zope Factory', Dumper._dumpFactory )
+            , ( 'Wizard', Dumper._dumpWizard )
+            , ( 'Wizard Page', Dumper._dumpWizardPage )
+            , ( 'Formulator Form', Dumper._dumpFormulatorForm )
+           #, ( 'SQL DB Conn', Dumper._dumpDBConn )
+            , ( 'ZWiki Page', Dumper._dumpZWikiPage )
+            )
+
+def _registerHandlers():
+    for meta_type, handler in _HANDLERS:
+        registerHandler( handler, meta_type )
+
+_registerHandlers()
+
+#   Cleaning up the global registry (e.g. between tests) drops them.
+try:
+    from zope.testing.cleanup import addCleanUp
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+else:
+    addCleanUp( _registerHandlers )
+    del addCleanUp
+
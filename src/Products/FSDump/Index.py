@@ -0,0 +1,197 @@
+""" Classes: DumpIndex
+
+$Id$
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from Products.FSDump.Output import _digestFile
+
+INDEX_FILENAME = '.fsdump_index.sqlite'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects
+    ( path TEXT PRIMARY KEY
+    , meta_type TEXT NOT NULL
+    , serial TEXT
+    , mtime REAL
+    , run INTEGER NOT NULL
+    );
+CREATE TABLE IF NOT EXISTS files
+    ( filename TEXT PRIMARY KEY
+    , path TEXT NOT NULL
+    , size INTEGER NOT NULL
+    , sha1 TEXT
+    );
+CREATE INDEX IF NOT EXISTS files_by_path ON files ( path );
+CREATE TABLE IF NOT EXISTS info
+    ( name TEXT PRIMARY KEY
+    , value TEXT
+    );
+"""
+
+
+def _below( path ):
+    #   Return the bounds of the keys below path, for a range query.
+    return ( path + '/', path + '0' )   # '0' sorts right after '/'
+
+
+class DumpIndex:
+    """ SQLite database describing the objects of a dump, and their files.
+
+    o Table 'objects' has a row per object dumped:  its physical 'path',
+      'meta_type', hex-encoded 'serial', '_p_mtime' and the 'run' which
+      last saw it;  table 'files' has a row per file written, with the
+      object's 'path', the file's 'filename' relative to 'fspath', its
+      'size' and its 'sha1' digest.  Table 'info' records the 'settings'
+      and the time the last run 'finished'.
+
+    o The database is updated in place:  rows of objects which a run
+      doesn't dump again (see 'keep') are left alone, and a complete run
+      removes the rows of the objects it didn't see.  Each run's changes
+      are committed at once, when it finishes.
+
+    o 'settings' captures the dumper options which affect the output;
+      rows written with different settings are discarded.  'fresh' tells
+      whether the database held no rows when the run started.
+    """
+    flush_size = 1000
+
+    def __init__( self, fspath, settings=None ):
+        self.fspath = fspath
+        self.settings = settings or {}
+        self.run = None
+        self.fresh = True
+        self._db = None
+        self._rows = []
+        self._kept = set()
+        self._lock = threading.Lock()
+
+    def _getFilename( self ):
+        return os.path.join( self.fspath, INDEX_FILENAME )
+
+    def open( self ):
+        #   Start a run, in a transaction of its own.
+        os.makedirs( self.fspath, exist_ok=True )
+        db = self._db = sqlite3.connect( self._getFilename()
+                                       , isolation_level=None
+                                       , check_same_thread=False
+                                       )
+        db.executescript( _SCHEMA )
+        db.execute( 'BEGIN IMMEDIATE' )
+        info = dict( db.execute( 'SELECT name, value FROM info' ) )
+        settings = json.dumps( self.settings, sort_keys=True )
+        if info.get( 'settings' ) != settings:
+            db.execute( 'DELETE FROM objects' )
+            db.execute( 'DELETE FROM files' )
+        self.fresh = not db.execute( 'SELECT 1 FROM objects LIMIT 1'
+                                   ).fetchone()
+        self.run = int( info.get( 'run', 0 ) ) + 1
+        db.executemany( 'INSERT OR REPLACE INTO info VALUES ( ?, ? )'
+                      , [ ( 'settings', settings )
+                        , ( 'run', str( self.run ) )
+                        ] )
+
+    def record( self, path, meta_type, serial, mtime, files ):
+        """ Record the object at 'path', replacing its files with 'files',
+            a sequence of ( filename, size, sha1, source ):  if 'sha1' is
+            None, the digest of the file at 'source', if any, is used.
+
+        o Ignored for objects kept in this run.
+        """
+        files = [ ( filename, size
+                  , sha1 or ( source and _digestFile( source ) ) or None )
+                  for filename, size, sha1, source in files ]
+        with self._lock:
+            if path in self._kept:
+                return
+            self._rows.append( ( path, meta_type, serial, mtime, files ) )
+            if len( self._rows ) >= self.flush_size:
+                self._flush()
+
+    def keep( self, path, subtree=False ):
+        """ Keep the rows of the object at 'path' (and, if 'subtree', of
+            everything below it), as the run didn't dump it again.
+        """
+        with self._lock:
+            self._kept.add( path )
+            self._db.execute( 'UPDATE objects SET run = ? WHERE path = ?'
+                            , ( self.run, path ) )
+            if subtree:
+                self._db.execute( 'UPDATE objects SET run = ?'
+                                  ' WHERE path >= ? AND path < ?'
+                                , ( self.run, ) + _below( path ) )
+
+    def discard( self, path ):
+        """ Remove the rows of the object at 'path', and of everything
+            below it.
+        """
+        with self._lock:
+            self._flush()
+            for table in ( 'objects', 'files' ):
+                self._db.execute( 'DELETE FROM %s WHERE path = ?'
+                                  ' OR ( path >= ? AND path < ? )' % table
+                                , ( path, ) + _below( path ) )
+
+    def finish( self, complete=True ):
+        """ Commit the run;  if 'complete', remove the rows of the objects
+            it didn't see.
+        """
+        with self._lock:
+            self._flush()
+            db = self._db
+            if complete:
+                db.execute( 'DELETE FROM objects WHERE run != ?'
+                          , ( self.run, ) )
+                db.execute( 'DELETE FROM files WHERE path NOT IN'
+                            ' ( SELECT path FROM objects )' )
+            db.execute( 'INSERT OR REPLACE INTO info VALUES ( ?, ? )'
+                      , ( 'finished', str( time.time() ) ) )
+            db.execute( 'COMMIT' )
+            db.close()
+            self._db = None
+
+    def close( self ):
+        #   Abandon an unfinished run.
+        with self._lock:
+            if self._db is not None:
+                self._db.execute( 'ROLLBACK' )
+                self._db.close()
+                self._db = None
+
+    def lookup( self, path ):
+        """ Return the row of the object at 'path' as a dict, with its
+            files under 'files', or None.
+        """
+        db = sqlite3.connect( self._getFilename() )
+        try:
+            db.row_factory = sqlite3.Row
+            row = db.execute( 'SELECT * FROM objects WHERE path = ?'
+                            , ( path, ) ).fetchone()
+            if row is None:
+                return None
+            found = dict( row )
+            found[ 'files' ] = [ dict( file ) for file in db.execute(
+                                    'SELECT filename, size, sha1 FROM files'
+                                    ' WHERE path = ? ORDER BY filename'
+                                  , ( path, ) ) ]
+            return found
+        finally:
+            db.close()
+
+    def _flush( self ):
+        #   Write the buffered rows;  called with the lock held.
+        db = self._db
+        for path, meta_type, serial, mtime, files in self._rows:
+            db.execute( 'DELETE FROM files WHERE path = ?', ( path, ) )
+            db.execute( 'INSERT OR REPLACE INTO objects'
+                        ' VALUES ( ?, ?, ?, ?, ? )'
+                      , ( path, meta_type, serial, mtime, self.run ) )
+            db.executemany( 'INSERT OR REPLACE INTO files VALUES ( ?, ?, ?, ? )'
+                          , [ ( filename, path, size, sha1 )
+                              for filename, size, sha1 in files ] )
+        self._rows = []
@@ -0,0 +1,123 @@
+""" Classes: DumpJob, JobProgress
+
+$Id$
+"""
+
+import logging
+import threading
+import time
+import traceback
+
+LOG = logging.getLogger('Products.FSDump')
+
+#   Jobs by key, see 'getJob';  finished jobs stay until replaced, so
+#   that their outcome can still be polled.
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class JobProgress:
+    """ Counters updated by the dumpers of a background job.
+
+    o Items are 'discovered' when their container's listing is loaded,
+      so the number pending grows as the dump descends the tree.
+    """
+    def __init__( self ):
+        self.started = time.time()
+        self.finished = None
+        self.done = 0
+        self.discovered = 0
+        self.resumed = 0
+        self.current = None
+        self._lock = threading.Lock()
+
+    def discover( self, count ):
+        with self._lock:
+            self.discovered += count
+
+    def begin( self, path ):
+        self.current = path
+
+    def finish( self ):
+        #   Called once per item visited.
+        with self._lock:
+            self.done += 1
+
+    def snapshot( self ):
+        elapsed = ( self.finished or time.time() ) - self.started
+        return { 'started' : self.started
+               , 'elapsed' : elapsed
+               , 'done' : self.done
+               , 'pending' : max( self.discovered - self.done, 0 )
+               , 'resumed' : self.resumed
+               , 'current' : self.current
+               , 'throughput' : elapsed and self.done / elapsed or 0.0
+               }
+
+
+class DumpJob( threading.Thread ):
+    """ Dump the peers of a Dumper in a thread with its own connection.
+
+    o The Dumper is looked up by path in the job's connection, so the
+      job sees the Dumper's settings as last committed.
+
+    o Nothing is committed:  the dump's statistics are kept in memory
+      (see 'Stats.keepStatistics').
+    """
+    def __init__( self, db, app_oid, path ):
+        threading.Thread.__init__( self, name='fsdump:%s' % '/'.join( path ) )
+        self.daemon = True
+        self.db = db
+        self.app_oid = app_oid
+        self.path = path
+        self.progress = JobProgress()
+        self.state = 'pending'
+        self.message = None
+        self.error = None
+
+    def run( self ):
+        self.state = 'running'
+        conn = self.db.open()
+        try:
+            dumper = conn.get( self.app_oid ).unrestrictedTraverse( self.path )
+            try:
+                self.message = dumper._runJob( self.progress )
+                self.state = 'finished'
+            except:
+                self.error = traceback.format_exc()
+                self.state = 'failed'
+                LOG.error( 'Dump job %s failed', '/'.join( self.path )
+                         , exc_info=True )
+        finally:
+            self.progress.finished = time.time()
+            conn.transaction_manager.abort()
+            conn.close()
+
+    def status( self ):
+        """ Return the job's state and progress as plain Python data.
+        """
+        status = self.progress.snapshot()
+        status.update( { 'state' : self.state
+                       , 'message' : self.message
+                       , 'error' : self.error
+                       } )
+        return status
+
+
+def getJob( key ):
+    """ Return the last job started for 'key', or None.
+    """
+    return _jobs.get( key )
+
+
+def startJob( key, db, app_oid, path ):
+    """ Start a job dumping the peers of the Dumper at 'path';  return
+        None if a job for 'key' is already running.
+    """
+    with _jobs_lock:
+        job = _jobs.get( key )
+        if job is not None and job.is_alive():
+            return None
+        job = _jobs[ key ] = DumpJob( db, app_oid, path )
+        job.start()
+        return job
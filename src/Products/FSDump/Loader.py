@@ -0,0 +1,459 @@
+""" Classes: Loader
+
+$Id$
+"""
+
+import ast
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import transaction
+from Acquisition import aq_base
+from ZODB.POSException import ConflictError
+
+from Products.FSDump.Compact import splitCompanions
+
+LOG = logging.getLogger('Products.FSDump')
+
+#   Extensions of the companion files written by the Dumper.
+_METADATA_EXTENSIONS = ( 'metadata', 'properties' )
+
+
+def _parseValue( type, value ):
+    #   Convert a property value as written by '_writeProperties'.
+    if type in ( 'int', 'long' ):
+        return int( value )
+    if type == 'float':
+        return float( value )
+    if type == 'boolean':
+        return value in ( 'True', '1' )
+    if type in ( 'lines', 'tokens', 'multiple selection', 'ulines'
+               , 'utokens' ):
+        if value[ :1 ] in ( '(', '[' ):
+            return tuple( ast.literal_eval( value ) )
+        return tuple( value.split() )
+    if type == 'date':
+        from DateTime.DateTime import DateTime
+        return DateTime( value )
+    return value
+
+
+def readMetadata( filename ):
+    """ Parse a '.properties' or '.metadata' file written by the Dumper.
+
+    o Return a mapping with the lowercased section names as keys:
+      'default' holds ( name, type, value ) tuples ('type' is 'string'
+      if the line didn't give one), 'security' holds ( permission,
+      acquire, roles ) tuples and 'objects' ( id, meta_type ) tuples.
+
+    o Lines without a '=' continue the value of the previous property.
+    """
+    with open( filename, encoding='utf-8' ) as file:
+        return _parseMetadata( file )
+
+
+def _parseMetadata( lines ):
+    #   Parse the lines of a companion file;  see 'readMetadata'.
+    sections = { 'default' : [], 'security' : [], 'objects' : [] }
+    section = sections[ 'default' ]
+    name = None
+    for line in lines:
+        line = line.rstrip( '\n' )
+        if line.startswith( '[' ) and line.endswith( ']' ):
+            section = sections.setdefault( line[ 1:-1 ].lower(), [] )
+            name = None
+            continue
+        if section is sections[ 'objects' ]:
+            if ':' in line:
+                section.append( tuple( line.split( ':', 1 ) ) )
+            continue
+        if section is sections[ 'security' ]:
+            if '=' in line:
+                permission, value = line.split( '=', 1 )
+                acquire, roles = value.split( ':', 1 )
+                section.append( ( permission, int( acquire )
+                                , [ role for role in roles.split( ',' )
+                                    if role ] ) )
+            continue
+        if '=' not in line:
+            if name is not None and line:
+                name, type, value = section.pop()
+                value = '%s\n%s' % ( value, line )
+                section.append( ( name, type, value ) )
+            continue
+        name, value = line.split( '=', 1 )
+        type = 'string'
+        if ':' in name:
+            name, type = name.split( ':', 1 )
+        section.append( ( name, type, value ) )
+    return sections
+
+
+def readListing( filename ):
+    """ Return the ( id, meta_type ) pairs of an '.objects' file.
+    """
+    with open( filename, encoding='utf-8' ) as file:
+        return [ tuple( line.rstrip( '\n' ).split( ':', 1 ) )
+                 for line in file if ':' in line ]
+
+
+class Loader:
+    """ Recreate the objects of a tree written by a Dumper.
+
+    o 'load' reads the listing of a dumped folder ('.objects', or the
+      '[Objects]' section of its '.metadata' file) and creates each item
+      in a container, recursing into folders.
+
+    o The transaction is committed every 'batch_size' objects, with a
+      savepoint (and a trim of the connection cache) every
+      'savepoint_size';  File and Image data is read from disk in chunks
+      straight into a Pdata chain.
+
+    o With 'parallelism', the subtrees of the top-level folders are
+      loaded in a pool of threads, each using its own ZODB connection.
+
+    o Existing items are left alone, unless 'replace' is true:  an item
+      is then deleted in a savepoint, rolled back if its replacement
+      fails to load, and no batch is committed until it has loaded.
+      Items of unsupported metatypes are counted as skipped.
+
+    o Dumps in the compact layout, whose companion files are held by the
+      '.metadata' (or '.properties') index of each folder, are read too.
+    """
+    def __init__( self, batch_size=1000, savepoint_size=100, parallelism=1
+                , replace=False ):
+        self.batch_size = batch_size
+        self.savepoint_size = max( savepoint_size, 1 )
+        self.parallelism = max( parallelism, 1 )
+        self.replace = replace
+        self.counts = { 'created' : 0
+                      , 'existing' : 0
+                      , 'skipped' : 0
+                      , 'errors' : 0
+                      }
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._replacing = 0
+        self._recurse = True
+        self._companions = ( None, {} )
+        self._transaction_manager = transaction.manager
+
+    def load( self, container, dirpath ):
+        """ Load the items of the dumped folder at 'dirpath' into
+            'container', and commit;  return a summary.
+        """
+        jar = getattr( aq_base( container ), '_p_jar', None )
+        if jar is not None:
+            self._transaction_manager = jar.transaction_manager
+        if self.parallelism > 1 and jar is not None:
+            self._loadParallel( container, dirpath )
+        else:
+            self._loadItems( container, dirpath )
+        self._transaction_manager.commit()
+        return self.summarize()
+
+    def summarize( self ):
+        return ( '%(created)d created, %(existing)d existing, '
+                 '%(skipped)d skipped, %(errors)d errors' % self.counts )
+
+    def _count( self, name ):
+        with self._lock:
+            self.counts[ name ] += 1
+
+    def _makeWorker( self ):
+        #   Return a loader sharing this one's counts.
+        worker = self.__class__( self.batch_size, self.savepoint_size, 1
+                               , self.replace )
+        worker.counts = self.counts
+        worker._lock = self._lock
+        return worker
+
+    #
+    #   Reading the dump
+    #
+    def _getListing( self, dirpath ):
+        #   Return the ( id, meta_type ) pairs of the folder at dirpath.
+        objects = os.path.join( dirpath, '.objects' )
+        if os.path.exists( objects ):
+            return readListing( objects )
+        metadata = os.path.join( dirpath, '.metadata' )
+        if os.path.exists( metadata ):
+            return readMetadata( metadata )[ 'objects' ]
+        return []
+
+    def _readCompanion( self, dirpath, filename ):
+        #   Return the parsed companion file of filename in dirpath, or
+        #   its entry in the folder's index, in the compact layout.
+        for extension in _METADATA_EXTENSIONS:
+            fullpath = os.path.join( dirpath, '%s.%s' % ( filename
+                                                        , extension ) )
+            if os.path.exists( fullpath ):
+                return readMetadata( fullpath )
+        text = self._getCompanions( dirpath ).get( filename, '' )
+        return _parseMetadata( text.splitlines() )
+
+    def _getCompanions( self, dirpath ):
+        #   Return the companion files held by the index of the folder at
+        #   dirpath, by name;  the last folder's are cached.
+        cached, companions = self._companions
+        if cached != dirpath:
+            companions = {}
+            for extension in _METADATA_EXTENSIONS:
+                fullpath = os.path.join( dirpath, '.%s' % extension )
+                if os.path.exists( fullpath ):
+                    with open( fullpath, encoding='utf-8' ) as file:
+                        companions = splitCompanions( file.read() )
+                    break
+            self._companions = ( dirpath, companions )
+        return companions
+
+    def _readText( self, dirpath, filename ):
+        fullpath = os.path.join( dirpath, filename )
+        with open( fullpath, encoding='utf-8' ) as file:
+            return file.read()
+
+    #
+    #   Creating objects
+    #
+    def _loadItems( self, container, dirpath ):
+        #   Load the items listed for the folder at dirpath into container.
+        for id, meta_type in self._getListing( dirpath ):
+            self._loadObject( container, dirpath, id, meta_type )
+
+    def _loadObject( self, container, dirpath, id, meta_type ):
+        #   Create one item;  errors are logged and counted.
+        loader = self._loaders.get( meta_type )
+        if loader is None:
+            self._count( 'skipped' )
+            return
+        savepoint = None
+        if container.hasObject( id ):
+            if not self.replace:
+                self._count( 'existing' )
+                return
+            savepoint = self._transaction_manager.savepoint( optimistic=True )
+            container._delObject( id )
+            self._replacing += 1
+        try:
+            loader( self, container, dirpath, id )
+        except ConflictError:
+            raise
+        except:
+            self._count( 'errors' )
+            LOG.error( 'Error loading %s', os.path.join( dirpath, id )
+                     , exc_info=sys.exc_info() )
+            if savepoint is not None:
+                #   Bring back the item being replaced.
+                savepoint.rollback()
+            elif container.hasObject( id ):
+                #   Don't leave a half-made object behind.
+                container._delObject( id )
+            return
+        finally:
+            if savepoint is not None:
+                self._replacing -= 1
+        self._created( container )
+
+    def _created( self, container ):
+        #   Take a savepoint or commit every so many objects.
+        self._count( 'created' )
+        self._pending += 1
+        if self._pending % self.savepoint_size:
+            return
+        if self._pending >= self.batch_size and not self._replacing:
+            self._transaction_manager.commit()
+            self._pending = 0
+        else:
+            self._transaction_manager.savepoint( optimistic=True )
+        jar = getattr( aq_base( container ), '_p_jar', None )
+        if jar is not None:
+            jar.cacheGC()
+
+    def _loadParallel( self, container, dirpath ):
+        #   Create the top-level items, then load the subtrees of the
+        #   folders among them in threads with their own connections.
+        existing = set( container.objectIds() )
+        folders = []
+        self._recurse = False
+        try:
+            for id, meta_type in self._getListing( dirpath ):
+                self._loadObject( container, dirpath, id, meta_type )
+                if ( meta_type in self._folder_types
+                 and ( self.replace or id not in existing )
+                 and container.hasObject( id ) ):
+                    folders.append( id )
+        finally:
+            self._recurse = True
+        self._transaction_manager.commit()
+        self._pending = 0
+
+        db = aq_base( container )._p_jar.db()
+        app_oid = aq_base( container.getPhysicalRoot() )._p_oid
+        parent_path = container.getPhysicalPath()
+
+        def loadFolder( id ):
+            conn = db.open()
+            try:
+                folder = conn.get( app_oid ).unrestrictedTraverse(
+                                                    parent_path + ( id, ) )
+                worker = self._makeWorker()
+                worker._transaction_manager = conn.transaction_manager
+                worker._loadItems( folder, os.path.join( dirpath, id ) )
+                conn.transaction_manager.commit()
+            finally:
+                conn.transaction_manager.abort()
+                conn.close()
+
+        with ThreadPoolExecutor( max_workers=self.parallelism ) as executor:
+            list( executor.map( loadFolder, folders ) )
+
+    def _setProperties( self, obj, properties ):
+        #   Set the properties read from a companion file on obj.
+        for name, type, value in properties:
+            value = _parseValue( type, value )
+            if obj.hasProperty( name ):
+                obj._updateProperty( name, value )
+            else:
+                obj.manage_addProperty( name, value, type )
+
+    def _setSecurity( self, obj, metadata ):
+        #   Restore the permission settings and proxy roles of obj.
+        for name, type, value in metadata[ 'default' ]:
+            if name == 'proxy':
+                obj._proxy_roles = tuple( [ role for role in value.split( ',' )
+                                            if role ] )
+        for permission, acquire, roles in metadata[ 'security' ]:
+            obj.manage_permission( permission, roles, acquire )
+
+    def _getProperty( self, metadata, name, default='' ):
+        for key, type, value in metadata[ 'default' ]:
+            if key == name:
+                return value
+        return default
+
+    #
+    #   Type-specific loaders
+    #
+    def _loadFolder( self, container, dirpath, id ):
+        from OFS.Folder import Folder
+        self._addFolder( container, dirpath, id, Folder( id ) )
+
+    def _loadBTreeFolder( self, container, dirpath, id ):
+        from Products.BTreeFolder2.BTreeFolder2 import BTreeFolder2
+        self._addFolder( container, dirpath, id, BTreeFolder2( id ) )
+
+    def _addFolder( self, container, dirpath, id, folder ):
+        container._setObject( id, folder )
+        folder = container._getOb( id )
+        folderpath = os.path.join( dirpath, id )
+        for extension in _METADATA_EXTENSIONS:
+            fullpath = os.path.join( folderpath, '.%s' % extension )
+            if os.path.exists( fullpath ):
+                self._setProperties( folder
+                                   , readMetadata( fullpath )[ 'default' ] )
+                break
+        if self._recurse:
+            self._loadItems( folder, folderpath )
+
+    def _loadDTMLMethod( self, container, dirpath, id ):
+        from OFS.DTMLMethod import addDTMLMethod
+        metadata = self._readCompanion( dirpath, '%s.dtml' % id )
+        addDTMLMethod( container, id, self._getProperty( metadata, 'title' )
+                     , self._readText( dirpath, '%s.dtml' % id ) )
+        self._setSecurity( container._getOb( id ), metadata )
+
+    def _loadDTMLDocument( self, container, dirpath, id ):
+        from OFS.DTMLDocument import addDTMLDocument
+        metadata = self._readCompanion( dirpath, '%s.dtml' % id )
+        addDTMLDocument( container, id, ''
+                       , self._readText( dirpath, '%s.dtml' % id ) )
+        self._setProperties( container._getOb( id ), metadata[ 'default' ] )
+
+    def _loadFile( self, container, dirpath, id ):
+        from OFS.Image import manage_addFile
+        self._addFileOrImage( container, dirpath, id, manage_addFile )
+
+    def _loadImage( self, container, dirpath, id ):
+        from OFS.Image import manage_addImage
+        self._addFileOrImage( container, dirpath, id, manage_addImage )
+
+    def _addFileOrImage( self, container, dirpath, id, factory ):
+        #   Data is read in chunks by '_read_data', which builds the Pdata
+        #   chain back to front, saving each chunk as it goes.
+        metadata = self._readCompanion( dirpath, id )
+        content_type = self._getProperty( metadata, 'content_type' )
+        factory( container, id, b''
+               , self._getProperty( metadata, 'title' )
+               , self._getProperty( metadata, 'precondition' )
+               , content_type )
+        obj = container._getOb( id )
+        with open( os.path.join( dirpath, id ), 'rb' ) as file:
+            obj.manage_upload( file )
+        if content_type:
+            obj.content_type = content_type
+
+    def _loadPageTemplate( self, container, dirpath, id ):
+        from Products.PageTemplates.ZopePageTemplate import \
+            manage_addPageTemplate
+        metadata = self._readCompanion( dirpath, '%s.pt' % id )
+        manage_addPageTemplate( container, id
+                              , self._getProperty( metadata, 'title' )
+                              , self._readText( dirpath, '%s.pt' % id ) )
+        self._setSecurity( container._getOb( id ), metadata )
+
+    def _loadPythonScript( self, container, dirpath, id ):
+        from Products.PythonScripts.PythonScript import \
+            manage_addPythonScript
+        metadata = self._readCompanion( dirpath, '%s.py' % id )
+        manage_addPythonScript( container, id )
+        obj = container._getOb( id )
+        obj.write( self._readText( dirpath, '%s.py' % id ) )
+        title = self._getProperty( metadata, 'title' )
+        if title:
+            obj.ZPythonScript_setTitle( title )
+        self._setSecurity( obj, metadata )
+
+    def _loadSQLMethod( self, container, dirpath, id ):
+        from Products.ZSQLMethods.SQL import manage_addZSQLMethod
+        text = self._readText( dirpath, '%s.zsql' % id )
+        header, template = text.split( '</dtml-comment>\n', 1 )
+        options = {}
+        for line in header.splitlines()[ 1: ]:
+            name, value = line.split( ':', 1 )
+            options[ name ] = value
+        manage_addZSQLMethod( container, id, options[ 'title' ]
+                            , options[ 'connection_id' ]
+                            , options[ 'arguments' ].strip()
+                            , template )
+        container._getOb( id ).manage_advanced( int( options[ 'max_rows' ] )
+                                              , int( options[ 'max_cache' ] )
+                                              , int( options[ 'cache_time' ] )
+                                              , options[ 'class_name' ]
+                                              , options[ 'class_file' ] )
+
+    def _loadExternalMethod( self, container, dirpath, id ):
+        from Products.ExternalMethod.ExternalMethod import \
+            manage_addExternalMethod
+        metadata = self._readCompanion( dirpath, '%s.em' % id )
+        manage_addExternalMethod( container, id
+                                , self._getProperty( metadata, 'title' )
+                                , self._getProperty( metadata, 'module' )
+                                , self._getProperty( metadata, 'function' ) )
+        self._setSecurity( container._getOb( id ), metadata )
+
+    _loaders = { 'DTML Method'     : _loadDTMLMethod
+               , 'DTML Document'   : _loadDTMLDocument
+               , 'Folder'          : _loadFolder
+               , 'BTreeFolder2'    : _loadBTreeFolder
+               , 'External Method' : _loadExternalMethod
+               , 'File'            : _loadFile
+               , 'Image'           : _loadImage
+               , 'Script (Python)' : _loadPythonScript
+               , 'Page Template'   : _loadPageTemplate
+               , 'Z SQL Method'    : _loadSQLMethod
+               }
+
+    _folder_types = ( 'Folder', 'BTreeFolder2' )
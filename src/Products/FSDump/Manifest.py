@@ -0,0 +1,111 @@
+""" Classes: Manifest
+
+$Id$
+"""
+
+import json
+import os
+from bisect import bisect_left
+
+MANIFEST_FILENAME = '.fsdump_manifest'
+
+
+class Manifest:
+    """ Record of the objects written by a dump, keyed by physical path.
+
+    o The manifest of the previous run is loaded from 'fspath' when the
+      dump starts;  entries for the current run are collected as the
+      handlers complete, and replace the old file when the dump finishes.
+
+    o 'settings' captures the dumper options which affect the output;
+      a manifest written with different settings is ignored.
+    """
+    def __init__( self, fspath, settings=None ):
+        self.fspath = fspath
+        self.settings = settings or {}
+        self.previous = {}
+        self.entries = {}
+        self._sorted = None
+
+    def _getFilename( self ):
+        return os.path.join( self.fspath, MANIFEST_FILENAME )
+
+    def load( self ):
+        #   Read the entries recorded by the previous run, if any.
+        self.previous = {}
+        self._sorted = None
+        try:
+            file = open( self._getFilename(), encoding='utf-8' )
+        except FileNotFoundError:
+            return
+
+        with file:
+            header = file.readline()
+            if not header or json.loads( header ) != self.settings:
+                return
+            for line in file:
+                entry = json.loads( line )
+                self.previous[ entry.pop( 'path' ) ] = entry
+
+    def save( self ):
+        #   Replace the manifest file with the entries of this run.
+        filename = self._getFilename()
+        tempname = '%s.tmp' % filename
+        if not os.path.exists( self.fspath ):
+            os.makedirs( self.fspath )
+        with open( tempname, 'w', encoding='utf-8' ) as file:
+            file.write( '%s\n' % json.dumps( self.settings, sort_keys=True ) )
+            for path in sorted( self.entries ):
+                entry = { 'path' : path }
+                entry.update( self.entries[ path ] )
+                file.write( '%s\n' % json.dumps( entry, sort_keys=True ) )
+        os.replace( tempname, filename )
+
+    def get( self, path ):
+        return self.previous.get( path )
+
+    def record( self, path, state ):
+        self.entries[ path ] = state
+
+    def unchanged( self, path, state ):
+        #   If each item of 'state' matches the previous run's entry for
+        #   'path', carry that entry forward into this run and return it;
+        #   otherwise, return None.
+        previous = self.previous.get( path )
+        if previous is None:
+            return None
+        for name, value in state.items():
+            if previous.get( name ) != value:
+                return None
+        self.entries[ path ] = previous
+        return previous
+
+    def update( self ):
+        #   Start from the previous run's entries, for a dump which only
+        #   revisits some objects.
+        self.entries = dict( self.previous )
+
+    def discard( self, path ):
+        #   Drop this run's entries for 'path' and everything below it.
+        prefix = path + '/'
+        for key in list( self.entries ):
+            if key == path or key.startswith( prefix ):
+                del self.entries[ key ]
+
+    def carry( self, path ):
+        #   Carry the previous run's entries for 'path' and everything
+        #   below it forward into this run;  return them.
+        keys = self._sorted
+        if keys is None:
+            keys = self._sorted = sorted( self.previous )
+        found = [ path ] if path in self.previous else []
+        prefix = path + '/'
+        index = bisect_left( keys, prefix )
+        while index < len( keys ) and keys[ index ].startswith( prefix ):
+            found.append( keys[ index ] )
+            index += 1
+        carried = []
+        for key in found:
+            entry = self.entries[ key ] = self.previous[ key ]
+            carried.append( entry )
+        return carried
@@ -0,0 +1,912 @@
+""" Classes: FilesystemOutput, ArchiveFileIterator, ArchiveOutput, DiffOutput,
+          GitOutput
+
+$Id$
+"""
+
+import io
+import itertools
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from hashlib import sha1
+
+from ZPublisher.Iterators import filestream_iterator
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LOG = logging.getLogger('Products.FSDump')
+
+_CHUNK_SIZE = 1 << 16
+_tempnames = itertools.count()
+
+#   Archive formats:  ( tarfile mode, or None for zip;  content type ).
+ARCHIVE_FORMATS = { 'tar' : ( 'w|', 'application/x-tar' )
+                  , 'tar.gz' : ( 'w|gz', 'application/gzip' )
+                  , 'tar.bz2' : ( 'w|bz2', 'application/x-bzip2' )
+                  , 'tar.xz' : ( 'w|xz', 'application/x-xz' )
+                  , 'tar.zst' : ( 'w|', 'application/zstd' )
+                  , 'zip' : ( None, 'application/zip' )
+                  }
+
+
+def guessArchiveFormat( filename ):
+    """ Return the archive format matching the extension of 'filename'.
+    """
+    for format in sorted( ARCHIVE_FORMATS, key=len, reverse=True ):
+        if filename.endswith( '.%s' % format ):
+            return format
+    if filename.endswith( '.tgz' ):
+        return 'tar.gz'
+    return None
+
+
+def _digestFile( fullpath ):
+    #   Return the SHA1 hex digest of the file at fullpath.
+    digest = sha1()
+    with open( fullpath, 'rb' ) as file:
+        for chunk in iter( lambda: file.read( _CHUNK_SIZE ), b'' ):
+            digest.update( chunk )
+    return digest.hexdigest()
+
+
+def _makeTempFile( fullpath ):
+    #   Create a temporary file next to fullpath, so that it can be
+    #   renamed over it atomically;  return ( tempname, file ).
+    dirname, basename = os.path.split( fullpath )
+    tempname = os.path.join( dirname, '.%s.%d-%d.tmp'
+                                     % ( basename, os.getpid()
+                                       , next( _tempnames ) ) )
+    fd = os.open( tempname, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666 )
+    return tempname, os.fdopen( fd, 'wb' )
+
+
+class OutputFile:
+    """ File-like object returned by 'FilesystemOutput.openFile'.
+
+    o Content is hashed as it is written, and kept in memory until it
+      outgrows the output's 'spool_size';  larger content is spilled
+      into a temporary file next to the target.
+
+    o Text is encoded as UTF-8.
+    """
+    def __init__( self, output, fullpath ):
+        self.output = output
+        self.fullpath = fullpath
+        self.size = 0
+        self._digest = sha1()
+        self._buffer = io.BytesIO()
+        self._tempname = None
+        self._tempfile = None
+
+    def write( self, data ):
+        if isinstance( data, str ):
+            data = data.encode( 'utf-8' )
+        self._digest.update( data )
+        self.size += len( data )
+        if self._tempfile is not None:
+            self._tempfile.write( data )
+            return
+        self._buffer.write( data )
+        if self.size > self.output.spool_size:
+            self._tempname, self._tempfile = self.output._makeTempFile(
+                                                            self.fullpath )
+            self._tempfile.write( self._buffer.getvalue() )
+            self._buffer = None
+
+    def hexdigest( self ):
+        return self._digest.hexdigest()
+
+    def getvalue( self ):
+        #   Return the content, if it is still held in memory.
+        if self._buffer is None:
+            return None
+        return self._buffer.getvalue()
+
+    def close( self ):
+        if self._tempfile is not None:
+            self._tempfile.close()
+        self.output._commit( self )
+
+    def discard( self ):
+        #   Remove the spilled temporary file, if any.
+        if self._tempname is not None:
+            os.unlink( self._tempname )
+            self._tempname = None
+
+
+class FilesystemOutput:
+    """ Write dumped files, leaving files whose content is unchanged alone.
+
+    o Changed files are written to a temporary file and renamed over the
+      target, so readers never see a partially-written file.
+
+    o Counts of written, unchanged and deleted files are kept for the
+      run's summary;  workers in a parallel dump share one output.
+
+    o The paths of all files produced by the run are kept, so that stale
+      files can be pruned afterwards.
+
+    o Directories are only checked the first time a file is written to
+      them.
+
+    o With 'writers', closed files are queued (at most 'queue_size' at a
+      time) and written by that many threads, so that the filesystem I/O
+      overlaps the traversal;  'flush' waits for them.
+    """
+    spool_size = 1 << 20
+
+    def __init__( self, writers=0, queue_size=64 ):
+        self.written = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self._kept = set()
+        self._dirs = set()
+        self._lock = threading.Lock()
+        self._writers = writers
+        self._queue_size = queue_size
+        self._queue = None
+        self._threads = []
+        self._error = None
+
+    def ensureDirectory( self, fullpath ):
+        """ Create the directory 'fullpath', if it doesn't exist.
+        """
+        if fullpath not in self._dirs:
+            os.makedirs( fullpath, exist_ok=True )
+            self._dirs.add( fullpath )
+
+    def keep( self, fullpath ):
+        """ Mark 'fullpath' as belonging to this run's output.
+        """
+        self._kept.add( fullpath )
+
+    def isKept( self, fullpath ):
+        return fullpath in self._kept
+
+    def _count( self, name ):
+        with self._lock:
+            setattr( self, name, getattr( self, name ) + 1 )
+
+    def openFile( self, fullpath ):
+        """ Return a file-like object for 'fullpath';  closing it commits.
+        """
+        return OutputFile( self, fullpath )
+
+    def copyFile( self, source, fullpath ):
+        """ Copy the file at 'source' (e.g. a committed blob, which is
+            never changed in place) to 'fullpath', unless the copy made
+            last time, which has the same size and mtime, is there.
+        """
+        self.keep( fullpath )
+        self._submit( fullpath, self._copy, source, fullpath )
+
+    def linkFile( self, source, fullpath ):
+        """ Make 'fullpath' a hard link to the file at 'source' (or, where
+            links can't be made, a copy), unless it is one already.
+        """
+        self.keep( fullpath )
+        self._submit( fullpath, self._link, source, fullpath )
+
+    def _link( self, source, fullpath ):
+        try:
+            if os.path.samefile( source, fullpath ):
+                self._count( 'unchanged' )
+                return
+        except FileNotFoundError:
+            pass
+        tempname, tempfile = _makeTempFile( fullpath )
+        tempfile.close()
+        os.unlink( tempname )
+        try:
+            os.link( source, tempname )
+        except OSError:
+            self._copy( source, fullpath )
+            return
+        os.replace( tempname, fullpath )
+        self._count( 'written' )
+
+    def _copy( self, source, fullpath ):
+        info = os.stat( source )
+        try:
+            target = os.stat( fullpath )
+        except FileNotFoundError:
+            target = None
+        if ( target is not None and target.st_size == info.st_size
+                                and target.st_mtime_ns == info.st_mtime_ns ):
+            self._count( 'unchanged' )
+            return
+        tempname, tempfile = _makeTempFile( fullpath )
+        tempfile.close()
+        shutil.copyfile( source, tempname )
+        os.utime( tempname, ns=( info.st_atime_ns, info.st_mtime_ns ) )
+        os.replace( tempname, fullpath )
+        self._count( 'written' )
+
+    def flush( self, raise_errors=True ):
+        """ Wait until the queued files are written, and stop the writer
+            threads;  re-raise the first error met by a writer.
+        """
+        if self._queue is not None:
+            for thread in self._threads:
+                self._queue.put( None )
+            for thread in self._threads:
+                thread.join()
+            self._queue = None
+            self._threads = []
+        error, self._error = self._error, None
+        if error is not None and raise_errors:
+            raise error
+
+    def _submit( self, fullpath, task, *args ):
+        #   Run task, writing fullpath, now or in a writer thread.
+        if not self._writers:
+            task( *args )
+            return
+        if self._queue is None:
+            self._queue = queue.Queue( self._queue_size )
+            for i in range( self._writers ):
+                thread = threading.Thread( target=self._drain
+                                         , args=( self._queue, )
+                                         , name='fsdump-writer-%d' % i )
+                thread.daemon = True
+                thread.start()
+                self._threads.append( thread )
+        self._queue.put( ( fullpath, task, args ) )
+
+    def _drain( self, tasks ):
+        #   Body of a writer thread.
+        while True:
+            item = tasks.get()
+            if item is None:
+                return
+            fullpath, task, args = item
+            try:
+                task( *args )
+            except Exception as error:
+                LOG.error( 'Error writing %s', fullpath, exc_info=True )
+                if self._error is None:
+                    self._error = error
+
+    def removeFile( self, fullpath ):
+        """ Remove the file at 'fullpath'.
+        """
+        os.unlink( fullpath )
+        self._count( 'deleted' )
+
+    def removeDirectory( self, fullpath ):
+        """ Remove the empty directory at 'fullpath'.
+        """
+        os.rmdir( fullpath )
+        self._dirs.discard( fullpath )
+
+    def summarize( self ):
+        return ( '%d written, %d unchanged, %d deleted'
+               % ( self.written, self.unchanged, self.deleted ) )
+
+    def _makeTempFile( self, fullpath ):
+        return _makeTempFile( fullpath )
+
+    def _isUnchanged( self, outfile ):
+        #   Compare size first, then content (or digest, if spilled).
+        try:
+            if os.path.getsize( outfile.fullpath ) != outfile.size:
+                return False
+        except FileNotFoundError:
+            return False
+        value = outfile.getvalue()
+        if value is not None:
+            with open( outfile.fullpath, 'rb' ) as file:
+                return file.read() == value
+        return _digestFile( outfile.fullpath ) == outfile.hexdigest()
+
+    def _commit( self, outfile ):
+        #   Called when 'outfile' is closed.
+        self.keep( outfile.fullpath )
+        self._submit( outfile.fullpath, self._write, outfile )
+
+    def _write( self, outfile ):
+        if self._isUnchanged( outfile ):
+            outfile.discard()
+            self._count( 'unchanged' )
+            return
+        if outfile._tempname is None:
+            outfile._tempname, tempfile = _makeTempFile( outfile.fullpath )
+            with tempfile:
+                tempfile.write( outfile.getvalue() )
+        os.replace( outfile._tempname, outfile.fullpath )
+        outfile._tempname = None
+        self._count( 'written' )
+
+
+class ArchiveFileIterator( filestream_iterator ):
+    """ Stream iterator returning a spooled archive as the response, in
+        chunks, from a temporary file which is removed once opened (or,
+        where an open file can't be removed, once closed).
+    """
+    def __init__( self, name ):
+        filestream_iterator.__init__( self, name )
+        self._tempname = name
+        try:
+            os.unlink( name )
+        except OSError:
+            pass
+        else:
+            self._tempname = None
+
+    def close( self ):
+        filestream_iterator.close( self )
+        if self._tempname is not None:
+            os.unlink( self._tempname )
+            self._tempname = None
+
+
+class ArchiveOutput:
+    """ Write dumped files as the members of a tar or zip archive, written
+        sequentially to 'stream'.
+
+    o Member names are file paths relative to 'root'.
+
+    o Files are buffered (or spilled to a temporary file) until closed,
+      so that each member's size is known when its header is written;
+      members are written one at a time, in the order files are closed.
+
+    o Nothing is compared with, or removed from, the filesystem:  every
+      file is written, and counted as written.
+    """
+    spool_size = 1 << 20
+
+    def __init__( self, stream, format, root ):
+        if format not in ARCHIVE_FORMATS:
+            raise ValueError( 'Unknown archive format: %s' % format )
+        mode, self.content_type = ARCHIVE_FORMATS[ format ]
+        self.root = root
+        self.written = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self._mtime = time.time()
+        self._lock = threading.Lock()
+        self._compressor = None
+        if format == 'tar.zst':
+            if zstandard is None:
+                raise ValueError( 'zstandard is not installed.' )
+            stream = self._compressor = zstandard.ZstdCompressor(
+                                    ).stream_writer( stream, closefd=False )
+        if mode is None:
+            self._tar = None
+            self._zip = zipfile.ZipFile( stream, 'w', zipfile.ZIP_DEFLATED )
+        else:
+            self._tar = tarfile.open( fileobj=stream, mode=mode
+                                    , format=tarfile.PAX_FORMAT )
+            self._zip = None
+
+    def ensureDirectory( self, fullpath ):
+        pass
+
+    def keep( self, fullpath ):
+        pass
+
+    def isKept( self, fullpath ):
+        return True
+
+    def openFile( self, fullpath ):
+        """ Return a file-like object for 'fullpath';  closing it adds it
+            to the archive.
+        """
+        return OutputFile( self, fullpath )
+
+    def copyFile( self, source, fullpath ):
+        """ Add the file at 'source' to the archive, as 'fullpath'.
+        """
+        self._addMember( fullpath, os.path.getsize( source ), source )
+
+    def removeFile( self, fullpath ):
+        raise ValueError( 'Files cannot be removed from an archive.' )
+
+    def flush( self, raise_errors=True ):
+        pass
+
+    def summarize( self ):
+        return '%d archived' % self.written
+
+    def close( self ):
+        """ Finish the archive;  the stream itself is left open.
+        """
+        if self._tar is not None:
+            self._tar.close()
+        else:
+            self._zip.close()
+        if self._compressor is not None:
+            self._compressor.close()
+
+    def _makeTempFile( self, fullpath ):
+        fd, tempname = tempfile.mkstemp( prefix='.fsdump-', suffix='.tmp' )
+        return tempname, os.fdopen( fd, 'wb' )
+
+    def _addMember( self, fullpath, size, filename=None, data=None ):
+        #   Write one member, from 'filename' or from 'data'.
+        name = os.path.relpath( fullpath, self.root ).replace( os.sep, '/' )
+        with self._lock:
+            if self._tar is not None:
+                info = tarfile.TarInfo( name )
+                info.size = size
+                info.mtime = self._mtime
+                info.mode = 0o644
+                if filename is not None:
+                    with open( filename, 'rb' ) as file:
+                        self._tar.addfile( info, file )
+                else:
+                    self._tar.addfile( info, io.BytesIO( data ) )
+            else:
+                info = zipfile.ZipInfo( name
+                                      , time.localtime( self._mtime )[ :6 ] )
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                if filename is not None:
+                    with open( filename, 'rb' ) as file:
+                        with self._zip.open( info, 'w'
+                                           , force_zip64=True ) as member:
+                            shutil.copyfileobj( file, member, _CHUNK_SIZE )
+                else:
+                    self._zip.writestr( info, data )
+            self.written += 1
+
+    def _commit( self, outfile ):
+        #   Called when 'outfile' is closed.
+        if outfile._tempname is None:
+            self._addMember( outfile.fullpath, outfile.size
+                           , data=outfile.getvalue() )
+        else:
+            self._addMember( outfile.fullpath, outfile.size
+                           , filename=outfile._tempname )
+            outfile.discard()
+
+
+class DigestFile:
+    """ File-like object returned by 'DiffOutput.openFile':  content is
+        hashed as it is written, and not kept.
+    """
+    def __init__( self, output, fullpath ):
+        self.output = output
+        self.fullpath = fullpath
+        self.size = 0
+        self._digest = sha1()
+
+    def write( self, data ):
+        if isinstance( data, str ):
+            data = data.encode( 'utf-8' )
+        self._digest.update( data )
+        self.size += len( data )
+
+    def hexdigest( self ):
+        return self._digest.hexdigest()
+
+    def close( self ):
+        self.output._commit( self )
+
+
+class DiffOutput:
+    """ Compare dumped files with the tree under 'root', writing nothing.
+
+    o Files are compared by size, then by SHA1 digest;  only files of
+      the same size as their counterpart on disk are read.
+
+    o Files kept from a previous incremental run (see 'keep') are not
+      dumped again, and are only checked for existence.
+
+    o Files which the pruner would remove are reported as removed;
+      nothing is removed.
+    """
+    def __init__( self, root ):
+        self.root = root
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.unchanged = 0
+        self._kept = set()
+        self._lock = threading.Lock()
+
+    def ensureDirectory( self, fullpath ):
+        pass
+
+    def keep( self, fullpath ):
+        """ Note that 'fullpath' is unchanged since the previous run, if
+            it still exists.
+        """
+        self._kept.add( fullpath )
+        if os.path.isfile( fullpath ):
+            self._note( 'unchanged' )
+        else:
+            self._note( 'added', fullpath )
+
+    def isKept( self, fullpath ):
+        return fullpath in self._kept
+
+    def openFile( self, fullpath ):
+        """ Return a file-like object for 'fullpath';  closing it compares
+            its content with the file on disk.
+        """
+        return DigestFile( self, fullpath )
+
+    def copyFile( self, source, fullpath ):
+        """ Compare the file at 'source' with the one at 'fullpath'.
+        """
+        self._compare( fullpath, os.path.getsize( source )
+                     , lambda: _digestFile( source ) )
+
+    def removeFile( self, fullpath ):
+        self._note( 'removed', fullpath )
+
+    def removeDirectory( self, fullpath ):
+        pass
+
+    def flush( self, raise_errors=True ):
+        pass
+
+    def summarize( self ):
+        return ( '%d added, %d changed, %d removed, %d unchanged'
+               % ( len( self.added ), len( self.changed )
+                 , len( self.removed ), self.unchanged ) )
+
+    def report( self ):
+        """ Return the added, changed and removed paths, relative to
+            'root', as sorted lists keyed by kind.
+        """
+        def relative( paths ):
+            return sorted( os.path.relpath( path, self.root
+                                          ).replace( os.sep, '/' )
+                           for path in paths )
+        return { 'added' : relative( self.added )
+               , 'changed' : relative( self.changed )
+               , 'removed' : relative( self.removed )
+               }
+
+    def _note( self, kind, fullpath=None ):
+        with self._lock:
+            if fullpath is None:
+                self.unchanged += 1
+            else:
+                getattr( self, kind ).append( fullpath )
+
+    def _commit( self, outfile ):
+        #   Called when 'outfile' is closed.
+        self._compare( outfile.fullpath, outfile.size, outfile.hexdigest )
+
+    def _compare( self, fullpath, size, hexdigest ):
+        #   'hexdigest' is only called if the sizes match.
+        self._kept.add( fullpath )
+        try:
+            same = ( os.path.getsize( fullpath ) == size
+                     and _digestFile( fullpath ) == hexdigest() )
+        except FileNotFoundError:
+            self._note( 'added', fullpath )
+            return
+        except IsADirectoryError:
+            same = False
+        if same:
+            self._note( 'unchanged' )
+        else:
+            self._note( 'changed', fullpath )
+
+
+def getGitRef( branch ):
+    """ Return the ref named by 'branch', a branch name or a full name
+        starting with 'refs/';  raise ValueError if git rejects it.
+    """
+    if branch.startswith( 'refs/' ):
+        command = [ 'git', 'check-ref-format', branch ]
+    else:
+        command = [ 'git', 'check-ref-format', '--branch', branch ]
+    result = subprocess.run( command, stdout=subprocess.PIPE
+                           , stderr=subprocess.PIPE )
+    if result.returncode:
+        raise ValueError( 'Dumper Error: invalid git branch name %r.'
+                        % branch )
+    if not branch.startswith( 'refs/' ):
+        branch = 'refs/heads/%s' % branch
+    return branch
+
+
+def _gitBlobId( size, chunks ):
+    #   Return the id git gives a blob of 'size' bytes, read from chunks.
+    digest = sha1( b'blob %d\0' % size )
+    for chunk in chunks:
+        digest.update( chunk )
+    return digest.hexdigest()
+
+
+def _readChunks( filename ):
+    with open( filename, 'rb' ) as file:
+        for chunk in iter( lambda: file.read( _CHUNK_SIZE ), b'' ):
+            yield chunk
+
+
+def _quoteGitPath( name ):
+    #   Quote a path for 'git fast-import', if it needs quoting.
+    if '\n' in name or name.startswith( '"' ):
+        return '"%s"' % ( name.replace( '\\', '\\\\' )
+                              .replace( '"', '\\"' )
+                              .replace( '\n', '\\n' ) )
+    return name
+
+
+class GitOutput:
+    """ Write dumped files as a commit on 'branch' of the git repository
+        at 'repository', through 'git fast-import'.
+
+    o Paths in the commit are file paths relative to 'root'.
+
+    o Files are compared with the tree of the branch's head by blob id:
+      only new and changed files are sent to 'git fast-import', which
+      reuses the trees of the head where nothing changed.
+
+    o Files of the head which the run neither writes nor keeps are
+      dropped from the commit (see 'removeStale'), so that each commit
+      holds one complete dump.  Nothing is written under 'root'.
+
+    o A missing repository is created, as a bare one.  State which must
+      outlive the run (the manifest of an incremental dump) is kept
+      under 'state_path', inside the repository.
+    """
+    spool_size = 1 << 20
+    default_ident = 'FSDump <fsdump@localhost>'
+
+    def __init__( self, repository, branch, root ):
+        self.repository = repository
+        self.ref = getGitRef( branch )
+        self.root = root
+        self.written = 0
+        self.unchanged = 0
+        self.deleted = 0
+        self.commit_id = None
+        self._lock = threading.Lock()
+        self._marks = itertools.count( 1 )
+        self._changes = {}
+        self._seen = set()
+        self._removed = []
+        self._process = None
+
+        if not os.path.exists( repository ):
+            self._git( 'init', '--quiet', '--bare', repository, here=False )
+        git_dir = self._git( 'rev-parse', '--absolute-git-dir' ).strip()
+        self.state_path = os.path.join( git_dir, 'fsdump'
+                                      , *self.ref.split( '/' ) )
+        self.parent = self._git( 'rev-parse', '--verify', '--quiet'
+                               , '%s^{commit}' % self.ref
+                               , check=False ).strip() or None
+        self._tree = {}
+        if self.parent is not None:
+            listing = self._git( 'ls-tree', '-r', '-z', '--full-tree'
+                               , self.parent )
+            for entry in listing.split( '\0' ):
+                if entry:
+                    info, name = entry.split( '\t', 1 )
+                    self._tree[ name ] = info.split()[ 2 ]
+
+    def isCurrent( self ):
+        """ Is the branch's head the commit last made with state?
+        """
+        try:
+            with open( os.path.join( self.state_path, 'HEAD' ) ) as file:
+                return file.read().strip() == self.parent
+        except FileNotFoundError:
+            return False
+
+    def ensureDirectory( self, fullpath ):
+        pass
+
+    def keep( self, fullpath ):
+        """ Keep the head's version of 'fullpath' in the commit.
+        """
+        with self._lock:
+            self._seen.add( self._getName( fullpath ) )
+
+    def isKept( self, fullpath ):
+        return self._getName( fullpath ) in self._seen
+
+    def openFile( self, fullpath ):
+        """ Return a file-like object for 'fullpath';  closing it adds
+            it to the commit, if its content changed.
+        """
+        return OutputFile( self, fullpath )
+
+    def copyFile( self, source, fullpath ):
+        """ Add the file at 'source' to the commit, as 'fullpath'.
+        """
+        self._add( fullpath, os.path.getsize( source ), filename=source )
+
+    def removeFile( self, fullpath ):
+        with self._lock:
+            name = self._getName( fullpath )
+            self._seen.discard( name )
+            self._changes.pop( name, None )
+
+    def removeDirectory( self, fullpath ):
+        pass
+
+    def flush( self, raise_errors=True ):
+        pass
+
+    def removeStale( self, protected=() ):
+        """ Drop the files of the head which this run didn't produce from
+            the commit, except those of the objects at 'protected' (file
+            paths without extension, of objects and subtrees).
+        """
+        prefixes = tuple( self._getName( path ) for path in protected )
+        with self._lock:
+            self._removed = []
+            for name in self._tree:
+                if name in self._seen:
+                    continue
+                for prefix in prefixes:
+                    if ( name == prefix
+                      or name.startswith( prefix + '.' )
+                      or name.startswith( prefix + '/' ) ):
+                        break
+                else:
+                    self._removed.append( name )
+            self.deleted = len( self._removed )
+
+    def summarize( self ):
+        return ( '%d written, %d unchanged, %d deleted'
+               % ( self.written, self.unchanged, self.deleted ) )
+
+    def commit( self, message, keep_state=False ):
+        """ Commit the files written, and the removals, to the branch;
+            return the commit's id.  If nothing changed, the head is
+            left alone and returned.
+
+        o If 'keep_state', the commit is recorded as the one described
+          by the state under 'state_path';  otherwise, that state is
+          invalidated.
+        """
+        with self._lock:
+            if self._changes or self._removed or self.parent is None:
+                stream = self._getStream()
+                ident = self._getIdent()
+                message = message.encode( 'utf-8' )
+                lines = [ 'commit %s' % self.ref
+                        , 'author %s' % ident
+                        , 'committer %s' % ident
+                        , 'data %d' % len( message )
+                        ]
+                stream.write( ( '\n'.join( lines ) + '\n' ).encode( 'utf-8' ) )
+                stream.write( message + b'\n' )
+                lines = []
+                if self.parent is not None:
+                    lines.append( 'from %s' % self.parent )
+                for name in sorted( self._removed ):
+                    lines.append( 'D %s' % _quoteGitPath( name ) )
+                for name, mark in sorted( self._changes.items() ):
+                    lines.append( 'M 100644 :%d %s'
+                                % ( mark, _quoteGitPath( name ) ) )
+                lines.extend( [ '', 'done', '' ] )
+                stream.write( '\n'.join( lines ).encode( 'utf-8'
+                                                      , 'surrogateescape' ) )
+                self._finishProcess()
+                self.commit_id = self._git( 'rev-parse', self.ref ).strip()
+            else:
+                self.commit_id = self.parent
+
+        marker = os.path.join( self.state_path, 'HEAD' )
+        if keep_state:
+            os.makedirs( self.state_path, exist_ok=True )
+            with open( marker, 'w' ) as file:
+                file.write( '%s\n' % self.commit_id )
+        elif os.path.exists( marker ):
+            os.unlink( marker )
+        return self.commit_id
+
+    def close( self ):
+        """ Stop 'git fast-import', if a commit wasn't made:  the blobs
+            sent are left for git's garbage collection.
+        """
+        if self._process is not None:
+            try:
+                self._process.stdin.write( b'done\n' )
+            except OSError:
+                pass
+            self._finishProcess( check=False )
+
+    def _git( self, *args, **kw ):
+        #   Run a git command in the repository;  return its output.
+        command = [ 'git' ]
+        if kw.get( 'here', True ):
+            command.extend( [ '-C', self.repository ] )
+        command.extend( args )
+        result = subprocess.run( command, stdout=subprocess.PIPE
+                               , stderr=subprocess.PIPE )
+        if kw.get( 'check', True ) and result.returncode:
+            raise ValueError( 'git %s failed: %s'
+                            % ( args[ 0 ], result.stderr.decode( 'utf-8'
+                                                              , 'replace' ) ) )
+        return result.stdout.decode( 'utf-8', 'surrogateescape' )
+
+    def _getIdent( self ):
+        #   Return git's identity of the committer, with the current time,
+        #   or our default one.
+        try:
+            return self._git( 'var', 'GIT_COMMITTER_IDENT' ).strip()
+        except ValueError:
+            return '%s %d +0000' % ( self.default_ident, time.time() )
+
+    def _getName( self, fullpath ):
+        return os.path.relpath( fullpath, self.root ).replace( os.sep, '/' )
+
+    def _getStream( self ):
+        #   Return the input of 'git fast-import', starting it if needed;
+        #   called with the lock held.
+        if self._process is None:
+            self._process = subprocess.Popen(
+                                [ 'git', '-C', self.repository, 'fast-import'
+                                , '--quiet', '--done', '--date-format=raw' ]
+                              , stdin=subprocess.PIPE
+                              , stdout=subprocess.DEVNULL
+                              , stderr=subprocess.PIPE
+                              )
+        return self._process.stdin
+
+    def _finishProcess( self, check=True ):
+        process, self._process = self._process, None
+        process.stdin.close()
+        error = process.stderr.read()
+        process.stderr.close()
+        if process.wait() and check:
+            raise ValueError( 'git fast-import failed: %s'
+                            % error.decode( 'utf-8', 'replace' ) )
+
+    def _makeTempFile( self, fullpath ):
+        fd, tempname = tempfile.mkstemp( prefix='.fsdump-', suffix='.tmp' )
+        return tempname, os.fdopen( fd, 'wb' )
+
+    def _add( self, fullpath, size, filename=None, data=None ):
+        #   Send the content, from 'filename' or from 'data', as a blob,
+        #   unless the head has the same.
+        name = self._getName( fullpath )
+        if filename is not None:
+            blob_id = _gitBlobId( size, _readChunks( filename ) )
+        else:
+            blob_id = _gitBlobId( size, [ data ] )
+        with self._lock:
+            self._seen.add( name )
+            if self._tree.get( name ) == blob_id:
+                self._changes.pop( name, None )
+                self.unchanged += 1
+                return
+            mark = next( self._marks )
+            stream = self._getStream()
+            try:
+                stream.write( b'blob\nmark :%d\ndata %d\n' % ( mark, size ) )
+                if filename is not None:
+                    for chunk in _readChunks( filename ):
+                        stream.write( chunk )
+                else:
+                    stream.write( data )
+                stream.write( b'\n' )
+            except BrokenPipeError:
+                self._finishProcess()
+                raise
+            self._changes[ name ] = mark
+            self.written += 1
+
+    def _commit( self, outfile ):
+        #   Called when 'outfile' is closed.
+        if outfile._tempname is None:
+            self._add( outfile.fullpath, outfile.size
+                     , data=outfile.getvalue() )
+        else:
+            try:
+                self._add( outfile.fullpath, outfile.size
+                         , filename=outfile._tempname )
+            finally:
+                outfile.discard()
@@ -0,0 +1,175 @@
+""" Classes: MetatypeHandler, HandlerMapping
+
+$Id$
+"""
+
+import warnings
+from collections.abc import MutableMapping
+
+from Acquisition import aq_base
+from zope.component import getGlobalSiteManager
+from zope.interface import Interface
+from zope.interface import implementedBy
+from zope.interface import implementer
+
+from Products.FSDump.interfaces.MetatypeDumper import MetatypeDumper
+
+#   Handlers by ( class, meta_type ), and the meta_types for which any
+#   handler is registered;  both are reset whenever a handler is.
+_cache = {}
+_meta_types = []
+
+
+@implementer( MetatypeDumper )
+class MetatypeHandler:
+    """ Adapt a plain function or method to MetatypeDumper.
+    """
+    def __init__( self, func, leaf_only=False ):
+        self.func = func
+        self.leaf_only = leaf_only
+
+    def __call__( self, dumper, object, path=None ):
+        return self.func( dumper, object, path )
+
+
+def registerHandler( handler, meta_type=None, for_=None, leaf_only=False ):
+    """ Register 'handler' to dump objects of 'meta_type', or objects
+        providing interface 'for_' (or both).
+
+    o 'handler' is called as 'handler( dumper, object, path )';  if it
+      doesn't provide MetatypeDumper, it is wrapped in a MetatypeHandler.
+
+    o 'leaf_only' declares that the handler dumps nothing below the
+      object.  The traversal only lists a container's items when its
+      handler asks for them (see 'Dumper._dumpChildren'), and never
+      loads items without a handler, so a leaf-only handler already
+      spares the object's 'objectValues()';  the flag also lets an
+      incremental dump trust the serial of a folderish object (whose
+      items it would otherwise revisit) and skip it when unchanged.
+
+    o Handlers are registered as named adapters of the global site
+      manager;  they must be registered through this function (or
+      'unregisterHandler'), which resets the lookup cache.  The cache is
+      also reset when the global registry is cleaned up by
+      'zope.testing.cleanup'.
+    """
+    if meta_type is None and for_ is None:
+        raise ValueError( 'Handler needs a meta_type or an interface.' )
+    if not MetatypeDumper.providedBy( handler ):
+        handler = MetatypeHandler( handler, leaf_only )
+    getGlobalSiteManager().registerAdapter( handler
+                                          , ( for_ or Interface, )
+                                          , MetatypeDumper
+                                          , meta_type or ''
+                                          )
+    _resetCache()
+
+
+def unregisterHandler( meta_type=None, for_=None ):
+    """ Remove the handler registered for 'meta_type' and 'for_'.
+    """
+    getGlobalSiteManager().unregisterAdapter( required=( for_ or Interface, )
+                                            , provided=MetatypeDumper
+                                            , name=meta_type or ''
+                                            )
+    _resetCache()
+
+
+class HandlerMapping( MutableMapping ):
+    """ Deprecated stand-in for the Dumper's former '_handlers' dict,
+        mapping meta_types to the handlers registered for them.
+
+    o Setting or deleting a key registers or unregisters a handler;
+      use 'registerHandler' and 'unregisterHandler' instead.
+    """
+    def _warn( self ):
+        warnings.warn( "'Dumper._handlers' is deprecated:  use"
+                       " 'Products.FSDump.Registry.registerHandler'."
+                     , DeprecationWarning, stacklevel=3 )
+
+    def _registered( self ):
+        #   Return the registrations by meta_type, for any interface.
+        return dict( [ ( registration.name, registration.factory )
+                       for registration
+                        in getGlobalSiteManager().registeredAdapters()
+                       if registration.provided is MetatypeDumper
+                      and registration.name
+                      and registration.required == ( Interface, ) ] )
+
+    def __getitem__( self, meta_type ):
+        self._warn()
+        handler = self._registered()[ meta_type ]
+        return getattr( handler, 'func', handler )
+
+    def __setitem__( self, meta_type, handler ):
+        self._warn()
+        registerHandler( handler, meta_type )
+
+    def __delitem__( self, meta_type ):
+        self._warn()
+        if meta_type not in self._registered():
+            raise KeyError( meta_type )
+        unregisterHandler( meta_type )
+
+    def __contains__( self, meta_type ):
+        return meta_type in self._registered()
+
+    def __iter__( self ):
+        return iter( sorted( self._registered() ) )
+
+    def __len__( self ):
+        return len( self._registered() )
+
+
+def _resetCache():
+    _cache.clear()
+    del _meta_types[ : ]
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+else:
+    addCleanUp( _resetCache )
+    del addCleanUp
+
+
+def lookupHandler( object ):
+    """ Return the handler for 'object', or None.
+
+    o A handler registered for the object's meta_type wins over one
+      registered for its interfaces only;  among either, the one for the
+      most specific interface wins.
+
+    o Results are cached per class and meta_type:  interfaces provided
+      directly by an instance are not consulted.
+    """
+    klass = aq_base( object ).__class__
+    meta_type = getattr( object, 'meta_type', '' )
+    key = ( klass, meta_type )
+    try:
+        return _cache[ key ]
+    except KeyError:
+        pass
+
+    required = ( implementedBy( klass ), )
+    adapters = getGlobalSiteManager().adapters
+    handler = None
+    if meta_type:
+        handler = adapters.lookup( required, MetatypeDumper, meta_type )
+    if handler is None:
+        handler = adapters.lookup( required, MetatypeDumper, '' )
+    _cache[ key ] = handler
+    return handler
+
+
+def getHandledMetaTypes():
+    """ Return the meta_types for which a handler is registered, or None
+        if handlers registered by interface only make that unknowable.
+    """
+    if not _meta_types:
+        names = set( [ registration.name for registration
+                         in getGlobalSiteManager().registeredAdapters()
+                        if registration.provided is MetatypeDumper ] )
+        _meta_types.append( '' not in names and names or None )
+    return _meta_types[ 0 ]
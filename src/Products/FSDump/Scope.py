@@ -0,0 +1,103 @@
+""" Classes: DumpScope
+
+$Id$
+"""
+
+from fnmatch import fnmatchcase
+
+
+def _split( pattern ):
+    #   Patterns not anchored with a leading '/' match at any depth.
+    pattern = pattern.strip()
+    if pattern.startswith( '/' ):
+        return tuple( pattern.strip( '/' ).split( '/' ) )
+    return ( '**', ) + tuple( pattern.strip( '/' ).split( '/' ) )
+
+
+def _match( names, parts ):
+    #   Does the path 'names' match all of the pattern 'parts'?
+    if not parts:
+        return not names
+    if parts[ 0 ] == '**':
+        for i in range( len( names ) + 1 ):
+            if _match( names[ i: ], parts[ 1: ] ):
+                return True
+        return False
+    return ( bool( names )
+         and fnmatchcase( names[ 0 ], parts[ 0 ] )
+         and _match( names[ 1: ], parts[ 1: ] ) )
+
+
+def _matchPrefix( names, parts ):
+    #   May paths below 'names' match the pattern 'parts'?
+    if not names:
+        return True
+    if not parts:
+        return False
+    if parts[ 0 ] == '**':
+        return True
+    return ( fnmatchcase( names[ 0 ], parts[ 0 ] )
+         and _matchPrefix( names[ 1: ], parts[ 1: ] ) )
+
+
+class DumpScope:
+    """ Select the objects a dump visits, by path and by meta_type.
+
+    o Paths are physical paths, e.g. '/site/temp_folder';  patterns are
+      matched segment by segment, with the wildcards of 'fnmatch' within
+      a segment, and '**' for any number of segments.  A pattern without
+      a leading '/' matches at any depth.
+
+    o An object whose path matches one of 'exclude_paths' is skipped,
+      with everything below it.  If 'include_paths' are given, only the
+      objects matching one of them, with everything below them and the
+      containers leading to them, are visited.
+
+    o If 'include_meta_types' are given, only objects of those meta_types
+      are visited (list 'Folder' to descend into folders);  objects of
+      'exclude_meta_types' are skipped, with everything below them.
+    """
+    def __init__( self
+                , include_paths=()
+                , exclude_paths=()
+                , include_meta_types=()
+                , exclude_meta_types=()
+                ):
+        self.include_paths = [ _split( pattern ) for pattern in include_paths
+                               if pattern.strip() ]
+        self.exclude_paths = [ _split( pattern ) for pattern in exclude_paths
+                               if pattern.strip() ]
+        self.include_meta_types = set( include_meta_types )
+        self.exclude_meta_types = set( exclude_meta_types )
+
+    def filtersPaths( self ):
+        return bool( self.include_paths or self.exclude_paths )
+
+    def allowsMetaType( self, meta_type ):
+        if meta_type in self.exclude_meta_types:
+            return False
+        if self.include_meta_types:
+            return meta_type in self.include_meta_types
+        return True
+
+    def allowsPath( self, path ):
+        """ Should the object at physical 'path' be visited, given that
+            its container is?
+        """
+        names = tuple( path[ 1: ] )
+        for parts in self.exclude_paths:
+            if _match( names, parts ):
+                return False
+        if not self.include_paths:
+            return True
+        for parts in self.include_paths:
+            if _matchPrefix( names, parts ):
+                return True
+            for i in range( 1, len( names ) ):
+                if _match( names[ :i ], parts ):
+                    return True
+        return False
+
+    def allows( self, object ):
+        return ( self.allowsMetaType( getattr( object, 'meta_type', '' ) )
+             and self.allowsPath( object.getPhysicalPath() ) )
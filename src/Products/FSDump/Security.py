@@ -0,0 +1,108 @@
+""" Classes: SecurityExporter
+
+$Id$
+"""
+
+from AccessControl.Permission import Permission
+from AccessControl.Permission import pname
+from Acquisition import aq_base
+from Acquisition import aq_inner
+from Acquisition import aq_parent
+
+
+class SecurityExporter:
+    """ Write the '[security]' section of a metadata file, as computed
+        from 'valid_roles' and 'permission_settings', at the cost of a
+        few attribute reads per object.
+
+    o The permissions of a class, the name of the attribute holding each
+      one's roles, and the instance attributes which may override them,
+      are computed once per class;  the valid roles are computed once per
+      container, by physical path.
+
+    o Only the permissions whose roles the object (or its class) sets
+      are looked at:  the others are acquired and grant no role, and so
+      yield no row.
+
+    o The exporter holds no persistent objects, and may be shared by the
+      workers of a run.
+    """
+    def __init__( self ):
+        self._classes = {}
+        self._roles = {}
+
+    def write( self, obj, file ):
+        """ Write the rows of the permissions 'obj' doesn't acquire, or
+            grants to some role, to 'file'.
+        """
+        base = aq_base( obj )
+        if getattr( base, '_p_changed', 0 ) is None:
+            base._p_activate()
+        state = getattr( base, '__dict__', {} )
+        if '__ac_permissions__' in state:
+            permissions, keys, defaults = self._analyze( obj )
+        else:
+            klass = base.__class__
+            try:
+                permissions, keys, defaults = self._classes[ klass ]
+            except KeyError:
+                info = self._classes[ klass ] = self._analyze( obj )
+                permissions, keys, defaults = info
+
+        found = set( defaults )
+        for key in state:
+            indexes = keys.get( key )
+            if indexes is not None:
+                found.update( indexes )
+        if not found:
+            return
+
+        valid_roles = self._getValidRoles( obj )
+        header_written = False
+        for index in sorted( found ):
+            name, data = permissions[ index ]
+            roles = Permission( name, data, base ).getRoles( default=[] )
+            acquire = isinstance( roles, list ) and 1 or 0
+            roles = [ role for role in valid_roles if role in roles ]
+            if roles or not acquire:
+                if not header_written:
+                    header_written = True
+                    file.write( '\n[security]\n' )
+                file.write( '%s=%d:%s\n' % ( name, acquire, ','.join( roles ) ) )
+
+    def _analyze( self, obj ):
+        #   Return the permissions of obj, as ( name, data ) in the order
+        #   of 'permission_settings';  a mapping from each instance
+        #   attribute which may set their roles to their indexes;  and the
+        #   indexes of those whose roles the class sets.
+        klass = aq_base( obj ).__class__
+        permissions = []
+        keys = {}
+        defaults = []
+        for index, permission in enumerate( obj.ac_inherited_permissions( 1 ) ):
+            name, data = permission[ :2 ]
+            permissions.append( ( name, data ) )
+            attribute = pname( name )
+            keys.setdefault( attribute, [] ).append( index )
+            if hasattr( klass, attribute ):
+                defaults.append( index )
+            for attr_name in data:
+                keys.setdefault( '%s__roles__' % attr_name, [] ).append( index )
+        return permissions, keys, defaults
+
+    def _getValidRoles( self, obj ):
+        #   Return obj's 'valid_roles', from those of its container.
+        own = getattr( aq_base( obj ), '__ac_roles__', () )
+        parent = aq_parent( aq_inner( obj ) )
+        if parent is None:
+            return tuple( sorted( set( own ) ) )
+        key = parent.getPhysicalPath()
+        try:
+            roles, ordered = self._roles[ key ]
+        except KeyError:
+            ordered = parent.valid_roles()
+            roles = frozenset( ordered )
+            self._roles[ key ] = roles, ordered
+        if roles.issuperset( own ):
+            return ordered
+        return tuple( sorted( roles.union( own ) ) )
@@ -0,0 +1,150 @@
+""" Classes: DumpStats
+
+$Id$
+"""
+
+import heapq
+import json
+import threading
+import time
+import traceback
+
+#   Snapshots of the last dump of each Dumper, by key;  kept in memory
+#   only, so that dumping never writes to the ZODB.
+_last_stats = {}
+
+
+def keepStatistics( key, snapshot ):
+    """ Remember 'snapshot' as the statistics of the last dump for 'key'.
+    """
+    _last_stats[ key ] = snapshot
+
+
+def getStatistics( key ):
+    """ Return the statistics of the last dump for 'key', or None.
+    """
+    return _last_stats.get( key )
+
+
+def _clearStatistics():
+    _last_stats.clear()
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+else:
+    addCleanUp( _clearStatistics )
+    del addCleanUp
+
+
+class DumpStats:
+    """ Collect per-metatype and per-path measurements for one dump.
+
+    o Handler times are exclusive:  the time spent dumping the items of
+      a folder is charged to those items, not to the folder.
+
+    o Only the slowest 'max_paths' objects and the first 'max_errors'
+      errors are kept in memory;  if 'log' is given, a JSON line is
+      written to it for each object dumped.
+    """
+    max_paths = 50
+    max_errors = 100
+
+    def __init__( self, log=None ):
+        self.metatypes = {}
+        self.slowest = []
+        self.errors = []
+        self.started = time.time()
+        self.finished = None
+        self._log = log
+        self._lock = threading.Lock()
+
+    def _getMetatype( self, meta_type ):
+        entry = self.metatypes.get( meta_type )
+        if entry is None:
+            entry = self.metatypes[ meta_type ] = { 'count' : 0
+                                                  , 'unchanged' : 0
+                                                  , 'skipped' : 0
+                                                  , 'errors' : 0
+                                                  , 'seconds' : 0.0
+                                                  , 'files' : 0
+                                                  , 'bytes' : 0
+                                                  }
+        return entry
+
+    def record( self, path, meta_type, seconds, files=0, bytes=0
+              , unchanged=False, exc_info=None ):
+        """ Record one handler call.
+        """
+        error = None
+        if exc_info is not None:
+            error = ''.join( traceback.format_exception( *exc_info ) )
+
+        with self._lock:
+            entry = self._getMetatype( meta_type )
+            entry[ 'count' ] += 1
+            entry[ 'seconds' ] += seconds
+            entry[ 'files' ] += files
+            entry[ 'bytes' ] += bytes
+            if unchanged:
+                entry[ 'unchanged' ] += 1
+            if error is not None:
+                entry[ 'errors' ] += 1
+                if len( self.errors ) < self.max_errors:
+                    self.errors.append( ( path, meta_type, error ) )
+
+            item = ( seconds, path, meta_type )
+            if len( self.slowest ) < self.max_paths:
+                heapq.heappush( self.slowest, item )
+            elif item > self.slowest[ 0 ]:
+                heapq.heapreplace( self.slowest, item )
+
+            if self._log is not None:
+                self._log.write( '%s\n' % json.dumps(
+                                { 'path' : path
+                                , 'meta_type' : meta_type
+                                , 'seconds' : round( seconds, 6 )
+                                , 'files' : files
+                                , 'bytes' : bytes
+                                , 'unchanged' : unchanged
+                                , 'error' : error
+                                }, sort_keys=True ) )
+
+    def skip( self, meta_type, count=1 ):
+        """ Record objects for whose metatype there is no handler.
+        """
+        with self._lock:
+            self._getMetatype( meta_type )[ 'skipped' ] += count
+
+    def getErrorCount( self ):
+        return sum( [ entry[ 'errors' ]
+                      for entry in self.metatypes.values() ] )
+
+    def close( self ):
+        self.finished = time.time()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def snapshot( self ):
+        """ Return the collected measurements as plain Python data.
+        """
+        metatypes = [ dict( entry, meta_type=meta_type )
+                      for meta_type, entry in self.metatypes.items() ]
+        metatypes.sort( key=lambda entry: -entry[ 'seconds' ] )
+        slowest = [ { 'path' : path
+                    , 'meta_type' : meta_type
+                    , 'seconds' : seconds
+                    } for seconds, path, meta_type
+                       in sorted( self.slowest, reverse=True ) ]
+        errors = [ { 'path' : path
+                   , 'meta_type' : meta_type
+                   , 'traceback' : error
+                   } for path, meta_type, error in self.errors ]
+        return { 'started' : self.started
+               , 'finished' : self.finished or time.time()
+               , 'metatypes' : metatypes
+               , 'slowest' : slowest
+               , 'errors' : errors
+               }
@@ -0,0 +1,166 @@
+""" Classes: ContentStore
+
+$Id$
+"""
+
+import json
+import os
+import threading
+from hashlib import sha1
+
+from Products.FSDump.Output import _makeTempFile
+
+STORE_DIRNAME = '.fsdump_store'
+DIGESTS_FILENAME = 'digests'
+
+
+class ContentStore:
+    """ Content-addressed store of the file payloads of a dump, under
+        'fspath':  each distinct payload is written once, as
+        'xx/<sha1>', and the files of the dump are hard links to it.
+
+    o The digest of each payload is remembered with the oid and serial
+      of the persistent object holding it, so that an unchanged payload
+      is linked again without being read.  The digests seen by a run are
+      saved when it finishes, along with those of earlier runs, for the
+      objects it didn't visit.
+
+    o Payloads linked from nowhere else are removed by 'collect';  the
+      store is only used where hard links can be made (see 'canLink').
+
+    o The store may be shared by the workers of a run.
+    """
+    def __init__( self, fspath ):
+        self.fspath = fspath
+        self.added = 0
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def _getDigestsFilename( self ):
+        return os.path.join( self.fspath, DIGESTS_FILENAME )
+
+    def getFilename( self, digest ):
+        return os.path.join( self.fspath, digest[ :2 ], digest )
+
+    def canLink( self ):
+        """ Can files be hard-linked to payloads in the store?
+        """
+        os.makedirs( self.fspath, exist_ok=True )
+        tempname, tempfile = _makeTempFile(
+                                os.path.join( self.fspath, 'probe' ) )
+        tempfile.close()
+        linkname = '%s.link' % tempname
+        try:
+            os.link( tempname, linkname )
+        except OSError:
+            return False
+        else:
+            os.unlink( linkname )
+            return True
+        finally:
+            os.unlink( tempname )
+
+    def load( self ):
+        #   Read the digests remembered by earlier runs.
+        self._digests = {}
+        try:
+            file = open( self._getDigestsFilename(), encoding='utf-8' )
+        except FileNotFoundError:
+            return
+        with file:
+            for line in file:
+                oid, serial, digest, size = json.loads( line )
+                self._digests[ oid ] = ( serial, digest, size )
+
+    def save( self ):
+        #   Replace the digests file.
+        filename = self._getDigestsFilename()
+        tempname = '%s.tmp' % filename
+        os.makedirs( self.fspath, exist_ok=True )
+        with self._lock:
+            items = sorted( self._digests.items() )
+        with open( tempname, 'w', encoding='utf-8' ) as file:
+            for oid, ( serial, digest, size ) in items:
+                file.write( '%s\n' % json.dumps( [ oid, serial, digest
+                                                 , size ] ) )
+        os.replace( tempname, filename )
+
+    def lookup( self, oid, serial ):
+        """ Return ( filename, size ) of the payload stored for the object
+            'oid' in revision 'serial', or None.
+        """
+        with self._lock:
+            entry = self._digests.get( oid )
+        if entry is None or entry[ 0 ] != serial:
+            return None
+        filename = self.getFilename( entry[ 1 ] )
+        if not os.path.isfile( filename ):
+            return None
+        return filename, entry[ 2 ]
+
+    def add( self, chunks, oid=None, serial=None ):
+        """ Store the payload read from 'chunks', remembering its digest
+            for 'oid' in revision 'serial', if given;  return
+            ( filename, size ) of the stored payload.
+        """
+        os.makedirs( self.fspath, exist_ok=True )
+        tempname, tempfile = _makeTempFile(
+                                os.path.join( self.fspath, 'payload' ) )
+        digest = sha1()
+        size = 0
+        try:
+            with tempfile:
+                for chunk in chunks:
+                    digest.update( chunk )
+                    size += len( chunk )
+                    tempfile.write( chunk )
+            digest = digest.hexdigest()
+            filename = self.getFilename( digest )
+            os.makedirs( os.path.dirname( filename ), exist_ok=True )
+            try:
+                os.link( tempname, filename )
+            except FileExistsError:
+                pass
+            else:
+                with self._lock:
+                    self.added += 1
+        finally:
+            os.unlink( tempname )
+        if oid is not None:
+            with self._lock:
+                self._digests[ oid ] = ( serial, digest, size )
+        return filename, size
+
+    def addFile( self, source, oid=None, serial=None ):
+        """ Store the payload of the file at 'source';  see 'add'.
+        """
+        def chunks():
+            with open( source, 'rb' ) as file:
+                while True:
+                    chunk = file.read( 1 << 16 )
+                    if not chunk:
+                        return
+                    yield chunk
+        return self.add( chunks(), oid, serial )
+
+    def collect( self ):
+        """ Remove the payloads which no file of the dump links to, and
+            forget their digests;  return how many were removed.
+        """
+        removed = set()
+        for dirname, subdirs, filenames in os.walk( self.fspath ):
+            if dirname == self.fspath:
+                continue
+            for filename in filenames:
+                fullpath = os.path.join( dirname, filename )
+                if os.stat( fullpath ).st_nlink == 1:
+                    os.unlink( fullpath )
+                    removed.add( filename )
+            if not os.listdir( dirname ):
+                os.rmdir( dirname )
+        with self._lock:
+            for oid, ( serial, digest, size ) in list( self._digests.items() ):
+                if digest in removed:
+                    del self._digests[ oid ]
+        return len( removed )
+
@@ -0,0 +1,298 @@
+""" Classes: ChangeWatcher
+
+$Id$
+"""
+
+import logging
+import threading
+import time
+import traceback
+
+import transaction
+from ZODB.utils import p64
+from ZODB.utils import u64
+from zope.component import getGlobalSiteManager
+from zope.component import provideHandler
+from zope.interface import Interface
+from zope.lifecycleevent.interfaces import IObjectModifiedEvent
+from zope.lifecycleevent.interfaces import IObjectMovedEvent
+
+LOG = logging.getLogger('Products.FSDump')
+
+#   Running watchers by key, and the last stopped one of each key, see
+#   'getWatcher';  '_subscribed' is true while the event handlers are
+#   registered, i.e. while some watcher runs.
+_watchers = {}
+_stopped = {}
+_watchers_lock = threading.Lock()
+_subscribed = []
+
+
+def _clearSubscribed():
+    #   Cleaning up the global registry drops the event handlers.
+    del _subscribed[ : ]
+
+try:
+    from zope.testing.cleanup import addCleanUp
+except ModuleNotFoundError:  # pragma: no cover
+    pass
+else:
+    addCleanUp( _clearSubscribed )
+    del addCleanUp
+
+
+class ChangeWatcher( threading.Thread ):
+    """ Keep the dump of a Dumper's peers up to date, in a thread with its
+        own connection.
+
+    o The peers are dumped whole when the watcher starts;  the oid of
+      each object dumped is mapped to its physical path, and so are the
+      oids of the persistent parts of each container (e.g. the BTrees of
+      a BTreeFolder2), which may be all that adding an item writes.
+
+    o Every 'interval' seconds, the objects whose oids were written by
+      the transactions committed since are dumped again, together with
+      the paths queued by the object events of this process (see
+      'queue');  a burst of edits to one object is dumped once.
+
+    o Objects are looked up by path in the watcher's connection, so the
+      watcher sees the Dumper's settings as last committed.
+    """
+    interval = 2.0
+
+    def __init__( self, db, app_oid, path, key=None ):
+        threading.Thread.__init__( self
+                                 , name='fsdump-watch:%s' % '/'.join( path ) )
+        self.daemon = True
+        self.db = db
+        self.app_oid = app_oid
+        self.path = path
+        self.key = key
+        self.state = 'pending'
+        self.runs = 0
+        self.last_run = None
+        self.message = None
+        self.error = None
+        self._oids = {}
+        self._paths = set()
+        self._last_tid = None
+        self._stopping = False
+        self._cond = threading.Condition()
+
+    def queue( self, paths ):
+        """ Dump the objects at physical 'paths' in the next round.
+        """
+        with self._cond:
+            self._paths.update( paths )
+
+    def stop( self ):
+        """ Ask the watcher to stop after the current round.
+        """
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+
+    def run( self ):
+        self.state = 'running'
+        conn = self.db.open()
+        try:
+            self._last_tid = self.db.lastTransaction()
+            self._dump( conn, None )
+            while True:
+                with self._cond:
+                    if not self._stopping:
+                        self._cond.wait( self.interval )
+                    if self._stopping:
+                        break
+                    paths, self._paths = self._paths, set()
+                paths.update( self._readTransactions() )
+                if paths:
+                    self._dump( conn, paths )
+            self.state = 'stopped'
+        except:
+            self.error = traceback.format_exc()
+            self.state = 'failed'
+            LOG.error( 'Watcher %s failed', '/'.join( self.path )
+                     , exc_info=True )
+        finally:
+            conn.transaction_manager.abort()
+            conn.close()
+            _retire( self )
+
+    def _dump( self, conn, paths ):
+        #   Dump the peers, or the objects at paths, in a fresh view of
+        #   the database;  errors are logged, and the next round retries.
+        conn.transaction_manager.begin()
+        try:
+            dumper = conn.get( self.app_oid ).unrestrictedTraverse( self.path )
+            self.message = dumper._runWatch( self._oids, paths )
+            self.error = None
+        except:
+            self.error = traceback.format_exc()
+            LOG.error( 'Watcher %s:  dump failed', '/'.join( self.path )
+                     , exc_info=True )
+        finally:
+            conn.transaction_manager.abort()
+        self.runs += 1
+        self.last_run = time.time()
+
+    def _readTransactions( self ):
+        #   Return the paths of the dumped objects written by the
+        #   transactions committed since the last call.
+        last = self.db.lastTransaction()
+        if last == self._last_tid:
+            return set()
+        paths = set()
+        iterator = getattr( self.db.storage, 'iterator', None )
+        if iterator is not None:
+            records = iterator( p64( u64( self._last_tid ) + 1 ), last )
+            try:
+                for txn in records:
+                    for record in txn:
+                        path = self._oids.get( record.oid )
+                        if path is not None:
+                            paths.add( path )
+            finally:
+                close = getattr( records, 'close', None )
+                if close is not None:
+                    close()
+        self._last_tid = last
+        return paths
+
+    def status( self ):
+        """ Return the watcher's state as plain Python data.
+        """
+        return { 'state' : self.state
+               , 'runs' : self.runs
+               , 'last_run' : self.last_run
+               , 'objects' : len( self._oids )
+               , 'message' : self.message
+               , 'error' : self.error
+               }
+
+
+def getWatcher( key ):
+    """ Return the last watcher started for 'key', or None.
+    """
+    watcher = _watchers.get( key )
+    if watcher is None:
+        watcher = _stopped.get( key )
+    return watcher
+
+
+def startWatcher( key, db, app_oid, path ):
+    """ Start watching the peers of the Dumper at 'path';  return None if
+        a watcher for 'key' is already running.
+    """
+    with _watchers_lock:
+        watcher = _watchers.get( key )
+        if watcher is not None and watcher.is_alive():
+            return None
+        if not _subscribed:
+            for handler, event_type in _HANDLERS:
+                provideHandler( handler, ( Interface, event_type ) )
+            _subscribed.append( True )
+        watcher = _watchers[ key ] = ChangeWatcher( db, app_oid, path, key )
+        watcher.start()
+        return watcher
+
+
+def stopWatcher( key ):
+    """ Stop the running watcher for 'key', if any;  return it.
+    """
+    watcher = _watchers.get( key )
+    if watcher is not None:
+        watcher.stop()
+    return watcher
+
+
+def _retire( watcher ):
+    #   Called by a watcher's thread as it ends:  keep it for its status
+    #   only, and drop the event handlers once no watcher runs.
+    with _watchers_lock:
+        if _watchers.get( watcher.key ) is not watcher:
+            return
+        del _watchers[ watcher.key ]
+        _stopped[ watcher.key ] = watcher
+        if not _watchers and _subscribed:
+            registry = getGlobalSiteManager()
+            for handler, event_type in _HANDLERS:
+                registry.unregisterHandler( handler
+                                          , ( Interface, event_type ) )
+            del _subscribed[ : ]
+
+
+def _watching():
+    #   Is any watcher running?
+    for watcher in list( _watchers.values() ):
+        if watcher.is_alive():
+            return True
+    return False
+
+
+def _physicalPath( object ):
+    #   Return the physical path of object, or None unless it is an
+    #   acquisition-wrapped item.
+    getPhysicalPath = getattr( object, 'getPhysicalPath', None )
+    if getPhysicalPath is None:
+        return None
+    try:
+        path = tuple( getPhysicalPath() )
+    except Exception:
+        return None
+    if not path or path[ 0 ] != '':
+        return None
+    return path
+
+
+def _handleModified( object, event ):
+    if not _watching():
+        return
+    path = _physicalPath( object )
+    if path is not None:
+        _collect( [ path ] )
+
+
+def _handleMoved( object, event ):
+    #   Added, removed or renamed:  both containers' listings change,
+    #   and the object is dumped at its new path.
+    if not _watching():
+        return
+    paths = []
+    old_parent = _physicalPath( event.oldParent )
+    if old_parent is not None:
+        paths.append( old_parent )
+    new_parent = _physicalPath( event.newParent )
+    if new_parent is not None:
+        paths.append( new_parent )
+        if event.newName:
+            paths.append( new_parent + ( event.newName, ) )
+    if paths:
+        _collect( paths )
+
+
+def _collect( paths ):
+    #   Queue paths with the running watchers once the current
+    #   transaction commits.
+    txn = transaction.get()
+    try:
+        pending = txn.data( _watchers )
+    except KeyError:
+        pending = set()
+        txn.set_data( _watchers, pending )
+        txn.addAfterCommitHook( _queueChanges, ( pending, ) )
+    pending.update( paths )
+
+
+def _queueChanges( status, paths ):
+    #   After-commit hook registered by '_collect'.
+    if status:
+        for watcher in list( _watchers.values() ):
+            if watcher.is_alive():
+                watcher.queue( paths )
+
+
+#   The event handlers registered while some watcher runs.
+_HANDLERS = ( ( _handleModified, IObjectModifiedEvent )
+            , ( _handleMoved, IObjectMovedEvent )
+            )
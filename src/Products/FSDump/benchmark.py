@@ -0,0 +1,301 @@
+""" Console scripts:  measure Dumper throughput against a synthetic site.
+
+$Id$
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import transaction
+from ZODB import DB
+from ZODB.DemoStorage import DemoStorage
+
+from Products.FSDump.Dumper import Dumper
+from Products.FSDump.Dumper import _currentRSS
+
+#   Modes run by default, in order;  'rerun' and 'incremental' dump over
+#   the output of the preceding run.
+MODES = ( 'full', 'rerun', 'incremental', 'parallel' )
+
+
+class HandlerTimer:
+    """ Accumulate the exclusive wall time spent in each metatype's handler.
+
+    o Time spent in nested handlers (e.g., the items of a folder) is
+      charged to the nested metatype, not to the container.
+    """
+    def __init__( self ):
+        self.times = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def wrap( self, meta_type, handler ):
+        #   Return a handler which times calls to 'handler'.
+        def timed( dumper, obj, path=None ):
+            stack = self._local.__dict__.setdefault( 'stack', [] )
+            stack.append( 0.0 )
+            started = time.perf_counter()
+            try:
+                handler( dumper, obj, path )
+            finally:
+                elapsed = time.perf_counter() - started
+                nested = stack.pop()
+                if stack:
+                    stack[ -1 ] += elapsed
+                with self._lock:
+                    entry = self.times.setdefault( meta_type, [ 0, 0.0 ] )
+                    entry[ 0 ] += 1
+                    entry[ 1 ] += elapsed - nested
+        return timed
+
+    def makeDumperClass( self ):
+        #   Return a Dumper subclass whose handlers are timed.
+        timer = self
+        wrapped = {}
+
+        class TimedDumper( Dumper ):
+            def _getHandler( self, obj ):
+                handler = Dumper._getHandler( self, obj )
+                if handler is None:
+                    return None
+                key = ( obj.meta_type, handler )
+                timed = wrapped.get( key )
+                if timed is None:
+                    timed = wrapped[ key ] = timer.wrap( obj.meta_type
+                                                       , handler )
+                    timed.leaf_only = getattr( handler, 'leaf_only', False )
+                return timed
+
+        return TimedDumper
+
+
+def buildSite( app, options ):
+    """ Create a synthetic site, 'app.site';  return its object count.
+
+    o Objects of each type are spread round-robin across the folders.
+
+    o Python Scripts and ZCatalogs are skipped if their products are
+      not installed.
+    """
+    from OFS.DTMLMethod import addDTMLMethod
+    from OFS.Folder import Folder
+    from OFS.Image import manage_addFile
+    from Products.PageTemplates.ZopePageTemplate import manage_addPageTemplate
+
+    app._setObject( 'site', Folder( 'site' ) )
+    site = app._getOb( 'site' )
+    folders = []
+    for i in range( max( options.folders, 1 ) ):
+        site._setObject( 'folder%d' % i, Folder( 'folder%d' % i ) )
+        folders.append( site._getOb( 'folder%d' % i ) )
+    transaction.savepoint( optimistic=True )
+    count = 1 + len( folders )
+
+    def spread( number ):
+        for i in range( number ):
+            yield i, folders[ i % len( folders ) ]
+
+    for i, folder in spread( options.dtml ):
+        addDTMLMethod( folder, 'method%d' % i, 'Method %d' % i
+                     , '<dtml-var standard_html_header>\n%d\n' % i )
+        count += 1
+
+    for i, folder in spread( options.templates ):
+        manage_addPageTemplate( folder, 'template%d' % i, 'Template %d' % i
+                              , '<p tal:content="here/title">%d</p>' % i )
+        count += 1
+
+    try:
+        from Products.PythonScripts.PythonScript import \
+            manage_addPythonScript
+    except ImportError:
+        if options.scripts:
+            sys.stderr.write( 'Products.PythonScripts missing:  '
+                              'no scripts created.\n' )
+    else:
+        for i, folder in spread( options.scripts ):
+            manage_addPythonScript( folder, 'script%d' % i )
+            folder._getOb( 'script%d' % i ).write(
+                '## Script (Python) "script%d"\nreturn %d\n' % ( i, i ) )
+            count += 1
+
+    payload = os.urandom( options.file_size )
+    for i, folder in spread( options.files ):
+        manage_addFile( folder, 'file%d' % i, payload, 'File %d' % i )
+        count += 1
+        if i % 100 == 99:
+            transaction.savepoint( optimistic=True )
+
+    try:
+        from Products.PluginIndexes.FieldIndex.FieldIndex import FieldIndex
+        from Products.ZCatalog.ZCatalog import manage_addZCatalog
+    except ImportError:
+        if options.catalogs:
+            sys.stderr.write( 'Products.ZCatalog missing:  '
+                              'no catalogs created.\n' )
+    else:
+        for i, folder in spread( options.catalogs ):
+            manage_addZCatalog( folder, 'catalog%d' % i, 'Catalog %d' % i )
+            catalog = folder._getOb( 'catalog%d' % i )
+            catalog.addIndex( 'id', FieldIndex( 'id' ) )
+            for j in range( options.catalog_size ):
+                catalog.catalog_object( folder, '/fake/path/%d/%d' % ( i, j ) )
+            count += 1
+
+    transaction.commit()
+    return count
+
+
+class RSSSampler:
+    """ Measure the growth of this process' resident set size while a
+        mode runs.
+
+    o The RSS is read from /proc every 'interval' seconds in a thread;
+      'stop' returns the peak less the RSS at 'start', in MB, or None if
+      the RSS can't be read.
+    """
+    interval = 0.01
+
+    def __init__( self ):
+        self.baseline = self.peak = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start( self ):
+        self.baseline = self.peak = _currentRSS()
+        if self.baseline is None:
+            return
+        self._done.clear()
+        self._thread = threading.Thread( target=self._sample )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _sample( self ):
+        while not self._done.wait( self.interval ):
+            self._update()
+
+    def _update( self ):
+        rss = _currentRSS()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def stop( self ):
+        if self._thread is None:
+            return None
+        self._done.set()
+        self._thread.join()
+        self._thread = None
+        self._update()
+        return self.peak - self.baseline
+
+
+def _dumpedBytes( stats ):
+    #   Return the number of bytes dumped by the run measured in stats.
+    return sum( [ entry[ 'bytes' ] for entry in stats[ 'metatypes' ] ] )
+
+
+def runBenchmark( options, out=sys.stdout ):
+    """ Build the synthetic site and dump it in each requested mode.
+    """
+    db = DB( DemoStorage() )
+    conn = db.open()
+    try:
+        from OFS.Application import Application
+        conn.root()[ 'Application' ] = Application()
+        transaction.commit()
+        app = conn.root()[ 'Application' ]
+
+        started = time.perf_counter()
+        objects = buildSite( app, options )
+        out.write( 'Built %d objects in %.1f seconds.\n\n'
+                 % ( objects, time.perf_counter() - started ) )
+
+        fspath = options.fspath or tempfile.mkdtemp( prefix='fsdump-bench-' )
+        out.write( '%-12s %9s %12s %12s %10s\n'
+                 % ( 'mode', 'seconds', 'objects/s', 'dumped MB/s'
+                   , 'RSS +MB' ) )
+
+        for mode in options.modes:
+            timer = HandlerTimer()
+            dumper = timer.makeDumperClass()()
+            dumper.id = 'benchmark'
+            target = os.path.join( fspath, mode )
+            if mode in ( 'full', 'parallel' ) and os.path.exists( target ):
+                shutil.rmtree( target )
+            dumper.edit( target if mode in ( 'full', 'parallel' )
+                         else os.path.join( fspath, 'full' )
+                       , options.metadata
+                       , mode == 'incremental'
+                       , options.parallelism if mode == 'parallel' else 1
+                       )
+            dumper = dumper.__of__( app.site )
+            if mode == 'incremental':
+                #   Prime the manifest, then measure the second run.
+                dumper.dumpToFS()
+                timer.times.clear()
+            conn.cacheMinimize()
+
+            sampler = RSSSampler()
+            sampler.start()
+            started = time.perf_counter()
+            dumper.dumpToFS()
+            elapsed = time.perf_counter() - started
+            growth = sampler.stop()
+
+            size = _dumpedBytes( dumper.getDumpStatistics() )
+            out.write( '%-12s %9.2f %12.0f %12.2f %10s\n'
+                     % ( mode, elapsed, objects / elapsed
+                       , size / elapsed / 1048576.0
+                       , '-' if growth is None else '%.1f' % growth ) )
+            for meta_type, ( count, seconds ) in sorted(
+                        timer.times.items(), key=lambda item: -item[1][1] ):
+                out.write( '    %-32s %7d calls %9.3f s\n'
+                         % ( meta_type, count, seconds ) )
+
+        if not options.fspath:
+            shutil.rmtree( fspath )
+    finally:
+        transaction.abort()
+        conn.close()
+        db.close()
+
+
+def _parseArgs( argv ):
+    parser = argparse.ArgumentParser(
+        prog='fsdump-benchmark',
+        description='Measure Dumper throughput against a synthetic site.' )
+    parser.add_argument( '--folders', type=int, default=10 )
+    parser.add_argument( '--dtml', type=int, default=1000 )
+    parser.add_argument( '--templates', type=int, default=1000 )
+    parser.add_argument( '--scripts', type=int, default=1000 )
+    parser.add_argument( '--files', type=int, default=100 )
+    parser.add_argument( '--file-size', type=int, default=1 << 20,
+                         help='bytes per file;  files over 128KB are '
+                              'stored as multi-chunk Pdata' )
+    parser.add_argument( '--catalogs', type=int, default=1 )
+    parser.add_argument( '--catalog-size', type=int, default=10000,
+                         help='entries per catalog' )
+    parser.add_argument( '--metadata', action='store_true',
+                         help='write .metadata files' )
+    parser.add_argument( '-j', '--parallelism', type=int, default=4,
+                         help='worker threads for the parallel mode' )
+    parser.add_argument( '--modes', nargs='+', choices=MODES,
+                         default=list( MODES ) )
+    parser.add_argument( '-o', '--fspath',
+                         help='directory to dump to (default: a temporary '
+                              'directory, removed afterwards)' )
+    options = parser.parse_args( argv )
+    if options.fspath:
+        options.fspath = os.path.abspath( options.fspath )
+    return options
+
+
+def bench_main( argv=None ):
+    """ Entry point for the 'fsdump-benchmark' console script.
+    """
+    runBenchmark( _parseArgs( argv ) )
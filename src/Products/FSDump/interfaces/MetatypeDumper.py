@@ -4,8 +4,10 @@ $Id: MetatypeDumper.py 97084 2005-04-29 14:19:31Z tseaver $
 """
 
 try:
+    from zope.interface import Attribute
     from zope.interface import Interface
 except ImportError: # Zope < 2.8.0a2
+    from Interfaces import Attribute
     from Interfaces import Interface
 
 class MetatypeDumper( Interface ):
@@ -13,9 +15,17 @@ class MetatypeDumper( Interface ):
         Interface for instance / method / function which allows
         dumping objects of a given metatype to the filesystem.
 
-        Items which implement this interface will be registered
-        with a Dumper, and used by its '_dumpObjects'.
+        Items which implement this interface are registered using
+        'Products.FSDump.Registry.registerHandler', and used by the
+        Dumper's '_dumpObjects'.
     """
-    def __call__( object, path=None ):
+    leaf_only = Attribute( """
+        True if the handler dumps nothing below the object, so that
+        the object's serial tells whether its dump is up to date.
+        """ )
+
+    def __call__( dumper, object, path=None ):
         """
+            Dump 'object' using 'dumper', under 'path' (relative to
+            the dumper's 'fspath').
         """
@@ -0,0 +1,311 @@
+""" Console scripts:  dump a ZODB subtree without going through the ZMI,
+    and load a dump back.
+
+$Id$
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import transaction
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.users import system
+from ZODB import DB
+
+from Products.FSDump.Dumper import Dumper
+from Products.FSDump.Loader import Loader
+from Products.FSDump.Output import ARCHIVE_FORMATS
+from Products.FSDump.Output import getGitRef
+from Products.FSDump.Output import guessArchiveFormat
+
+
+def _openStorage( options, read_only=True ):
+    #   Open the storage named on the command line.
+    if options.zeo_address:
+        try:
+            from ZEO.ClientStorage import ClientStorage
+        except ImportError:
+            raise SystemExit( 'fsdump: ZEO is not installed.' )
+        address = options.zeo_address
+        if ':' in address:
+            host, port = address.rsplit( ':', 1 )
+            address = ( host, int( port ) )
+        return ClientStorage( address
+                            , storage=options.zeo_storage
+                            , blob_dir=options.blob_dir
+                            , shared_blob_dir=False
+                            , read_only=read_only
+                            )
+
+    from ZODB.FileStorage import FileStorage
+    storage = FileStorage( options.file_storage, read_only=read_only )
+    if options.blob_dir:
+        from ZODB.blob import BlobStorage
+        storage = BlobStorage( options.blob_dir, storage )
+    return storage
+
+
+def _addStorageArgs( parser, read_only=True ):
+    source = parser.add_mutually_exclusive_group( required=True )
+    source.add_argument( '-f', '--file-storage',
+                         help='path to a FileStorage%s'
+                              % ( read_only and ' (opened read-only)' or '' ) )
+    source.add_argument( '-z', '--zeo-address',
+                         help='ZEO server, as host:port or a socket path' )
+    parser.add_argument( '--zeo-storage', default='1',
+                         help='name of the ZEO storage (default: 1)' )
+    parser.add_argument( '-b', '--blob-dir',
+                         help='blob directory (or ZEO blob cache)' )
+
+
+def _parseArgs( argv ):
+    parser = argparse.ArgumentParser(
+        prog='fsdump-dump',
+        description='Dump the peers of a Zope folder to the filesystem.' )
+    _addStorageArgs( parser )
+    parser.add_argument( '-p', '--path', default='/',
+                         help='path of the folder whose items are dumped '
+                              '(default: the application root)' )
+    parser.add_argument( '-o', '--fspath',
+                         help='absolute filesystem path to dump to' )
+    parser.add_argument( '-a', '--archive',
+                         help='write a tar or zip archive to this file '
+                              '("-" for standard output) instead of a tree' )
+    parser.add_argument( '--archive-format', choices=sorted( ARCHIVE_FORMATS ),
+                         help='archive format (default: guessed from the '
+                              'archive\'s extension, else tar.gz)' )
+    parser.add_argument( '--git', metavar='REPOSITORY',
+                         help='commit the dump to a branch of this git '
+                              'repository (created if missing) instead of '
+                              'writing a tree' )
+    parser.add_argument( '--git-branch', default='fsdump', metavar='BRANCH',
+                         help='the branch to commit to (default: fsdump)' )
+    parser.add_argument( '--item', action='append', default=[],
+                         dest='items', metavar='PATH',
+                         help='dump only the item at this path, relative '
+                              'to --path or physical (repeatable)' )
+    parser.add_argument( '--items-from', metavar='FILE',
+                         help='dump only the items whose paths are listed '
+                              'in this file, one per line ("-" for '
+                              'standard input)' )
+    parser.add_argument( '-d', '--diff', action='store_true',
+                         help='write nothing;  list the files which a dump '
+                              'would add (A), change (M) or remove (D) '
+                              'under --fspath, and exit with status 1 if '
+                              'there are any' )
+    parser.add_argument( '-m', '--metadata', action='store_true',
+                         help='write .metadata files instead of '
+                              '.properties files' )
+    parser.add_argument( '-i', '--incremental', action='store_true',
+                         help='skip objects unchanged since the last dump' )
+    parser.add_argument( '-j', '--parallelism', type=int, default=1,
+                         help='number of worker threads (default: 1)' )
+    parser.add_argument( '--gc-interval', type=int, default=1000,
+                         help='objects dumped between trims of the ZODB '
+                              'cache (default: 1000)' )
+    parser.add_argument( '--rss-limit', type=int, default=0, metavar='MB',
+                         help='empty the ZODB cache whenever the resident '
+                              'memory exceeds this many MB (default: no '
+                              'limit)' )
+    parser.add_argument( '--index', action='store_true',
+                         help='maintain an SQLite index of the dumped '
+                              'objects and files in the output directory' )
+    parser.add_argument( '--content-store', action='store_true',
+                         help='write each distinct File / Image payload '
+                              'once, and hard-link the dumped files to it' )
+    parser.add_argument( '--compact', action='store_true',
+                         help="write the companion files of each folder's "
+                              'items into one index per folder' )
+    parser.add_argument( '--prune', action='store_true',
+                         help='remove files of objects deleted since the '
+                              'last dump' )
+    parser.add_argument( '--no-catalog-records', dest='catalog_records',
+                         action='store_false',
+                         help='dump only the index and metadata definitions '
+                              'of ZCatalogs' )
+    parser.add_argument( '--include', action='append', default=[],
+                         metavar='PATTERN',
+                         help='dump only the objects whose physical path '
+                              'matches this glob, and their contents '
+                              '(repeatable)' )
+    parser.add_argument( '--exclude', action='append', default=[],
+                         metavar='PATTERN',
+                         help='skip the objects whose physical path matches '
+                              'this glob, and their contents (repeatable)' )
+    parser.add_argument( '--meta-type', action='append', default=[],
+                         dest='include_meta_types',
+                         help='dump only objects of this meta_type '
+                              '(repeatable)' )
+    parser.add_argument( '--skip-meta-type', action='append', default=[],
+                         dest='exclude_meta_types',
+                         help='skip objects of this meta_type, and their '
+                              'contents (repeatable)' )
+    parser.add_argument( '--stats-log',
+                         help='append per-object statistics as JSON lines '
+                              'to this file' )
+    options = parser.parse_args( argv )
+    if not ( options.fspath or options.archive or options.git ):
+        parser.error( 'one of --fspath, --archive or --git is required' )
+    if options.archive and options.git:
+        parser.error( '--archive and --git are exclusive' )
+    if options.diff and ( options.archive or options.git
+                       or not options.fspath ):
+        parser.error( '--diff requires --fspath, and no --archive or --git' )
+    if ( options.items or options.items_from ) and ( options.archive
+                                                   or options.git
+                                                   or options.diff
+                                                   or not options.fspath ):
+        parser.error( '--item and --items-from require --fspath, and no '
+                      '--archive, --git or --diff' )
+    if options.archive and not options.archive_format:
+        options.archive_format = ( guessArchiveFormat( options.archive )
+                                   or 'tar.gz' )
+    if options.fspath:
+        options.fspath = os.path.abspath( options.fspath )
+    if options.git:
+        try:
+            getGitRef( options.git_branch )
+        except ValueError as e:
+            parser.error( str( e ) )
+    return options
+
+
+def dump_main( argv=None ):
+    """ Entry point for the 'fsdump' console script.
+    """
+    options = _parseArgs( argv )
+
+    db = DB( _openStorage( options ) )
+    conn = db.open()
+    try:
+        app = conn.root()[ 'Application' ]
+        target = app.unrestrictedTraverse( options.path.strip( '/' ) )
+
+        dumper = Dumper()
+        dumper.id = 'fsdump'
+        dumper.edit( options.fspath or os.sep
+                   , options.metadata
+                   , options.incremental
+                   , options.parallelism
+                   , options.prune
+                   , options.stats_log and os.path.abspath( options.stats_log )
+                   , options.catalog_records
+                   , options.include
+                   , options.exclude
+                   , options.include_meta_types
+                   , options.exclude_meta_types
+                   , options.gc_interval
+                   , options.rss_limit
+                   , options.index
+                   , options.content_store
+                   , options.compact
+                   )
+        started = time.time()
+        if options.items or options.items_from:
+            newSecurityManager( None, system )
+            paths = list( options.items )
+            if options.items_from == '-':
+                paths.extend( sys.stdin.read().splitlines() )
+            elif options.items_from:
+                with open( options.items_from, encoding='utf-8' ) as file:
+                    paths.extend( file.read().splitlines() )
+            status = dumper.__of__( target ).dumpItems( paths )
+            for path in sorted( status ):
+                sys.stdout.write( '%s %s\n' % ( status[ path ], path ) )
+            return int( any( value != 'dumped'
+                             for value in status.values() ) )
+        if options.diff:
+            report = dumper.__of__( target ).diffFS()
+            for kind, flag in ( ( 'added', 'A' )
+                              , ( 'changed', 'M' )
+                              , ( 'removed', 'D' )
+                              ):
+                for path in report[ kind ]:
+                    sys.stdout.write( '%s %s\n' % ( flag, path ) )
+            return int( any( report.values() ) )
+        if options.git:
+            message = dumper.__of__( target ).dumpToGit(
+                            os.path.abspath( options.git )
+                          , options.git_branch )
+            destination = '%s (%s)' % ( options.git, options.git_branch )
+            log = sys.stdout
+        elif not options.archive:
+            message = dumper.__of__( target ).dumpToFS()
+            destination = dumper.fspath
+            log = sys.stdout
+        elif options.archive == '-':
+            message = dumper.__of__( target )._dumpToStream(
+                            sys.stdout.buffer, options.archive_format )
+            sys.stdout.flush()
+            destination = 'standard output'
+            log = sys.stderr
+        else:
+            message = dumper.__of__( target ).dumpToArchive(
+                            options.archive_format
+                          , os.path.abspath( options.archive ) )
+            destination = options.archive
+            log = sys.stdout
+        log.write( 'Dumped %s to %s in %.1f seconds.  %s\n'
+                 % ( '/'.join( target.getPhysicalPath() ) or '/'
+                   , destination
+                   , time.time() - started
+                   , message
+                   ) )
+    finally:
+        transaction.abort()
+        conn.close()
+        db.close()
+
+
+def _parseLoadArgs( argv ):
+    parser = argparse.ArgumentParser(
+        prog='fsdump-load',
+        description='Load a dumped folder back into a Zope folder.' )
+    _addStorageArgs( parser, read_only=False )
+    parser.add_argument( '-p', '--path', default='/',
+                         help='path of the folder to load the items into '
+                              '(default: the application root)' )
+    parser.add_argument( '-i', '--dirpath', required=True,
+                         help='directory of the dumped folder, e.g. '
+                              '/var/dumps/site' )
+    parser.add_argument( '--batch-size', type=int, default=1000,
+                         help='objects created per commit (default: 1000)' )
+    parser.add_argument( '--savepoint-size', type=int, default=100,
+                         help='objects created per savepoint (default: 100)' )
+    parser.add_argument( '-j', '--parallelism', type=int, default=1,
+                         help='number of worker threads (default: 1)' )
+    parser.add_argument( '--replace', action='store_true',
+                         help='replace existing items instead of skipping '
+                              'them' )
+    return parser.parse_args( argv )
+
+
+def load_main( argv=None ):
+    """ Entry point for the 'fsdump-load' console script.
+    """
+    options = _parseLoadArgs( argv )
+
+    db = DB( _openStorage( options, read_only=False ) )
+    conn = db.open()
+    try:
+        app = conn.root()[ 'Application' ]
+        target = app.unrestrictedTraverse( options.path.strip( '/' ) )
+        loader = Loader( options.batch_size
+                       , options.savepoint_size
+                       , options.parallelism
+                       , options.replace
+                       )
+        started = time.time()
+        message = loader.load( target, os.path.abspath( options.dirpath ) )
+        sys.stdout.write( 'Loaded %s into %s in %.1f seconds.  %s\n'
+                        % ( options.dirpath
+                          , '/'.join( target.getPhysicalPath() ) or '/'
+                          , time.time() - started
+                          , message
+                          ) )
+    finally:
+        transaction.abort()
+        conn.close()
+        db.close()
@@ -0,0 +1 @@
+# Tests for Products.FSDump
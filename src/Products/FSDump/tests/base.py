@@ -0,0 +1,88 @@
+""" Fixtures shared by the tests of Products.FSDump
+
+$Id$
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import transaction
+
+
+class SiteTestBase( unittest.TestCase ):
+    """ Build a small site in a fresh database, with a Dumper in it:
+        folders 'f0' and 'f1', each holding a DTML Method 'm', a Page
+        Template 'pt' and a File 'file', and a BTreeFolder2 'big'.
+    """
+    def setUp( self ):
+        self.tempdir = tempfile.mkdtemp()
+        self.fspath = os.path.join( self.tempdir, 'out' )
+        self.db = self._makeDB()
+        self.tm = transaction.TransactionManager()
+        self.conn = self.db.open( self.tm )
+        self.app = self._makeSite( self.conn )
+
+    def tearDown( self ):
+        from Products.FSDump.Stats import _clearStatistics
+        _clearStatistics()
+        self.tm.abort()
+        self.conn.close()
+        self.db.close()
+        shutil.rmtree( self.tempdir )
+
+    def _makeDB( self ):
+        from ZODB.DB import DB
+        from ZODB.DemoStorage import DemoStorage
+        return DB( DemoStorage() )
+
+    def _makeSite( self, conn ):
+        from OFS.Application import Application
+        from OFS.DTMLMethod import addDTMLMethod
+        from OFS.Folder import Folder
+        from OFS.Image import manage_addFile
+        from Products.BTreeFolder2.BTreeFolder2 import BTreeFolder2
+        from Products.PageTemplates.ZopePageTemplate import \
+            manage_addPageTemplate
+        from Products.FSDump.Dumper import Dumper
+
+        conn.root()[ 'Application' ] = Application()
+        app = conn.root()[ 'Application' ]
+        app._setObject( 'site', Folder( 'site' ) )
+        site = app.site
+        for id in ( 'f0', 'f1' ):
+            site._setObject( id, Folder( id ) )
+            folder = site._getOb( id )
+            addDTMLMethod( folder, 'm', 'Method', 'hello <dtml-var x>' )
+            manage_addPageTemplate( folder, 'pt', 'Template', '<p>hi</p>' )
+            manage_addFile( folder, 'file', b'x' * 1000, 'File' )
+        site._setObject( 'big', BTreeFolder2( 'big' ) )
+        addDTMLMethod( site.big, 'one', 'One', 'one' )
+        dumper = Dumper()
+        dumper.id = 'dumper'
+        site._setObject( 'dumper', dumper )
+        self.tm.commit()
+        return app
+
+    def _getDumper( self, **kw ):
+        dumper = self.app.site.dumper
+        dumper.edit( kw.pop( 'fspath', self.fspath )
+                   , kw.pop( 'use_metadata_file', 1 ), **kw )
+        return dumper
+
+    def _listFiles( self, root=None ):
+        #   Return the paths of the files under root, relative to it.
+        root = root or self.fspath
+        found = []
+        for dirname, subdirs, filenames in os.walk( root ):
+            for filename in filenames:
+                found.append( os.path.relpath( os.path.join( dirname
+                                                           , filename )
+                                             , root ) )
+        return sorted( found )
+
+    def _read( self, *names ):
+        with open( os.path.join( self.fspath, *names )
+                 , encoding='utf-8' ) as file:
+            return file.read()
@@ -0,0 +1,59 @@
+import io
+import os
+import tarfile
+import unittest
+import zipfile
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class DumpToArchiveTests( SiteTestBase ):
+
+    def test_archive_path_tar_gz( self ):
+        dumper = self._getDumper()
+        archive_path = os.path.join( self.tempdir, 'site.tar.gz' )
+        dumper.dumpToArchive( 'tar.gz', archive_path )
+        with tarfile.open( archive_path ) as tar:
+            names = tar.getnames()
+            self.assertIn( 'site/f0/m.dtml', names )
+            self.assertEqual( tar.extractfile( 'site/f1/file' ).read()
+                            , b'x' * 1000 )
+        self.assertFalse( os.path.exists( self.fspath ) )
+
+    def test_archive_path_zip( self ):
+        dumper = self._getDumper()
+        archive_path = os.path.join( self.tempdir, 'site.zip' )
+        dumper.dumpToArchive( 'zip', archive_path )
+        with zipfile.ZipFile( archive_path ) as archive:
+            self.assertEqual( archive.read( 'site/f0/m.dtml' )
+                            , b'hello <dtml-var x>\n' )
+
+    def test_unknown_format( self ):
+        dumper = self._getDumper()
+        self.assertRaises( ValueError, dumper.dumpToArchive, 'rar'
+                         , os.path.join( self.tempdir, 'site.rar' ) )
+
+    def test_response_is_spooled_not_buffered( self ):
+        from ZPublisher.HTTPResponse import HTTPResponse
+        from ZPublisher.Iterators import IStreamIterator
+        dumper = self._getDumper()
+        stdout = io.BytesIO()
+        response = HTTPResponse( stdout=stdout )
+        result = dumper.dumpToArchive( 'tar', REQUEST={ 'RESPONSE'
+                                                        : response } )
+        try:
+            self.assertTrue( IStreamIterator.providedBy( result ) )
+            self.assertEqual( stdout.getvalue(), b'' )
+            data = b''.join( result )
+        finally:
+            result.close()
+        self.assertEqual( response.getHeader( 'Content-Length' )
+                        , str( len( data ) ) )
+        self.assertEqual( response.getHeader( 'Content-Type' )
+                        , 'application/x-tar' )
+        with tarfile.open( fileobj=io.BytesIO( data ) ) as tar:
+            self.assertIn( 'site/f0/pt.pt', tar.getnames() )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
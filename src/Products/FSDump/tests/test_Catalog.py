@@ -0,0 +1,46 @@
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class CatalogTests( SiteTestBase ):
+
+    def _addCatalog( self ):
+        from Products.PluginIndexes.FieldIndex.FieldIndex import FieldIndex
+        from Products.ZCatalog.ZCatalog import ZCatalog
+        site = self.app.site
+        site._setObject( 'catalog', ZCatalog( 'catalog', 'Catalog' ) )
+        site.catalog.addIndex( 'id', FieldIndex( 'id' ) )
+        site.catalog.addColumn( 'title' )
+        for object in ( site.f1.m, site.f0.m, site.f0.pt, site.big.one ):
+            site.catalog.catalog_object( object )
+        self.tm.commit()
+        return site.catalog
+
+    def test_paths_in_record_order( self ):
+        from unittest import mock
+        from Products.FSDump.Dumper import Dumper
+        catalog = self._addCatalog()
+        with mock.patch.object( Dumper, '_catalog_batch_size', 3 ):
+            self._getDumper().dumpToFS()
+        self.assertEqual( self._read( 'site', 'catalog.catalog' )
+                        , ''.join( [ '%s\n' % path for path
+                                     in catalog._catalog.paths.values() ] ) )
+        self.assertEqual( sorted( self._read( 'site', 'catalog.catalog' )
+                                  .splitlines() )
+                        , [ '/site/big/one', '/site/f0/m', '/site/f0/pt'
+                          , '/site/f1/m' ] )
+        self.assertIn( 'id:FieldIndex\n'
+                     , self._read( 'site', 'catalog.indexes' ) )
+        self.assertIn( 'title\n', self._read( 'site', 'catalog.metadata' ) )
+
+    def test_no_records( self ):
+        self._addCatalog()
+        self._getDumper( catalog_records=0 ).dumpToFS()
+        files = self._listFiles()
+        self.assertNotIn( 'site/catalog.catalog', files )
+        self.assertIn( 'site/catalog.indexes', files )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
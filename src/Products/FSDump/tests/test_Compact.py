@@ -0,0 +1,89 @@
+import os
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class CompanionTextTests( unittest.TestCase ):
+
+    def test_join_and_split( self ):
+        from Products.FSDump.Compact import joinCompanions
+        from Products.FSDump.Compact import splitCompanions
+        companions = { '' : '[default]\ntitle=\n\n[Objects]\nm:DTML Method\n'
+                     , 'm.dtml' : '[default]\ntitle=Method\n'
+                     , 'f.txt' : 'title=Text\n'
+                     }
+        text = joinCompanions( companions )
+        self.assertEqual( text, '[default]\ntitle=\n\n[Objects]\n'
+                                'm:DTML Method\n\ntitle=Text\n\n'
+                                '[m.dtml:default]\ntitle=Method\n' )
+        self.assertEqual( splitCompanions( text )
+                        , { '' : '[default]\ntitle=\n\n[Objects]\n'
+                                 'm:DTML Method\n\ntitle=Text\n'
+                          , 'm.dtml' : '[default]\ntitle=Method\n'
+                          } )
+
+    def test_owns( self ):
+        from Products.FSDump.Compact import _owns
+        self.assertTrue( _owns( 'f', 'f.py' ) )
+        self.assertTrue( _owns( 'f', 'f' ) )
+        self.assertFalse( _owns( 'f', 'fx.py' ) )
+        self.assertFalse( _owns( 'f', 'f.txt.py', others=( 'f.txt', ) ) )
+
+
+class CompactLayoutTests( SiteTestBase ):
+
+    def test_one_index_per_folder( self ):
+        self._getDumper( compact_layout=1 ).dumpToFS()
+        self.assertEqual( self._listFiles()
+                        , [ 'site/.metadata', 'site/big/.metadata'
+                          , 'site/big/one.dtml', 'site/f0/.metadata'
+                          , 'site/f0/file', 'site/f0/m.dtml'
+                          , 'site/f0/pt.pt', 'site/f1/.metadata'
+                          , 'site/f1/file', 'site/f1/m.dtml'
+                          , 'site/f1/pt.pt' ] )
+        index = self._read( 'site', 'f0', '.metadata' )
+        self.assertIn( '\n[Objects]\nfile:File\nm:DTML Method\n', index )
+        self.assertIn( '\n[m.dtml:default]\ntitle=Method\n', index )
+        self.assertIn( '\n[pt.pt:default]\ntitle=Template\n', index )
+
+    def test_incremental_keeps_unchanged_sections( self ):
+        dumper = self._getDumper( compact_layout=1, incremental=1, prune=1 )
+        dumper.dumpToFS()
+        self.app.site.f0.m.manage_edit( 'changed', 'Changed' )
+        self.app.site.f0.manage_delObjects( [ 'pt' ] )
+        self.tm.commit()
+        dumper.dumpToFS()
+        index = self._read( 'site', 'f0', '.metadata' )
+        self.assertIn( '\n[m.dtml:default]\ntitle=Changed\n', index )
+        self.assertIn( '\n[file:default]\ntitle=File\n', index )
+        self.assertNotIn( 'pt.pt', index )
+        self.assertNotIn( 'site/f0/pt.pt', self._listFiles() )
+        self.assertIn( '\n[pt.pt:default]\ntitle=Template\n'
+                     , self._read( 'site', 'f1', '.metadata' ) )
+
+    def test_layout_change_dumps_everything( self ):
+        self._getDumper( incremental=1 ).dumpToFS()
+        self._getDumper( incremental=1, compact_layout=1, prune=1
+                       ).dumpToFS()
+        files = self._listFiles()
+        self.assertNotIn( 'site/f0/m.dtml.metadata', files )
+        self.assertIn( '\n[m.dtml:default]\ntitle=Method\n'
+                     , self._read( 'site', 'f0', '.metadata' ) )
+
+    def test_load_compact_dump( self ):
+        from OFS.Folder import Folder
+        from Products.FSDump.Loader import Loader
+        self._getDumper( compact_layout=1 ).dumpToFS()
+        self.app._setObject( 'copy', Folder( 'copy' ) )
+        self.tm.commit()
+        message = Loader().load( self.app.copy
+                               , os.path.join( self.fspath, 'site' ) )
+        self.assertEqual( message
+                        , '10 created, 0 existing, 0 skipped, 0 errors' )
+        self.assertEqual( self.app.copy.f1.pt.title, 'Template' )
+        self.assertEqual( self.app.copy.f0.file.title, 'File' )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,68 @@
+import os
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class DiffFSTests( SiteTestBase ):
+
+    def test_nothing_dumped( self ):
+        report = self._getDumper().diffFS()
+        self.assertEqual( len( report[ 'added' ] ), 18 )
+        self.assertIn( 'site/f0/m.dtml', report[ 'added' ] )
+        self.assertEqual( ( report[ 'changed' ], report[ 'removed' ] )
+                        , ( [], [] ) )
+        self.assertFalse( os.path.exists( self.fspath ) )
+
+    def test_added_changed_removed( self ):
+        dumper = self._getDumper()
+        dumper.dumpToFS()
+        self.assertEqual( dumper.diffFS()
+                        , { 'added' : [], 'changed' : [], 'removed' : [] } )
+        self.app.site.f0.m.manage_edit( 'changed', 'Method' )
+        self.app.site.f1.manage_delObjects( [ 'pt' ] )
+        from OFS.DTMLMethod import addDTMLMethod
+        addDTMLMethod( self.app.site.big, 'two', '', 'two' )
+        self.tm.commit()
+        before = self._listFiles()
+        self.assertEqual( dumper.diffFS()
+                        , { 'added' : [ 'site/big/two.dtml'
+                                      , 'site/big/two.dtml.metadata' ]
+                          , 'changed' : [ 'site/big/.metadata'
+                                        , 'site/f0/m.dtml'
+                                        , 'site/f1/.metadata' ]
+                          , 'removed' : [ 'site/f1/pt.pt'
+                                        , 'site/f1/pt.pt.metadata' ]
+                          } )
+        self.assertEqual( self._listFiles(), before )
+        self.assertEqual( self._read( 'site', 'f0', 'm.dtml' )
+                        , 'hello <dtml-var x>\n' )
+
+    def test_incremental( self ):
+        dumper = self._getDumper( incremental=1 )
+        dumper.dumpToFS()
+        stats = dumper.getDumpStatistics()
+        os.remove( os.path.join( self.fspath, 'site', 'f0', 'file' ) )
+        self.assertEqual( dumper.diffFS()
+                        , { 'added' : [ 'site/f0/file' ], 'changed' : []
+                          , 'removed' : [] } )
+        self.assertEqual( dumper.getDumpStatistics(), stats )
+
+    def test_statistics_left_alone( self ):
+        log = os.path.join( self.tempdir, 'stats.log' )
+        dumper = self._getDumper( stats_log=log )
+        self.assertEqual( dumper.diffFS()[ 'changed' ], [] )
+        self.assertFalse( os.path.exists( log ) )
+        self.assertIsNone( dumper.getDumpStatistics() )
+        dumper.dumpToFS()
+        with open( log ) as file:
+            lines = file.readlines()
+        stats = dumper.getDumpStatistics()
+        dumper.diffFS()
+        with open( log ) as file:
+            self.assertEqual( file.readlines(), lines )
+        self.assertEqual( dumper.getDumpStatistics(), stats )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
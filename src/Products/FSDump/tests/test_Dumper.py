@@ -0,0 +1,451 @@
+import os
+import shutil
+import unittest
+
+import transaction
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class TestDumpTests( SiteTestBase ):
+
+    def setUp( self ):
+        from AccessControl.SecurityManagement import newSecurityManager
+        from AccessControl.SpecialUsers import system
+        SiteTestBase.setUp( self )
+        newSecurityManager( None, system )
+
+    def tearDown( self ):
+        from AccessControl.SecurityManagement import noSecurityManager
+        noSecurityManager()
+        SiteTestBase.tearDown( self )
+
+    def test_testDump_after_directory_removed( self ):
+        dumper = self._getDumper()
+        dumper.testDump( 'f0/m' )
+        filename = os.path.join( self.fspath, 'm.dtml' )
+        self.assertTrue( os.path.exists( filename ) )
+        shutil.rmtree( self.fspath )
+        dumper.testDump( 'f0/m' )
+        self.assertTrue( os.path.exists( filename ) )
+
+
+class EditTests( SiteTestBase ):
+
+    def test_empty_numeric_fields( self ):
+        dumper = self.app.site.dumper
+        dumper.edit( self.fspath, 1, parallelism='', gc_interval=''
+                   , rss_limit='' )
+        self.assertEqual( dumper.parallelism, 1 )
+        self.assertEqual( dumper.gc_interval, 1000 )
+        self.assertEqual( dumper.rss_limit, 0 )
+
+    def test_scope_lines( self ):
+        dumper = self.app.site.dumper
+        dumper.edit( self.fspath, 1, include_paths='/site/f0\n\n  '
+                   , exclude_meta_types=[ ' File ', '' ] )
+        self.assertEqual( dumper.include_paths, ( '/site/f0', ) )
+        self.assertEqual( dumper.exclude_meta_types, ( 'File', ) )
+
+
+class IncrementalTests( SiteTestBase ):
+
+    def test_unchanged_objects_skipped( self ):
+        dumper = self._getDumper( incremental=1 )
+        self.assertEqual( dumper.dumpToFS()
+                        , 'Peers dumped: 18 written, 0 unchanged, 0 deleted,'
+                          ' 0 errors.' )
+        self.assertEqual( dumper.dumpToFS()
+                        , 'Peers dumped: 0 written, 0 unchanged, 0 deleted,'
+                          ' 0 errors.' )
+        stats = dict( [ ( info[ 'meta_type' ], info ) for info
+                        in dumper.getDumpStatistics()[ 'metatypes' ] ] )
+        self.assertEqual( stats[ 'File' ][ 'unchanged' ], 2 )
+        self.assertEqual( stats[ 'File' ][ 'files' ], 0 )
+
+    def test_changed_object_dumped( self ):
+        dumper = self._getDumper( incremental=1 )
+        dumper.dumpToFS()
+        self.app.site.f0.m.manage_edit( 'changed', 'Method' )
+        self.tm.commit()
+        dumper.dumpToFS()
+        self.assertEqual( self._read( 'site', 'f0', 'm.dtml' ), 'changed\n' )
+        self.assertEqual( self._read( 'site', 'f1', 'm.dtml' )
+                        , 'hello <dtml-var x>\n' )
+        manifest = self._read( '.fsdump_manifest' )
+        self.assertIn( '"path": "/site/f0/m"', manifest )
+
+    def test_manifest_ignored_when_settings_change( self ):
+        dumper = self._getDumper( incremental=1 )
+        dumper.dumpToFS()
+        dumper = self._getDumper( incremental=1, use_metadata_file=0 )
+        dumper.dumpToFS()
+        self.assertIn( 'site/f0/m.dtml.properties', self._listFiles() )
+
+
+class RewriteTests( SiteTestBase ):
+
+    def test_unchanged_files_not_rewritten( self ):
+        dumper = self._getDumper()
+        dumper.dumpToFS()
+        filename = os.path.join( self.fspath, 'site', 'f0', 'm.dtml' )
+        os.utime( filename, ( 0, 0 ) )
+        self.assertEqual( dumper.dumpToFS()
+                        , 'Peers dumped: 0 written, 18 unchanged, 0 deleted,'
+                          ' 0 errors.' )
+        self.assertEqual( os.path.getmtime( filename ), 0 )
+
+
+class FileDataTests( SiteTestBase ):
+
+    def _addBigFile( self ):
+        from OFS.Image import Pdata
+        from OFS.Image import manage_addFile
+        data = bytes( range( 256 ) ) * 1024
+        manage_addFile( self.app.site.f0, 'big', b'', 'Big' )
+        chain = None
+        for start in range( len( data ) - 65536, -1, -65536 ):
+            chunk = Pdata( data[ start:start + 65536 ] )
+            chunk.next = chain
+            chain = chunk
+        self.app.site.f0.big.update_data( chain, size=len( data ) )
+        self.tm.commit()
+        self.conn.cacheMinimize()
+        return data
+
+    def test_pdata_written_and_released( self ):
+        data = self._addBigFile()
+        dumper = self._getDumper()
+        dumper.dumpToFS()
+        with open( os.path.join( self.fspath, 'site', 'f0', 'big' )
+                 , 'rb' ) as file:
+            self.assertEqual( file.read(), data )
+        chunk = self.app.site.f0.big.data
+        chunks = 0
+        while chunk is not None:
+            self.assertIsNone( chunk._p_changed )   # ghost
+            chunk, chunks = chunk.next, chunks + 1
+        self.assertTrue( chunks > 1 )
+
+
+class ParallelTests( SiteTestBase ):
+
+    def tearDown( self ):
+        from zope.testing.cleanup import cleanUp
+        cleanUp()
+        SiteTestBase.tearDown( self )
+
+    def _readAll( self, root ):
+        contents = {}
+        for name in self._listFiles( root ):
+            with open( os.path.join( root, name ), 'rb' ) as file:
+                contents[ name ] = file.read()
+        return contents
+
+    def test_same_tree_as_serial( self ):
+        serial = os.path.join( self.tempdir, 'serial' )
+        self._getDumper( fspath=serial ).dumpToFS()
+        self._getDumper( parallelism=3 ).dumpToFS()
+        self.assertEqual( self._readAll( self.fspath )
+                        , self._readAll( serial ) )
+
+    def test_items_dumped_from_other_connections( self ):
+        from Products.FSDump.Dumper import Dumper
+        from Products.FSDump.Registry import registerHandler
+        jars = []
+
+        def _dumpDTMLMethod( dumper, object, path ):
+            jars.append( object._p_jar )
+            return Dumper._dumpDTMLMethod( dumper, object, path )
+
+        registerHandler( _dumpDTMLMethod, 'DTML Method' )
+        message = self._getDumper( parallelism=3 ).dumpToFS()
+        self.assertIn( ' 0 errors', message )
+        self.assertEqual( len( jars ), 3 )
+        self.assertNotIn( self.conn, jars )
+
+    def test_workers_read_the_request_snapshot( self ):
+        dumper = self._getDumper( parallelism=3 )
+        tm = transaction.TransactionManager()
+        conn = self.db.open( tm )
+        try:
+            conn.root()[ 'Application' ].site.f0.m.manage_edit( 'later'
+                                                               , 'Method' )
+            tm.commit()
+        finally:
+            conn.close()
+        message = dumper.dumpToFS()
+        self.assertIn( ' 0 errors', message )
+        self.assertEqual( self._read( 'site', 'f0', 'm.dtml' )
+                        , 'hello <dtml-var x>\n' )
+
+    def test_lookup_error_recorded( self ):
+        from unittest import mock
+        from OFS.Application import Application
+        traverse = Application.unrestrictedTraverse
+
+        def unrestrictedTraverse( self, path, *args ):
+            if 'f1' in path:
+                raise KeyError( 'f1' )
+            return traverse( self, path, *args )
+
+        dumper = self._getDumper( parallelism=3 )
+        with mock.patch.object( Application, 'unrestrictedTraverse'
+                              , unrestrictedTraverse ):
+            with self.assertLogs( 'Products.FSDump', 'ERROR' ):
+                message = dumper.dumpToFS()
+        self.assertIn( ' 1 errors', message )
+        errors = dumper.getDumpStatistics()[ 'errors' ]
+        self.assertEqual( [ ( error[ 'path' ], error[ 'meta_type' ] )
+                            for error in errors ]
+                        , [ ( '/site/f1', 'Folder' ) ] )
+        self.assertIn( 'site/f0/m.dtml', self._listFiles() )
+        self.assertNotIn( 'f1:Folder', self._read( 'site', '.metadata' ) )
+
+
+class PruneTests( SiteTestBase ):
+
+    def tearDown( self ):
+        from zope.testing.cleanup import cleanUp
+        cleanUp()
+        SiteTestBase.tearDown( self )
+
+    def test_deleted_objects_removed( self ):
+        dumper = self._getDumper( prune=1 )
+        dumper.dumpToFS()
+        stray = os.path.join( self.fspath, 'site', 'f0', 'stray.txt' )
+        with open( stray, 'w' ) as file:
+            file.write( 'stray' )
+        self.app.site.manage_delObjects( [ 'f1' ] )
+        self.app.site.f0.manage_delObjects( [ 'pt' ] )
+        self.tm.commit()
+        message = dumper.dumpToFS()
+        self.assertIn( ' 10 deleted,', message )
+        files = self._listFiles()
+        self.assertNotIn( 'site/f0/pt.pt', files )
+        self.assertNotIn( 'site/f0/stray.txt', files )
+        self.assertFalse( os.path.exists( os.path.join( self.fspath
+                                                      , 'site', 'f1' ) ) )
+        self.assertIn( 'site/f0/m.dtml', files )
+
+    def test_deleted_objects_removed_incremental( self ):
+        dumper = self._getDumper( prune=1, incremental=1 )
+        dumper.dumpToFS()
+        self.app.site.f0.manage_delObjects( [ 'pt' ] )
+        self.tm.commit()
+        self.assertIn( ' 2 deleted,', dumper.dumpToFS() )
+        self.assertNotIn( 'site/f0/pt.pt', self._listFiles() )
+        self.assertIn( 'site/f1/pt.pt', self._listFiles() )
+
+    def test_failed_objects_kept( self ):
+        from Products.FSDump.Registry import registerHandler
+
+        def _dumpBroken( dumper, object, path ):
+            raise ValueError( 'broken' )
+
+        dumper = self._getDumper( prune=1 )
+        dumper.dumpToFS()
+        registerHandler( _dumpBroken, 'Page Template' )
+        with self.assertLogs( 'Products.FSDump', 'ERROR' ):
+            self.assertIn( ' 2 errors', dumper.dumpToFS() )
+        self.assertIn( 'site/f0/pt.pt', self._listFiles() )
+        self.assertIn( 'site/f0/pt.pt.metadata', self._listFiles() )
+
+
+class BatchTests( SiteTestBase ):
+
+    def _fillBig( self, count ):
+        from OFS.DTMLMethod import addDTMLMethod
+        for i in range( count ):
+            addDTMLMethod( self.app.site.big, 'm%03d' % i, '', str( i ) )
+        self.tm.commit()
+        self.conn.cacheMinimize()
+
+    def test_items_prefetched_in_batches( self ):
+        from unittest import mock
+        from Products.FSDump.Dumper import Dumper
+        self._fillBig( 24 )
+        batches = []
+
+        def prefetch( objects ):
+            if [ o for o in objects if o.getId().startswith( 'm0' ) ]:
+                batches.append( len( objects ) )
+
+        with mock.patch.object( Dumper, '_batch_size', 10 ):
+            with mock.patch.object( self.conn, 'prefetch'
+                                  , side_effect=prefetch ):
+                self._getDumper().dumpToFS()
+        self.assertEqual( batches, [ 10, 10, 5 ] )
+        files = self._listFiles()
+        self.assertIn( 'site/big/m000.dtml', files )
+        self.assertIn( 'site/big/m023.dtml', files )
+
+    def test_unhandled_items_not_loaded( self ):
+        from unittest import mock
+        from OFS.Folder import Folder
+        from OFS.userfolder import UserFolder
+        self.app.site.f0._setObject( 'acl_users', UserFolder() )
+        self.tm.commit()
+        self.conn.cacheMinimize()
+        dumper = self._getDumper()
+        loaded = []
+        setstate = self.conn.setstate
+
+        def record( object ):
+            loaded.append( object.__class__ )
+            return setstate( object )
+
+        with mock.patch.object( self.conn, 'setstate', side_effect=record ):
+            dumper.dumpToFS()
+        self.assertIn( Folder, loaded )
+        self.assertNotIn( UserFolder, loaded )
+        stats = dict( [ ( info[ 'meta_type' ], info ) for info
+                        in dumper.getDumpStatistics()[ 'metatypes' ] ] )
+        self.assertEqual( stats[ 'User Folder' ][ 'skipped' ], 1 )
+
+
+class MemoryTests( SiteTestBase ):
+
+    def _getCalls( self, name, **kw ):
+        #   Dump, counting the calls to the connection's method 'name'.
+        from unittest import mock
+        dumper = self._getDumper( **kw )
+        with mock.patch.object( self.conn, name
+                              , wraps=getattr( self.conn, name ) ) as method:
+            dumper.dumpToFS()
+        return method.call_count
+
+    def test_objects_released( self ):
+        site = self.app.site
+        oids = [ object._p_oid for object
+                 in ( site.f0, site.f0.m, site.f1.pt, site.big.one ) ]
+        dumper = self._getDumper()
+        self.conn.cacheMinimize()
+        dumper.dumpToFS()
+        for oid in oids:
+            object = self.conn._cache.get( oid )
+            if object is not None:
+                self.assertIsNone( object._p_changed )   # ghost
+
+    def test_modified_objects_kept( self ):
+        self.app.site.f0.m.manage_edit( 'unsaved', 'Method' )
+        self._getDumper().dumpToFS()
+        self.assertEqual( self.app.site.f0.m.read(), 'unsaved' )
+        self.assertEqual( self._read( 'site', 'f0', 'm.dtml' ), 'unsaved\n' )
+
+    def test_gc_interval( self ):
+        self.assertEqual( self._getCalls( 'cacheGC', gc_interval=2 ), 5 )
+        self.assertEqual( self._getCalls( 'cacheGC', gc_interval=100 ), 0 )
+
+    def test_rss_limit( self ):
+        from unittest import mock
+        from Products.FSDump import Dumper
+        with mock.patch.object( Dumper.Dumper, '_rss_check_interval', 5 ):
+            with mock.patch.object( Dumper, '_currentRSS', return_value=50 ):
+                self.assertEqual( self._getCalls( 'cacheMinimize'
+                                                , rss_limit=100 ), 0 )
+                self.assertEqual( self._getCalls( 'cacheMinimize'
+                                                , rss_limit=10 ), 2 )
+
+
+class DumpItemsTests( SiteTestBase ):
+
+    def setUp( self ):
+        from AccessControl.SecurityManagement import newSecurityManager
+        from AccessControl.SpecialUsers import system
+        SiteTestBase.setUp( self )
+        newSecurityManager( None, system )
+
+    def tearDown( self ):
+        from AccessControl.SecurityManagement import noSecurityManager
+        noSecurityManager()
+        SiteTestBase.tearDown( self )
+
+    def test_status_by_path( self ):
+        import io
+        dumper = self._getDumper( exclude_paths=[ '/site/f1/file' ] )
+        status = dumper.dumpItems( [ 'f0', '/site/f0/pt', 'big/one/'
+                                   , '/site/f1/file', '/other/x', 'nope'
+                                   , 'dumper', '' ]
+                                 , path_file=io.BytesIO( b'f1/m\n\n' ) )
+        self.assertEqual( status, { '/site/f0' : 'dumped'
+                                  , '/site/f0/pt' : 'dumped'
+                                  , '/site/big/one' : 'dumped'
+                                  , '/site/f1/file' : 'out of scope'
+                                  , '/other/x' : 'not a peer'
+                                  , '/site/nope' : 'not found'
+                                  , '/site/dumper' : 'skipped'
+                                  , '/site/f1/m' : 'dumped'
+                                  } )
+        self.assertEqual( self._listFiles()
+                        , [ 'site/big/one.dtml', 'site/big/one.dtml.metadata'
+                          , 'site/f0/.metadata', 'site/f0/file'
+                          , 'site/f0/file.metadata', 'site/f0/m.dtml'
+                          , 'site/f0/m.dtml.metadata', 'site/f0/pt.pt'
+                          , 'site/f0/pt.pt.metadata', 'site/f1/m.dtml'
+                          , 'site/f1/m.dtml.metadata' ] )
+
+    def test_path_string( self ):
+        dumper = self._getDumper()
+        self.assertEqual( dumper.dumpItems( '/site/f0/m' )
+                        , { '/site/f0/m' : 'dumped' } )
+        self.assertEqual( dumper.dumpItems( 'f0/pt\nf1/pt' )
+                        , { '/site/f0/pt' : 'dumped'
+                          , '/site/f1/pt' : 'dumped' } )
+
+    def test_missing_below_dumped_container( self ):
+        dumper = self._getDumper()
+        status = dumper.dumpItems( [ 'f0', 'f0/m', 'f0/typo', 'f0/f1' ] )
+        self.assertEqual( status, { '/site/f0' : 'dumped'
+                                  , '/site/f0/m' : 'dumped'
+                                  , '/site/f0/typo' : 'not found'
+                                  , '/site/f0/f1' : 'not found'
+                                  } )
+
+    def test_errors_and_unauthorized( self ):
+        from AccessControl.SecurityManagement import noSecurityManager
+        from Products.FSDump.Registry import registerHandler
+        from zope.testing.cleanup import cleanUp
+
+        def _dumpBroken( dumper, object, path ):
+            raise ValueError( 'broken' )
+
+        registerHandler( _dumpBroken, 'Page Template' )
+        try:
+            dumper = self._getDumper()
+            with self.assertLogs( 'Products.FSDump', 'ERROR' ):
+                self.assertEqual( dumper.dumpItems( [ 'f0/pt' ] )
+                                , { '/site/f0/pt' : 'error' } )
+            self.app.site.f0.m.manage_permission( 'View', [ 'Manager' ], 0 )
+            noSecurityManager()
+            self.assertEqual( dumper.dumpItems( [ 'f0/m' ] )
+                            , { '/site/f0/m' : 'unauthorized' } )
+        finally:
+            cleanUp()
+
+    def test_catalog_query_keeps_other_files( self ):
+        from Products.PluginIndexes.FieldIndex.FieldIndex import FieldIndex
+        from Products.ZCatalog.ZCatalog import ZCatalog
+        site = self.app.site
+        site._setObject( 'catalog', ZCatalog( 'catalog' ) )
+        site.catalog.addIndex( 'meta_type', FieldIndex( 'meta_type' ) )
+        for object in ( site.f0.m, site.f1.pt ):
+            site.catalog.catalog_object( object )
+        self.tm.commit()
+        dumper = self._getDumper( prune=1 )
+        dumper.dumpToFS()
+        site.f1.pt.pt_setTitle( 'Changed', 'utf-8' )
+        os.remove( os.path.join( self.fspath, 'site', 'f0', 'm.dtml' ) )
+        self.tm.commit()
+        query = { 'meta_type' : 'Page Template' }
+        self.assertEqual( dumper.dumpItems( catalog_path='catalog'
+                                          , query=query )
+                        , { '/site/f1/pt' : 'dumped' } )
+        self.assertIn( 'title=Changed'
+                     , self._read( 'site', 'f1', 'pt.pt.metadata' ) )
+        self.assertNotIn( 'site/f0/m.dtml', self._listFiles() )
+        self.assertIn( 'site/f1/m.dtml', self._listFiles() )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
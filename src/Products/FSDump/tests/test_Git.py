@@ -0,0 +1,59 @@
+import os
+import shutil
+import subprocess
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+@unittest.skipUnless( shutil.which( 'git' ), 'git is not installed' )
+class DumpToGitTests( SiteTestBase ):
+
+    def setUp( self ):
+        SiteTestBase.setUp( self )
+        self.repository = os.path.join( self.tempdir, 'site.git' )
+
+    def _git( self, *args ):
+        return subprocess.run( [ 'git', '-C', self.repository ] + list( args )
+                             , stdout=subprocess.PIPE, check=True
+                             ).stdout.decode( 'utf-8' )
+
+    def _listTree( self, branch='fsdump' ):
+        return sorted( self._git( 'ls-tree', '-r', '--name-only'
+                                , branch ).split() )
+
+    def test_commit_matches_filesystem_dump( self ):
+        dumper = self._getDumper()
+        dumper.dumpToFS()
+        dumper.dumpToGit( self.repository )
+        self.assertEqual( self._listTree(), self._listFiles() )
+        self.assertEqual( self._git( 'show', 'fsdump:site/f0/m.dtml' )
+                        , self._read( 'site', 'f0', 'm.dtml' ) )
+
+    def test_unchanged_dump_makes_no_commit( self ):
+        dumper = self._getDumper()
+        dumper.dumpToGit( self.repository )
+        head = self._git( 'rev-parse', 'fsdump' )
+        dumper.dumpToGit( self.repository )
+        self.assertEqual( self._git( 'rev-parse', 'fsdump' ), head )
+
+    def test_removed_item_is_dropped( self ):
+        dumper = self._getDumper()
+        dumper.dumpToGit( self.repository, 'main' )
+        self.app.site.f0.manage_delObjects( [ 'm' ] )
+        dumper.dumpToGit( self.repository, 'main' )
+        tree = self._listTree( 'main' )
+        self.assertNotIn( 'site/f0/m.dtml', tree )
+        self.assertIn( 'site/f1/m.dtml', tree )
+        self.assertEqual( len( self._git( 'rev-list', 'main' ).split() ), 2 )
+
+    def test_invalid_branch_names( self ):
+        dumper = self._getDumper()
+        for branch in ( 'a b', 'a\nb', '../x', '-x', 'refs/../x' ):
+            self.assertRaises( ValueError, dumper.dumpToGit
+                             , self.repository, branch )
+        self.assertFalse( os.path.exists( self.repository ) )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import unittest
+from binascii import hexlify
+from hashlib import sha1
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class DumpIndexTests( SiteTestBase ):
+
+    def _query( self, sql, *args ):
+        db = sqlite3.connect( os.path.join( self.fspath
+                                          , '.fsdump_index.sqlite' ) )
+        try:
+            return db.execute( sql, args ).fetchall()
+        finally:
+            db.close()
+
+    def test_objects_and_files( self ):
+        self._getDumper( write_index=1 ).dumpToFS()
+        method = self.app.site.f0.m
+        method._p_activate()
+        self.assertEqual( self._query( 'SELECT meta_type, serial, run'
+                                       ' FROM objects WHERE path = ?'
+                                     , '/site/f0/m' )
+                        , [ ( 'DTML Method'
+                            , hexlify( method._p_serial ).decode( 'ascii' )
+                            , 1 ) ] )
+        self.assertEqual( len( self._query( 'SELECT path FROM objects' ) )
+                        , 11 )
+        content = self._read( 'site', 'f0', 'm.dtml' ).encode( 'utf-8' )
+        self.assertEqual( self._query( 'SELECT path, size, sha1 FROM files'
+                                       ' WHERE filename = ?'
+                                     , 'site/f0/m.dtml' )
+                        , [ ( '/site/f0/m', len( content )
+                            , sha1( content ).hexdigest() ) ] )
+        self.assertEqual( self._query( 'SELECT filename FROM files'
+                                       ' WHERE path = ? ORDER BY filename'
+                                     , '/site/f1/file' )
+                        , [ ( 'site/f1/file', )
+                          , ( 'site/f1/file.metadata', ) ] )
+
+    def test_incremental_runs( self ):
+        dumper = self._getDumper( write_index=1, incremental=1 )
+        dumper.dumpToFS()
+        self.app.site.f1.manage_delObjects( [ 'pt' ] )
+        self.tm.commit()
+        dumper.dumpToFS()
+        self.assertEqual( self._query( 'SELECT DISTINCT run FROM objects' )
+                        , [ ( 2, ) ] )
+        self.assertEqual( self._query( 'SELECT * FROM objects'
+                                       ' WHERE path = ?', '/site/f1/pt' )
+                        , [] )
+        self.assertEqual( self._query( 'SELECT * FROM files'
+                                       ' WHERE path = ?', '/site/f1/pt' )
+                        , [] )
+        self.assertEqual( len( self._query( 'SELECT path FROM files'
+                                            ' WHERE path = ?'
+                                          , '/site/f0/pt' ) ), 2 )
+
+    def test_fresh_index_dumps_everything( self ):
+        self._getDumper( incremental=1 ).dumpToFS()
+        self._getDumper( incremental=1, write_index=1 ).dumpToFS()
+        self.assertEqual( len( self._query( 'SELECT path FROM objects' ) )
+                        , 11 )
+        self.assertEqual( len( self._query( 'SELECT * FROM files' ) ), 18 )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
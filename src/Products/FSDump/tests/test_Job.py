@@ -0,0 +1,111 @@
+import os
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class CheckpointTests( unittest.TestCase ):
+
+    def setUp( self ):
+        import tempfile
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        import shutil
+        shutil.rmtree( self.tempdir )
+
+    def _makeOne( self, settings=None ):
+        from Products.FSDump.Checkpoint import Checkpoint
+        return Checkpoint( self.tempdir, settings or { 'format' : 2 } )
+
+    def test_resume( self ):
+        checkpoint = self._makeOne()
+        checkpoint.complete( '/site/f0' )
+        checkpoint.close()
+        resumed = self._makeOne()
+        resumed.load()
+        self.assertTrue( resumed.isComplete( '/site/f0' ) )
+        resumed.complete( '/site/f1' )
+        resumed.close()
+        with open( os.path.join( self.tempdir, '.fsdump_checkpoint' )
+                 , 'a' ) as file:
+            file.write( '/site/partial' )
+        checkpoint = self._makeOne()
+        checkpoint.load()
+        self.assertEqual( checkpoint.completed
+                        , set( [ '/site/f0', '/site/f1' ] ) )
+        checkpoint.remove()
+        self.assertEqual( os.listdir( self.tempdir ), [] )
+
+    def test_other_settings_ignored( self ):
+        checkpoint = self._makeOne()
+        checkpoint.complete( '/site/f0' )
+        checkpoint.close()
+        checkpoint = self._makeOne( { 'format' : 1 } )
+        checkpoint.load()
+        self.assertFalse( checkpoint.isComplete( '/site/f0' ) )
+
+
+class DumpJobTests( SiteTestBase ):
+
+    def tearDown( self ):
+        from zope.testing.cleanup import cleanUp
+        cleanUp()
+        SiteTestBase.tearDown( self )
+
+    def _registerCounter( self, fail=None ):
+        #   Count the DTML Methods dumped;  interrupt the run, as a
+        #   conflict would, on reaching the path 'fail'.
+        from ZODB.POSException import ConflictError
+        from Products.FSDump.Dumper import Dumper
+        from Products.FSDump.Registry import registerHandler
+        dumped = []
+
+        def _dumpDTMLMethod( dumper, object, path ):
+            if object.getPhysicalPath() == fail:
+                raise ConflictError
+            dumped.append( '/'.join( object.getPhysicalPath() ) )
+            return Dumper._dumpDTMLMethod( dumper, object, path )
+
+        registerHandler( _dumpDTMLMethod, 'DTML Method' )
+        return dumped
+
+    def test_resume_after_interruption( self ):
+        from ZODB.POSException import ConflictError
+        from Products.FSDump.Job import JobProgress
+        dumper = self._getDumper()
+        self._registerCounter( fail=( '', 'site', 'f1', 'm' ) )
+        self.assertRaises( ConflictError, dumper._runJob, JobProgress() )
+        self.assertIn( '/site/f0'
+                     , self._read( '.fsdump_checkpoint' ).splitlines() )
+
+        dumped = self._registerCounter()
+        progress = JobProgress()
+        message = dumper._runJob( progress )
+        self.assertIn( ' 0 errors', message )
+        self.assertEqual( progress.resumed, 1 )
+        self.assertEqual( dumped, [ '/site/f1/m', '/site/big/one' ] )
+        files = self._listFiles()
+        self.assertNotIn( '.fsdump_checkpoint', files )
+        self.assertIn( 'site/f0/m.dtml', files )
+        self.assertIn( 'site/f1/m.dtml', files )
+
+    def test_background_job( self ):
+        dumper = self._getDumper()
+        self.assertEqual( dumper.getDumpJobStatus(), { 'state' : 'none' } )
+        self.assertEqual( dumper.startDumpJob(), 'Dump job started.' )
+        self.tm.commit()
+        from Products.FSDump.Job import getJob
+        job = getJob( dumper._getJobKey() )
+        job.join( 30 )
+        status = dumper.getDumpJobStatus()
+        self.assertEqual( status[ 'state' ], 'finished' )
+        self.assertEqual( ( status[ 'done' ], status[ 'pending' ] )
+                        , ( 10, 0 ) )
+        self.assertIn( 'site/f1/pt.pt', self._listFiles() )
+        self.tm.abort()
+        self.assertIsNotNone( dumper.getDumpStatistics() )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
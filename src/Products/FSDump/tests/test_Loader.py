@@ -0,0 +1,111 @@
+import os
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class LoaderTests( SiteTestBase ):
+
+    def _makeOne( self, *args, **kw ):
+        from Products.FSDump.Loader import Loader
+        return Loader( *args, **kw )
+
+    def _makeCopy( self ):
+        from OFS.Folder import Folder
+        self.app._setObject( 'copy', Folder( 'copy' ) )
+        self.tm.commit()
+        return self.app.copy
+
+    def _readTree( self, root ):
+        contents = {}
+        for name in self._listFiles( root ):
+            with open( os.path.join( root, name ), 'rb' ) as file:
+                contents[ name ] = file.read()
+        return contents
+
+    def _assertRoundTrip( self, **kw ):
+        self._getDumper( **kw ).dumpToFS()
+        copy = self._makeCopy()
+        message = self._makeOne().load( copy
+                                       , os.path.join( self.fspath, 'site' ) )
+        self.assertEqual( message
+                        , '10 created, 0 existing, 0 skipped, 0 errors' )
+        self.tm.abort()
+        self.assertEqual( copy.f0.m.title, 'Method' )
+        self.assertEqual( copy.f0.file.data, b'x' * 1000 )
+        self.assertEqual( copy.big.meta_type, 'BTreeFolder2' )
+
+        copy._setObject( 'dumper', self.app.site.dumper._getCopy( copy ) )
+        self.tm.commit()
+        copied = os.path.join( self.tempdir, 'copy' )
+        copy.dumper.edit( copied, kw.pop( 'use_metadata_file', 1 ), **kw )
+        copy.dumper.dumpToFS()
+        self.assertEqual( self._readTree( os.path.join( copied, 'copy' ) )
+                        , self._readTree( os.path.join( self.fspath
+                                                      , 'site' ) ) )
+
+    def test_round_trip_metadata( self ):
+        self._assertRoundTrip()
+
+    def test_round_trip_properties( self ):
+        self._assertRoundTrip( use_metadata_file=0 )
+
+    def test_existing_and_replace( self ):
+        self._getDumper().dumpToFS()
+        dirpath = os.path.join( self.fspath, 'site' )
+        copy = self._makeCopy()
+        self._makeOne().load( copy, dirpath )
+        copy.f0.m.manage_edit( 'changed', 'Changed' )
+        self.tm.commit()
+        self.assertEqual( self._makeOne().load( copy, dirpath )
+                        , '0 created, 3 existing, 0 skipped, 0 errors' )
+        self.assertEqual( copy.f0.m.title, 'Changed' )
+        self.assertEqual( self._makeOne( replace=True ).load( copy, dirpath )
+                        , '10 created, 0 existing, 0 skipped, 0 errors' )
+        self.assertEqual( copy.f0.m.title, 'Method' )
+
+    def test_failed_replacement_keeps_item( self ):
+        from unittest import mock
+        from Products.FSDump.Loader import Loader
+        self._getDumper().dumpToFS()
+        dirpath = os.path.join( self.fspath, 'site' )
+        copy = self._makeCopy()
+        self._makeOne().load( copy, dirpath )
+        copy.big.one.manage_edit( 'changed', 'Changed' )
+        self.tm.commit()
+
+        _loadBTreeFolder2 = Loader._loaders[ 'BTreeFolder2' ]
+
+        def _loadBroken( loader, container, dirpath, id ):
+            _loadBTreeFolder2( loader, container, dirpath, id )
+            raise ValueError( 'broken' )
+
+        loaders = dict( Loader._loaders, **{ 'BTreeFolder2' : _loadBroken } )
+        loader = self._makeOne( replace=True, batch_size=1
+                              , savepoint_size=1 )
+        with mock.patch.object( Loader, '_loaders', loaders ):
+            with self.assertLogs( 'Products.FSDump', 'ERROR' ):
+                message = loader.load( copy, dirpath )
+        self.assertEqual( message
+                        , '9 created, 0 existing, 0 skipped, 1 errors' )
+        self.tm.abort()
+        self.assertEqual( copy.big.one.title, 'Changed' )
+        self.assertEqual( copy.big.one.read(), 'changed' )
+        self.assertEqual( copy.f0.m.title, 'Method' )
+
+    def test_parallel_and_batches( self ):
+        self._getDumper().dumpToFS()
+        copy = self._makeCopy()
+        loader = self._makeOne( batch_size=2, savepoint_size=1
+                              , parallelism=2 )
+        self.assertEqual( loader.load( copy, os.path.join( self.fspath
+                                                         , 'site' ) )
+                        , '10 created, 0 existing, 0 skipped, 0 errors' )
+        self.tm.abort()
+        self.assertEqual( sorted( copy.f1.objectIds() )
+                        , [ 'file', 'm', 'pt' ] )
+        self.assertEqual( copy.big.one.read(), 'one\n' )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,126 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class FilesystemOutputTests( unittest.TestCase ):
+
+    def setUp( self ):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.tempdir )
+
+    def _makeOne( self, *args, **kw ):
+        from Products.FSDump.Output import FilesystemOutput
+        return FilesystemOutput( *args, **kw )
+
+    def _write( self, output, name, *chunks ):
+        fullpath = os.path.join( self.tempdir, name )
+        file = output.openFile( fullpath )
+        for chunk in chunks:
+            file.write( chunk )
+        file.close()
+        return fullpath
+
+    def _read( self, fullpath ):
+        with open( fullpath, 'rb' ) as file:
+            return file.read()
+
+    def test_new_file( self ):
+        output = self._makeOne()
+        fullpath = self._write( output, 'a', 'h\xe9llo' )
+        self.assertEqual( self._read( fullpath ), b'h\xc3\xa9llo' )
+        self.assertEqual( output.summarize()
+                        , '1 written, 0 unchanged, 0 deleted' )
+        self.assertTrue( output.isKept( fullpath ) )
+
+    def test_unchanged_file_left_alone( self ):
+        fullpath = self._write( self._makeOne(), 'a', b'same' )
+        inode = os.stat( fullpath ).st_ino
+        output = self._makeOne()
+        self._write( output, 'a', b'sa', b'me' )
+        self.assertEqual( os.stat( fullpath ).st_ino, inode )
+        self.assertEqual( output.summarize()
+                        , '0 written, 1 unchanged, 0 deleted' )
+
+    def test_changed_file_replaced( self ):
+        fullpath = self._write( self._makeOne(), 'a', b'same' )
+        output = self._makeOne()
+        self._write( output, 'a', b'sane' )
+        self.assertEqual( self._read( fullpath ), b'sane' )
+        self.assertEqual( output.written, 1 )
+        self.assertEqual( os.listdir( self.tempdir ), [ 'a' ] )
+
+    def test_spilled_content( self ):
+        data = b'x' * 100
+        output = self._makeOne()
+        output.spool_size = 10
+        fullpath = self._write( output, 'a', data[ :50 ], data[ 50: ] )
+        self.assertEqual( self._read( fullpath ), data )
+        self._write( output, 'a', data )
+        self._write( output, 'a', data[ :-1 ] + b'y' )
+        self.assertEqual( self._read( fullpath ), data[ :-1 ] + b'y' )
+        self.assertEqual( ( output.written, output.unchanged ), ( 2, 1 ) )
+        self.assertEqual( os.listdir( self.tempdir ), [ 'a' ] )
+
+    def test_copyFile( self ):
+        source = self._write( self._makeOne(), 'source', b'data' )
+        target = os.path.join( self.tempdir, 'target' )
+        output = self._makeOne()
+        output.copyFile( source, target )
+        output.copyFile( source, target )
+        self.assertEqual( self._read( target ), b'data' )
+        self.assertEqual( ( output.written, output.unchanged ), ( 1, 1 ) )
+
+    def test_copyFile_compares_size_and_mtime( self ):
+        from unittest import mock
+        source = self._write( self._makeOne(), 'source', b'data' )
+        target = os.path.join( self.tempdir, 'target' )
+        output = self._makeOne()
+        output.copyFile( source, target )
+        with mock.patch( 'Products.FSDump.Output._digestFile'
+                       , side_effect=AssertionError( 'hashed' ) ):
+            output.copyFile( source, target )
+            with open( source, 'wb' ) as file:
+                file.write( b'DATA' )
+            os.utime( source, ns=( 0, 1000000000 ) )
+            output.copyFile( source, target )
+        self.assertEqual( self._read( target ), b'DATA' )
+        self.assertEqual( ( output.written, output.unchanged ), ( 2, 1 ) )
+
+
+    def test_writer_threads( self ):
+        import threading
+        output = self._makeOne( writers=2, queue_size=2 )
+        written = []
+        _write = output._write
+
+        def _recordingWrite( outfile ):
+            written.append( threading.current_thread().name )
+            _write( outfile )
+
+        output._write = _recordingWrite
+        for i in range( 20 ):
+            self._write( output, 'f%02d' % i, b'%d' % i )
+        output.flush()
+        self.assertEqual( len( os.listdir( self.tempdir ) ), 20 )
+        self.assertEqual( self._read( os.path.join( self.tempdir, 'f13' ) )
+                        , b'13' )
+        self.assertEqual( output.written, 20 )
+        self.assertEqual( set( [ name[ :-1 ] for name in written ] )
+                        , set( [ 'fsdump-writer-' ] ) )
+        self.assertFalse( [ thread for thread in threading.enumerate()
+                            if thread.name.startswith( 'fsdump-writer-' ) ] )
+
+    def test_writer_error_raised_on_flush( self ):
+        output = self._makeOne( writers=1 )
+        self._write( output, 'missing/a', b'data' )
+        with self.assertLogs( 'Products.FSDump', 'ERROR' ):
+            self.assertRaises( FileNotFoundError, output.flush )
+        output.flush()
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
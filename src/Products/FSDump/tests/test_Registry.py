@@ -0,0 +1,83 @@
+import unittest
+
+from OFS.Folder import Folder
+
+
+class _Thing( Folder ):
+    meta_type = 'FSDump Test Thing'
+
+
+class RegistryTests( unittest.TestCase ):
+
+    def tearDown( self ):
+        from zope.testing.cleanup import cleanUp
+        cleanUp()
+
+    def test_builtin_handler( self ):
+        from Products.FSDump.Dumper import Dumper
+        from Products.FSDump.Registry import lookupHandler
+        handler = lookupHandler( Folder() )
+        self.assertIs( handler.func, Dumper._dumpFolder )
+
+    def test_registered_handler( self ):
+        from Products.FSDump.Registry import getHandledMetaTypes
+        from Products.FSDump.Registry import lookupHandler
+        from Products.FSDump.Registry import registerHandler
+        from Products.FSDump.Registry import unregisterHandler
+
+        def _dumpThing( dumper, object, path ):
+            pass
+
+        registerHandler( _dumpThing, _Thing.meta_type )
+        self.assertIs( lookupHandler( _Thing() ).func, _dumpThing )
+        self.assertIn( _Thing.meta_type, getHandledMetaTypes() )
+
+        unregisterHandler( _Thing.meta_type )
+        self.assertIsNone( lookupHandler( _Thing() ) )
+        self.assertNotIn( _Thing.meta_type, getHandledMetaTypes() )
+
+    def test_cleanup_keeps_builtin_handlers( self ):
+        from zope.component.testing import tearDown
+        from zope.testing.cleanup import cleanUp
+        from Products.FSDump.Dumper import Dumper
+        from Products.FSDump.Registry import getHandledMetaTypes
+        from Products.FSDump.Registry import lookupHandler
+        from Products.FSDump.Registry import registerHandler
+
+        def _dumpThing( dumper, object, path ):
+            pass
+
+        registerHandler( _dumpThing, _Thing.meta_type )
+        self.assertIs( lookupHandler( _Thing() ).func, _dumpThing )
+
+        for clean in ( cleanUp, tearDown ):
+            clean()
+            self.assertIsNone( lookupHandler( _Thing() ) )
+            self.assertNotIn( _Thing.meta_type, getHandledMetaTypes() )
+            self.assertIs( lookupHandler( Folder() ).func
+                         , Dumper._dumpFolder )
+            self.assertIn( 'Folder', getHandledMetaTypes() )
+
+
+    def test_deprecated_handlers_mapping( self ):
+        from Products.FSDump.Dumper import Dumper
+        from Products.FSDump.Registry import lookupHandler
+
+        def _dumpThing( dumper, object, path ):
+            pass
+
+        with self.assertWarns( DeprecationWarning ):
+            Dumper._handlers[ _Thing.meta_type ] = _dumpThing
+        self.assertIs( lookupHandler( _Thing() ).func, _dumpThing )
+        self.assertIn( _Thing.meta_type, Dumper._handlers )
+        self.assertIn( 'Folder', list( Dumper._handlers ) )
+        with self.assertWarns( DeprecationWarning ):
+            self.assertIs( Dumper._handlers[ 'Folder' ], Dumper._dumpFolder )
+        with self.assertWarns( DeprecationWarning ):
+            del Dumper._handlers[ _Thing.meta_type ]
+        self.assertIsNone( lookupHandler( _Thing() ) )
+        self.assertNotIn( _Thing.meta_type, Dumper._handlers )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
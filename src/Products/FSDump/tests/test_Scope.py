@@ -0,0 +1,60 @@
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class DumpScopeTests( unittest.TestCase ):
+
+    def _makeOne( self, *args, **kw ):
+        from Products.FSDump.Scope import DumpScope
+        return DumpScope( *args, **kw )
+
+    def test_exclude_anchored( self ):
+        scope = self._makeOne( exclude_paths=[ '/site/temp_*' ] )
+        self.assertFalse( scope.allowsPath( ( '', 'site', 'temp_folder' ) ) )
+        self.assertTrue( scope.allowsPath( ( '', 'site', 'other' ) ) )
+        self.assertTrue( scope.allowsPath( ( '', 'x', 'site', 'temp_y' ) ) )
+
+    def test_exclude_any_depth( self ):
+        scope = self._makeOne( exclude_paths=[ 'cache' ] )
+        self.assertFalse( scope.allowsPath( ( '', 'a', 'b', 'cache' ) ) )
+        self.assertTrue( scope.allowsPath( ( '', 'a', 'caches' ) ) )
+
+    def test_include_keeps_containers_and_subtree( self ):
+        scope = self._makeOne( include_paths=[ '/site/f0/**' ] )
+        self.assertTrue( scope.allowsPath( ( '', 'site' ) ) )
+        self.assertTrue( scope.allowsPath( ( '', 'site', 'f0' ) ) )
+        self.assertTrue( scope.allowsPath( ( '', 'site', 'f0', 'm' ) ) )
+        self.assertFalse( scope.allowsPath( ( '', 'site', 'f1' ) ) )
+
+    def test_meta_types( self ):
+        scope = self._makeOne( include_meta_types=[ 'Folder', 'File' ]
+                             , exclude_meta_types=[ 'File' ] )
+        self.assertTrue( scope.allowsMetaType( 'Folder' ) )
+        self.assertFalse( scope.allowsMetaType( 'File' ) )
+        self.assertFalse( scope.allowsMetaType( 'DTML Method' ) )
+
+
+class ScopedDumpTests( SiteTestBase ):
+
+    def test_exclude_paths_and_meta_types( self ):
+        dumper = self._getDumper( exclude_paths=[ '/site/f1' ]
+                                , exclude_meta_types=[ 'File' ] )
+        dumper.dumpToFS()
+        files = self._listFiles()
+        self.assertIn( 'site/f0/m.dtml', files )
+        self.assertNotIn( 'site/f0/file', files )
+        self.assertFalse( [ name for name in files
+                            if name.startswith( 'site/f1' ) ] )
+        self.assertNotIn( 'f1:Folder', self._read( 'site', '.metadata' ) )
+
+    def test_include_paths( self ):
+        dumper = self._getDumper( include_paths=[ '/site/f1/pt' ] )
+        dumper.dumpToFS()
+        self.assertEqual( self._listFiles()
+                        , [ 'site/.metadata', 'site/f1/.metadata'
+                          , 'site/f1/pt.pt', 'site/f1/pt.pt.metadata' ] )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
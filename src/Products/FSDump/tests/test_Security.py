@@ -0,0 +1,69 @@
+import io
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+def _writeSettings( obj, file ):
+    #   The '[security]' section as computed from 'permission_settings'.
+    header_written = 0
+    valid_roles = obj.valid_roles()
+    for perm_dict in obj.permission_settings():
+        acquire = ( perm_dict[ 'acquire' ] and 1 ) or 0
+        roles = [ valid_roles[ i ] for i in range( len( valid_roles ) )
+                  if perm_dict[ 'roles' ][ i ][ 'checked' ] ]
+        if roles or acquire == 0:
+            if not header_written:
+                header_written = 1
+                file.write( '\n[security]\n' )
+            file.write( '%s=%d:%s\n' % ( perm_dict[ 'name' ], acquire
+                                       , ','.join( roles ) ) )
+
+
+class SecurityExporterTests( SiteTestBase ):
+
+    def _makeOne( self ):
+        from Products.FSDump.Security import SecurityExporter
+        return SecurityExporter()
+
+    def _setPermissions( self ):
+        site = self.app.site
+        site.f0.m.manage_permission( 'View', [ 'Manager', 'Owner' ], 0 )
+        site.f0.manage_permission( 'Access contents information'
+                                 , [ 'Anonymous' ], 1 )
+        site.f1._addRole( 'Editor' )
+        site.f1.pt.manage_permission( 'View', [ 'Editor' ], 1 )
+        site.f1.pt.manage_permission( 'Change Page Templates', [], 0 )
+        site.big.one.manage_permission( 'View', [], 1 )
+        self.tm.commit()
+
+    def _getObjects( self ):
+        site = self.app.site
+        return [ site, site.f0, site.f0.m, site.f0.pt, site.f0.file, site.f1
+               , site.f1.m, site.f1.pt, site.big, site.big.one ]
+
+    def test_matches_permission_settings( self ):
+        self._setPermissions()
+        exporter = self._makeOne()
+        for obj in self._getObjects():
+            expected, found = io.StringIO(), io.StringIO()
+            _writeSettings( obj, expected )
+            exporter.write( obj, found )
+            self.assertEqual( found.getvalue(), expected.getvalue()
+                            , '/'.join( obj.getPhysicalPath() ) )
+
+    def test_dumped_metadata( self ):
+        self._setPermissions()
+        self._getDumper().dumpToFS()
+        self.assertIn( '\n[security]\nView=0:Manager,Owner\n'
+                     , self._read( 'site', 'f0', 'm.dtml.metadata' ) )
+        self.assertIn( 'View=1:Editor\n'
+                     , self._read( 'site', 'f1', 'pt.pt.metadata' ) )
+        self.assertIn( 'Change Page Templates=0:\n'
+                     , self._read( 'site', 'f1', 'pt.pt.metadata' ) )
+        self.assertNotIn( '[security]'
+                        , self._read( 'site', 'f1', 'm.dtml.metadata' ) )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import sys
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class DumpStatsTests( unittest.TestCase ):
+
+    def _makeOne( self, *args, **kw ):
+        from Products.FSDump.Stats import DumpStats
+        return DumpStats( *args, **kw )
+
+    def test_record_and_snapshot( self ):
+        stats = self._makeOne()
+        stats.max_paths = 2
+        stats.record( '/a', 'File', 0.5, files=2, bytes=10 )
+        stats.record( '/b', 'File', 0.1, unchanged=True )
+        stats.record( '/c', 'Folder', 1.0, files=1, bytes=3 )
+        stats.skip( 'User Folder', 3 )
+        snapshot = stats.snapshot()
+        self.assertEqual( [ entry[ 'meta_type' ]
+                            for entry in snapshot[ 'metatypes' ] ]
+                        , [ 'Folder', 'File', 'User Folder' ] )
+        entry = snapshot[ 'metatypes' ][ 1 ]
+        self.assertEqual( ( entry[ 'count' ], entry[ 'unchanged' ]
+                          , entry[ 'files' ], entry[ 'bytes' ] )
+                        , ( 2, 1, 2, 10 ) )
+        self.assertEqual( snapshot[ 'metatypes' ][ 2 ][ 'skipped' ], 3 )
+        self.assertEqual( [ entry[ 'path' ]
+                            for entry in snapshot[ 'slowest' ] ]
+                        , [ '/c', '/a' ] )
+        self.assertEqual( stats.getErrorCount(), 0 )
+
+    def test_errors_and_log( self ):
+        log = io.StringIO()
+        log.close = lambda: None
+        stats = self._makeOne( log )
+        try:
+            raise ValueError( 'broken' )
+        except ValueError:
+            stats.record( '/a', 'File', 0.1, exc_info=sys.exc_info() )
+        stats.close()
+        self.assertEqual( stats.getErrorCount(), 1 )
+        error = stats.snapshot()[ 'errors' ][ 0 ]
+        self.assertEqual( error[ 'path' ], '/a' )
+        self.assertIn( 'ValueError: broken', error[ 'traceback' ] )
+        line = json.loads( log.getvalue() )
+        self.assertEqual( line[ 'path' ], '/a' )
+        self.assertIn( 'ValueError: broken', line[ 'error' ] )
+
+
+class DumperStatsTests( SiteTestBase ):
+
+    def tearDown( self ):
+        from zope.testing.cleanup import cleanUp
+        cleanUp()
+        SiteTestBase.tearDown( self )
+
+    def _getEntries( self, dumper ):
+        return dict( [ ( entry[ 'meta_type' ], entry ) for entry
+                       in dumper.getDumpStatistics()[ 'metatypes' ] ] )
+
+    def test_counts_files_and_bytes( self ):
+        dumper = self._getDumper()
+        self.assertIsNone( dumper.getDumpStatistics() )
+        dumper.dumpToFS()
+        entries = self._getEntries( dumper )
+        self.assertEqual( entries[ 'File' ][ 'count' ], 2 )
+        self.assertEqual( entries[ 'File' ][ 'files' ], 4 )
+        sizes = sum( [ os.path.getsize( os.path.join( self.fspath, name ) )
+                       for name in self._listFiles()
+                       if name.startswith( 'site/f' )
+                      and name.split( '/' )[ -1 ].startswith( 'file' ) ] )
+        self.assertEqual( entries[ 'File' ][ 'bytes' ], sizes )
+        self.assertEqual( entries[ 'Dumper' ][ 'skipped' ], 1 )
+
+    def test_statistics_not_stored( self ):
+        dumper = self._getDumper()
+        self.tm.commit()
+        dumper.dumpToFS()
+        self.assertFalse( dumper._p_changed )
+        self.assertIsNotNone( dumper.getDumpStatistics() )
+        self.assertNotIn( 'last_stats', dumper.__dict__ )
+
+    def test_handler_errors_logged( self ):
+        from Products.FSDump.Registry import registerHandler
+
+        def _dumpBroken( dumper, object, path ):
+            raise ValueError( 'broken' )
+
+        registerHandler( _dumpBroken, 'Page Template' )
+        log = os.path.join( self.tempdir, 'stats.log' )
+        dumper = self._getDumper( stats_log=log )
+        with self.assertLogs( 'Products.FSDump', 'ERROR' ) as logged:
+            self.assertIn( ' 2 errors', dumper.dumpToFS() )
+        self.assertEqual( len( logged.records ), 2 )
+        errors = dumper.getDumpStatistics()[ 'errors' ]
+        self.assertEqual( sorted( [ error[ 'path' ] for error in errors ] )
+                        , [ '/site/f0/pt', '/site/f1/pt' ] )
+        with open( log ) as file:
+            lines = [ json.loads( line ) for line in file ]
+        self.assertEqual( len( lines ), 11 )
+        self.assertEqual( len( [ line for line in lines if line[ 'error' ] ] )
+                        , 2 )
+
+    def test_relative_log_rejected( self ):
+        self.assertRaises( ValueError, self._getDumper, stats_log='x.log' )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
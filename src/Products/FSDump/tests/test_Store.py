@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class ContentStoreTests( SiteTestBase ):
+
+    def _getStoreFiles( self ):
+        return [ name for name in self._listFiles()
+                 if name.startswith( '.fsdump_store/' )
+                and not name.endswith( '/digests' ) ]
+
+    def _stat( self, *names ):
+        return os.stat( os.path.join( self.fspath, *names ) )
+
+    def test_payloads_shared( self ):
+        from hashlib import sha1
+        self._getDumper( content_store=1 ).dumpToFS()
+        digest = sha1( b'x' * 1000 ).hexdigest()
+        self.assertEqual( self._getStoreFiles()
+                        , [ '.fsdump_store/%s/%s' % ( digest[ :2 ]
+                                                    , digest ) ] )
+        first = self._stat( 'site', 'f0', 'file' )
+        second = self._stat( 'site', 'f1', 'file' )
+        self.assertEqual( first.st_ino, second.st_ino )
+        self.assertEqual( first.st_nlink, 3 )
+        with open( os.path.join( self.fspath, 'site', 'f0', 'file' )
+                 , 'rb' ) as file:
+            self.assertEqual( file.read(), b'x' * 1000 )
+
+    def test_unchanged_payload_not_read( self ):
+        from unittest import mock
+        from Products.FSDump.Store import ContentStore
+        dumper = self._getDumper( content_store=1 )
+        dumper.dumpToFS()
+        with mock.patch.object( ContentStore, 'add' ) as add:
+            message = dumper.dumpToFS()
+        self.assertFalse( add.called )
+        self.assertIn( ' 0 written,', message )
+
+    def test_collect_unlinked_payloads( self ):
+        dumper = self._getDumper( content_store=1, prune=1 )
+        dumper.dumpToFS()
+        self.app.site.f0.file.update_data( b'y' * 10 )
+        self.app.site.f1.manage_delObjects( [ 'file' ] )
+        self.tm.commit()
+        dumper.dumpToFS()
+        self.assertEqual( len( self._getStoreFiles() ), 1 )
+        with open( os.path.join( self.fspath, 'site', 'f0', 'file' )
+                 , 'rb' ) as file:
+            self.assertEqual( file.read(), b'y' * 10 )
+        self.assertEqual( self._stat( 'site', 'f0', 'file' ).st_nlink, 2 )
+
+    def test_not_used_without_hard_links( self ):
+        from unittest import mock
+        dumper = self._getDumper( content_store=1, prune=1 )
+        with mock.patch( 'os.link', side_effect=OSError( 'no links' ) ):
+            with self.assertLogs( 'Products.FSDump', 'WARNING' ):
+                dumper.dumpToFS()
+            with self.assertLogs( 'Products.FSDump', 'WARNING' ):
+                message = dumper.dumpToFS()
+        self.assertEqual( self._getStoreFiles(), [] )
+        self.assertIn( ' 0 written,', message )
+        with open( os.path.join( self.fspath, 'site', 'f0', 'file' )
+                 , 'rb' ) as file:
+            self.assertEqual( file.read(), b'x' * 1000 )
+
+    def test_index_uses_store_digest( self ):
+        from unittest import mock
+        from hashlib import sha1
+        dumper = self._getDumper( content_store=1, write_index=1 )
+        with mock.patch( 'Products.FSDump.Index._digestFile'
+                       , side_effect=AssertionError( 'hashed' ) ):
+            message = dumper.dumpToFS()
+        self.assertIn( ' 0 errors', message )
+        db = sqlite3.connect( os.path.join( self.fspath
+                                          , '.fsdump_index.sqlite' ) )
+        try:
+            rows = db.execute( 'SELECT filename FROM files WHERE sha1 = ?'
+                               ' ORDER BY filename'
+                             , ( sha1( b'x' * 1000 ).hexdigest(), ) )
+            self.assertEqual( [ row[ 0 ] for row in rows ]
+                            , [ 'site/f0/file', 'site/f1/file' ] )
+        finally:
+            db.close()
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,219 @@
+import os
+import time
+import unittest
+
+import transaction
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class ChangeWatcherTests( SiteTestBase ):
+
+    def _makeDB( self ):
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        return DB( FileStorage( os.path.join( self.tempdir, 'Data.fs' ) ) )
+
+    def _makeWatcher( self ):
+        from Acquisition import aq_base
+        from Products.FSDump.Watcher import ChangeWatcher
+        dumper = self._getDumper()
+        self.tm.commit()
+        watcher = ChangeWatcher( self.db
+                               , aq_base( self.app )._p_oid
+                               , dumper.getPhysicalPath()
+                               )
+        watcher._last_tid = self.db.lastTransaction()
+        watcher._dump( self.conn, None )
+        return watcher
+
+    def _commitElsewhere( self, change ):
+        #   Commit change( app ) from a second connection, firing no event.
+        tm = transaction.TransactionManager()
+        conn = self.db.open( tm )
+        try:
+            change( conn.root()[ 'Application' ] )
+            tm.commit()
+        finally:
+            conn.close()
+
+    def test_initial_dump( self ):
+        watcher = self._makeWatcher()
+        self.assertEqual( watcher.error, None )
+        self.assertTrue( os.path.exists( os.path.join( self.fspath, 'site'
+                                                     , 'f0', 'm.dtml' ) ) )
+
+    def test_edit_from_other_connection( self ):
+        watcher = self._makeWatcher()
+
+        def change( app ):
+            app.site.f0.m.manage_edit( 'changed', 'Method' )
+        self._commitElsewhere( change )
+
+        paths = watcher._readTransactions()
+        self.assertEqual( paths, set( [ ( '', 'site', 'f0', 'm' ) ] ) )
+        watcher._dump( self.conn, paths )
+        self.assertEqual( self._read( 'site', 'f0', 'm.dtml' ), 'changed\n' )
+
+    def test_btreefolder_add_from_other_connection( self ):
+        from OFS.DTMLMethod import addDTMLMethod
+        watcher = self._makeWatcher()
+
+        def change( app ):
+            addDTMLMethod( app.site.big, 'two', 'Two', 'two' )
+        self._commitElsewhere( change )
+
+        paths = watcher._readTransactions()
+        self.assertIn( ( '', 'site', 'big' ), paths )
+        watcher._dump( self.conn, paths )
+        self.assertEqual( watcher.error, None )
+        self.assertEqual( self._read( 'site', 'big', 'two.dtml' ), 'two\n' )
+        self.assertIn( 'two:DTML Method', self._read( 'site', 'big'
+                                                    , '.metadata' ) )
+
+    def test_btreefolder_delete_from_other_connection( self ):
+        watcher = self._makeWatcher()
+
+        def change( app ):
+            app.site.big._delObject( 'one' )
+        self._commitElsewhere( change )
+
+        paths = watcher._readTransactions()
+        self.assertIn( ( '', 'site', 'big' ), paths )
+        watcher._dump( self.conn, paths )
+        self.assertFalse( os.path.exists( os.path.join( self.fspath, 'site'
+                                                      , 'big', 'one.dtml' ) ) )
+
+    def test_catalog_record_from_other_connection( self ):
+        from Products.ZCatalog.ZCatalog import ZCatalog
+        self.app.site._setObject( 'catalog', ZCatalog( 'catalog' ) )
+        self.tm.commit()
+        watcher = self._makeWatcher()
+
+        def change( app ):
+            app.site.catalog.catalog_object( app.site.f0.m )
+        self._commitElsewhere( change )
+
+        paths = watcher._readTransactions()
+        self.assertIn( ( '', 'site', 'catalog' ), paths )
+        watcher._dump( self.conn, paths )
+        self.assertEqual( self._read( 'site', 'catalog.catalog' )
+                        , '/site/f0/m\n' )
+
+
+class StartWatchingTests( SiteTestBase ):
+
+    def _makeDB( self ):
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        return DB( FileStorage( os.path.join( self.tempdir, 'Data.fs' ) ) )
+
+    def tearDown( self ):
+        from zope.testing.cleanup import cleanUp
+        from Products.FSDump.Watcher import _stopped
+        from Products.FSDump.Watcher import _watchers
+        key = self.app.site.dumper._getJobKey()
+        watcher = _watchers.get( key )
+        if watcher is not None:
+            watcher.stop()
+            watcher.join( 30 )
+        _watchers.pop( key, None )
+        _stopped.pop( key, None )
+        cleanUp()
+        SiteTestBase.tearDown( self )
+
+    def _waitFor( self, condition ):
+        deadline = time.time() + 30
+        while not condition():
+            self.assertTrue( time.time() < deadline, 'timed out' )
+            time.sleep( 0.02 )
+
+    def test_watch_until_stopped( self ):
+        from unittest import mock
+        from Products.FSDump.Watcher import ChangeWatcher
+        from Products.FSDump.Watcher import getWatcher
+        dumper = self._getDumper()
+        self.assertEqual( dumper.getWatchStatus(), { 'state' : 'none' } )
+        with mock.patch.object( ChangeWatcher, 'interval', 0.05 ):
+            self.assertEqual( dumper.startWatching(), 'Watching started.' )
+            self.tm.commit()
+            watcher = getWatcher( dumper._getJobKey() )
+            self._waitFor( lambda: watcher.runs )
+            self.assertEqual( dumper.startWatching(), 'Already watching.' )
+            self.assertIn( 'site/f0/m.dtml', self._listFiles() )
+
+            self.app.site.f0.m.manage_edit( 'changed', 'Method' )
+            self.tm.commit()
+            self._waitFor( lambda: self._read( 'site', 'f0', 'm.dtml' )
+                                   == 'changed\n' )
+        self.assertEqual( dumper.getWatchStatus()[ 'state' ], 'running' )
+        self.assertEqual( dumper.stopWatching(), 'Watching stopped.' )
+        watcher.join( 30 )
+        self.assertEqual( dumper.getWatchStatus()[ 'state' ], 'stopped' )
+        self.assertEqual( dumper.stopWatching(), 'Not watching.' )
+
+    def test_handlers_dropped_when_stopped( self ):
+        from zope.component import getGlobalSiteManager
+        from Products.FSDump.Watcher import _handleModified
+        from Products.FSDump.Watcher import _watchers
+        from Products.FSDump.Watcher import getWatcher
+
+        def handlers():
+            return [ registration.handler for registration
+                     in getGlobalSiteManager().registeredHandlers() ]
+        dumper = self._getDumper()
+        dumper.startWatching()
+        self.tm.commit()
+        self.assertIn( _handleModified, handlers() )
+        watcher = getWatcher( dumper._getJobKey() )
+        dumper.stopWatching()
+        watcher.join( 30 )
+        self.assertEqual( _watchers, {} )
+        self.assertNotIn( _handleModified, handlers() )
+        self.assertTrue( getWatcher( dumper._getJobKey() ) is watcher )
+
+    def test_events_without_physical_path( self ):
+        from unittest import mock
+        from zope.lifecycleevent import ObjectModifiedEvent
+        from zope.lifecycleevent import ObjectMovedEvent
+        from OFS.SimpleItem import SimpleItem
+        from Products.FSDump.Watcher import _handleModified
+        from Products.FSDump.Watcher import _handleMoved
+        from Products.FSDump.Watcher import _watchers
+        from Products.FSDump.Watcher import ChangeWatcher
+        watcher = mock.Mock( spec=ChangeWatcher )
+        watcher.is_alive.return_value = True
+        key = self.app.site.dumper._getJobKey()
+        _watchers[ key ] = watcher
+        unwrapped = SimpleItem()
+        unwrapped.id = 'loose'
+        _handleModified( object(), ObjectModifiedEvent( object() ) )
+        _handleModified( unwrapped, ObjectModifiedEvent( unwrapped ) )
+        _handleMoved( unwrapped
+                    , ObjectMovedEvent( unwrapped, object(), 'a'
+                                      , self.app.site.f0, 'loose' ) )
+        transaction.commit()
+        watcher.queue.assert_called_once_with( { ( '', 'site', 'f0' )
+                                               , ( '', 'site', 'f0', 'loose' )
+                                               } )
+
+    def test_subscribers_after_cleanup( self ):
+        from zope.component import getGlobalSiteManager
+        from zope.testing.cleanup import cleanUp
+        from Products.FSDump.Watcher import _handleModified
+        from Products.FSDump.Watcher import getWatcher
+        dumper = self._getDumper()
+        dumper.startWatching()
+        self.tm.commit()
+        dumper.stopWatching()
+        getWatcher( dumper._getJobKey() ).join( 30 )
+        cleanUp()
+        dumper.startWatching()
+        self.tm.commit()
+        handlers = [ registration.handler for registration
+                     in getGlobalSiteManager().registeredHandlers() ]
+        self.assertIn( _handleModified, handlers )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,90 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+
+class RunBenchmarkTests( unittest.TestCase ):
+
+    def setUp( self ):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown( self ):
+        shutil.rmtree( self.tempdir )
+
+    def test_small_site_all_modes( self ):
+        from Products.FSDump.benchmark import MODES
+        from Products.FSDump.benchmark import _parseArgs
+        from Products.FSDump.benchmark import runBenchmark
+        options = _parseArgs( [ '--folders', '2', '--dtml', '4'
+                              , '--templates', '4', '--scripts', '4'
+                              , '--files', '2', '--file-size', '200000'
+                              , '--catalogs', '1', '--catalog-size', '5'
+                              , '-j', '2', '-o', self.tempdir ] )
+        out = io.StringIO()
+        runBenchmark( options, out )
+        lines = out.getvalue().splitlines()
+        self.assertTrue( lines[ 0 ].startswith( 'Built ' ) )
+        rows = [ line.split()[ 0 ] for line in lines
+                 if line and not line.startswith( ' ' ) ][ 1: ]
+        self.assertEqual( rows, [ 'mode' ] + list( MODES ) )
+        self.assertIn( 'DTML Method', out.getvalue() )
+        self.assertEqual( sorted( os.listdir( self.tempdir ) )
+                        , [ 'full', 'parallel' ] )
+        self.assertEqual( self._listFiles( 'full', 'site' )
+                        , self._listFiles( 'parallel', 'site' ) )
+        self.assertIn( 'folder0/catalog0.catalog'
+                     , self._listFiles( 'full', 'site' ) )
+        table = dict( [ ( line.split()[ 0 ], line.split() )
+                        for line in lines[ 3: ]
+                        if not line.startswith( ' ' ) ] )
+        self.assertTrue( float( table[ 'incremental' ][ 3 ] )
+                         < float( table[ 'full' ][ 3 ] ) / 100 )
+
+    def test_relative_fspath( self ):
+        from Products.FSDump.benchmark import _parseArgs
+        options = _parseArgs( [ '-o', 'bench' ] )
+        self.assertEqual( options.fspath, os.path.abspath( 'bench' ) )
+
+    def _listFiles( self, *names ):
+        root = os.path.join( self.tempdir, *names )
+        return sorted( [ os.path.relpath( os.path.join( dirname, filename )
+                                        , root )
+                         for dirname, subdirs, filenames in os.walk( root )
+                         for filename in filenames ] )
+
+
+class RSSSamplerTests( unittest.TestCase ):
+
+    def test_growth_over_baseline( self ):
+        from unittest import mock
+        from Products.FSDump.benchmark import RSSSampler
+        readings = [ 500.0, 520.0, 510.0 ]
+
+        def _currentRSS():
+            return readings and readings.pop( 0 ) or 505.0
+
+        with mock.patch( 'Products.FSDump.benchmark._currentRSS'
+                       , _currentRSS ):
+            sampler = RSSSampler()
+            sampler.interval = 0.001
+            sampler.start()
+            deadline = time.time() + 30
+            while readings and time.time() < deadline:
+                time.sleep( 0.001 )
+            self.assertEqual( sampler.stop(), 20.0 )
+
+    def test_no_proc( self ):
+        from unittest import mock
+        from Products.FSDump.benchmark import RSSSampler
+        with mock.patch( 'Products.FSDump.benchmark._currentRSS'
+                       , lambda: None ):
+            sampler = RSSSampler()
+            sampler.start()
+            self.assertEqual( sampler.stop(), None )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import os
+import unittest
+
+from Products.FSDump.tests.base import SiteTestBase
+
+
+class ScriptTestBase( SiteTestBase ):
+    """ Run the console scripts against a FileStorage holding the site.
+    """
+    def setUp( self ):
+        SiteTestBase.setUp( self )
+        self.conn.close()
+        self.db.close()
+        self._cwd = os.getcwd()
+        os.chdir( self.tempdir )
+
+    def tearDown( self ):
+        os.chdir( self._cwd )
+        SiteTestBase.tearDown( self )
+
+    def _makeDB( self ):
+        from ZODB.DB import DB
+        from ZODB.FileStorage import FileStorage
+        self.storage_path = os.path.join( self.tempdir, 'Data.fs' )
+        return DB( FileStorage( self.storage_path ) )
+
+    def _run( self, main, *args ):
+        #   Return the script's exit status and output.
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout( stdout ):
+            status = main( [ '-f', self.storage_path ] + list( args ) )
+        return status, stdout.getvalue()
+
+
+class DumpMainTests( ScriptTestBase ):
+
+    def _callFUT( self, *args ):
+        from Products.FSDump.scripts import dump_main
+        return self._run( dump_main, *args )
+
+    def test_relative_fspath( self ):
+        status, output = self._callFUT( '-p', '/site', '-o', 'out' )
+        self.assertFalse( status )
+        self.assertIn( 'to %s ' % self.fspath, output )
+        self.assertIn( os.path.join( 'site', 'f0', 'm.dtml' )
+                     , self._listFiles() )
+
+    def test_dump_folder_read_only( self ):
+        mtime = os.path.getmtime( self.storage_path )
+        size = os.path.getsize( self.storage_path )
+        status, output = self._callFUT( '-p', '/site/f0', '-o', self.fspath
+                                      , '-m' )
+        self.assertFalse( status )
+        self.assertEqual( self._listFiles()
+                        , [ 'f0/.metadata', 'f0/file', 'f0/file.metadata'
+                          , 'f0/m.dtml', 'f0/m.dtml.metadata'
+                          , 'f0/pt.pt', 'f0/pt.pt.metadata' ] )
+        self.assertEqual( os.path.getmtime( self.storage_path ), mtime )
+        self.assertEqual( os.path.getsize( self.storage_path ), size )
+
+    def test_diff_after_dump( self ):
+        self._callFUT( '-p', '/site', '-o', self.fspath )
+        status, output = self._callFUT( '-p', '/site', '-o', self.fspath
+                                      , '--diff' )
+        self.assertEqual( ( status, output ), ( 0, '' ) )
+        os.remove( os.path.join( self.fspath, 'site', 'f0', 'm.dtml' ) )
+        status, output = self._callFUT( '-p', '/site', '-o', self.fspath
+                                      , '--diff' )
+        self.assertEqual( ( status, output ), ( 1, 'A site/f0/m.dtml\n' ) )
+
+    def test_invalid_git_branch( self ):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr( stderr ):
+            with self.assertRaises( SystemExit ) as raised:
+                self._callFUT( '--git', 'site.git', '--git-branch', '../x' )
+        self.assertEqual( raised.exception.code, 2 )
+        self.assertIn( 'invalid git branch name', stderr.getvalue() )
+        self.assertFalse( os.path.exists( 'site.git' ) )
+
+
+class LoadMainTests( ScriptTestBase ):
+
+    def test_load_into_folder( self ):
+        from Products.FSDump.scripts import dump_main
+        from Products.FSDump.scripts import load_main
+        self._run( dump_main, '-p', '/site', '-o', self.fspath )
+        status, output = self._run( load_main, '-p', '/site/big', '-i'
+                                  , os.path.join( 'out', 'site', 'f0' ) )
+        self.assertFalse( status )
+        self.assertIn( '3 created, 0 existing, 0 skipped, 0 errors', output )
+        self._run( dump_main, '-p', '/site', '-o', self.fspath )
+        self.assertEqual( self._read( 'site', 'big', 'm.dtml' )
+                        , self._read( 'site', 'f0', 'm.dtml' ) )
+
+
+class SetFSPathTests( SiteTestBase ):
+
+    def test_relative_path_rejected( self ):
+        dumper = self.app.site.dumper
+        self.assertRaises( RuntimeError, dumper.edit, 'out', 1 )
+
+
+def test_suite():
+    return unittest.defaultTestLoader.loadTestsFromName( __name__ )